@@ -17,7 +17,22 @@ from models.cluster import Cluster
 from models.rental_gpu import RentalGPU
 from models.gpu_listing import GPUListing
 from models.transaction import Transaction
+from models.catalog import CatalogVersion, MarketStatsSnapshot
+from models.provisioning_job import ProvisioningJob
+from models.cluster_node_group import ClusterNodeGroup
+from models.idempotency_key import IdempotencyKey
+from models.user_spend_daily import UserSpendDaily
+from models.usage_accrual import UsageAccrual, BudgetAlert
+from models.rental_instance import RentalInstance
 from commands.fetch_gpu_data import fetch_gpu_data_command
+from commands.provisioning_worker import provisioning_worker_command
+from commands.reconcile_instances import reconcile_instances_command
+from commands.backfill_spend_rollup import backfill_spend_rollup_command
+from utils import (
+    api_auth, background, catalog_version, identity, idempotency, instance_reconciler,
+    launch_resources, metering, provisioning, rental_expiry, spend_rollup, termination,
+)
+from utils.pg_listener import get_listener, start_listener
 import os
 from firebase_admin import credentials
 import firebase_admin
@@ -43,6 +58,68 @@ logger.info(
 logger.info("DATABASE_URI: %s", os.getenv("DATABASE_URI"))
 
 
+def start_background(app):
+    """
+    Start the work that runs alongside request handling: the notification
+    listener, the periodic tasks and the provisioning pool. Only serving
+    processes call this (gunicorn's post_worker_init hook in
+    gunicorn_config.py); create_app doesn't, so CLI commands such as
+    `flask db upgrade` never charge users or sweep rentals, and never run
+    against a schema that hasn't been migrated yet.
+    """
+    # Listen for catalog version bumps (and other notifications) from the database
+    listener = get_listener(app.config["SQLALCHEMY_DATABASE_URI"])
+    if listener is not None:
+        catalog_version.register(app, listener)
+        identity.register(listener)
+        api_auth.register(listener)
+        provisioning.register(listener)
+        start_listener(app)
+
+    # Periodic work. Every worker schedules all of it; the reconciler, metering,
+    # termination confirmer and launch cleanup take an advisory lock so that one
+    # worker at a time runs each, and the rest are safe to run concurrently.
+    background.register_task(
+        "api_key_usage",
+        Config.API_KEY_USAGE_FLUSH_INTERVAL,
+        api_auth.flush_api_key_usage,
+        run_on_exit=True,
+    )
+    if Config.INSTANCE_RECONCILE_INTERVAL > 0:
+        background.register_task(
+            "instance_reconciler",
+            Config.INSTANCE_RECONCILE_INTERVAL,
+            instance_reconciler.reconcile,
+        )
+    if Config.RENTAL_EXPIRY_INTERVAL > 0:
+        background.register_task(
+            "rental_expiry", Config.RENTAL_EXPIRY_INTERVAL, rental_expiry.expire_rentals
+        )
+    if Config.METERING_INTERVAL > 0:
+        background.register_task("metering", Config.METERING_INTERVAL, metering.accrue)
+    if Config.TERMINATION_CONFIRM_INTERVAL > 0:
+        background.register_task(
+            "termination_confirmer",
+            Config.TERMINATION_CONFIRM_INTERVAL,
+            termination.confirm_terminations,
+        )
+    if Config.IDEMPOTENCY_KEY_PURGE_INTERVAL > 0:
+        background.register_task(
+            "idempotency_key_purge",
+            Config.IDEMPOTENCY_KEY_PURGE_INTERVAL,
+            idempotency.purge_expired,
+        )
+    if Config.LAUNCH_CLEANUP_INTERVAL > 0:
+        background.register_task(
+            "launch_cleanup", Config.LAUNCH_CLEANUP_INTERVAL, launch_resources.cleanup_orphans
+        )
+    background.start_tasks(app)
+
+    # Provisioning jobs can also run in dedicated `flask provisioning-worker` processes
+    if Config.PROVISIONING_IN_APP:
+        provisioning.start_pool(app)
+
+
 def create_app(environ=None, start_response=None):
     """Create and configure the Flask application"""
     app = Flask(__name__, instance_relative_config=True)
@@ -126,6 +203,9 @@ def create_app(environ=None, start_response=None):
 
     # Register CLI commands
     app.cli.add_command(fetch_gpu_data_command)
+    app.cli.add_command(provisioning_worker_command)
+    app.cli.add_command(reconcile_instances_command)
+    app.cli.add_command(backfill_spend_rollup_command)
 
     # Add CORS headers to all responses
     @app.after_request
@@ -155,6 +235,7 @@ def create_app(environ=None, start_response=None):
 
 if __name__ == "__main__":
     app = create_app()
+    start_background(app)
     app.run(debug=True, host="0.0.0.0")
 
 
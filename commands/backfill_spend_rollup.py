@@ -0,0 +1,15 @@
+from flask.cli import with_appcontext
+import click
+from utils.spend_rollup import backfill
+
+@click.command('backfill-spend-rollup')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s rows')
+@with_appcontext
+def backfill_spend_rollup_command(user_id):
+    """Rebuild the daily spending rollup from transactions"""
+    try:
+        rows = backfill(user_id=user_id)
+        click.echo(f'Wrote {rows} spending rollup rows')
+    except Exception as e:
+        click.echo(f'Error rebuilding spending rollup: {str(e)}', err=True)
+        raise
@@ -0,0 +1,26 @@
+from flask import current_app
+from flask.cli import with_appcontext
+import click
+import time
+from utils.provisioning import ProvisioningPool
+from config import Config
+
+@click.command('provisioning-worker')
+@click.option('--workers', default=Config.PROVISIONING_WORKERS, show_default=True,
+              help='Number of jobs to run at once')
+@with_appcontext
+def provisioning_worker_command(workers):
+    """Run GPU provisioning jobs until interrupted"""
+    pool = ProvisioningPool(
+        current_app._get_current_object(),
+        workers=workers,
+        poll_interval=Config.PROVISIONING_POLL_INTERVAL,
+    )
+    pool.start()
+    click.echo(f'Provisioning worker started with {workers} threads')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo('Stopping provisioning worker')
+        pool.stop(timeout=30)
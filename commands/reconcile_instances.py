@@ -0,0 +1,20 @@
+from flask.cli import with_appcontext
+import click
+from utils.instance_reconciler import reconcile
+
+@click.command('reconcile-instances')
+@with_appcontext
+def reconcile_instances_command():
+    """Refresh the cached EC2 instance state once"""
+    try:
+        summary = reconcile()
+        if summary is None:
+            click.echo('Another worker is reconciling; skipped')
+            return
+        click.echo(
+            f"Reconciled {summary['instances']} instances "
+            f"({summary['vanished']} vanished, {summary['rentals_ended']} rentals ended)"
+        )
+    except Exception as e:
+        click.echo(f'Error reconciling instances: {str(e)}', err=True)
+        raise
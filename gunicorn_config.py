@@ -1,7 +1,17 @@
 import multiprocessing
 
+from config import Config
+
 workers = multiprocessing.cpu_count() * 2 + 1
 bind = "0.0.0.0:7000"  # Listen on all interfaces
 timeout = 120
 accesslog = '-'  # Log to stdout for debugging
-errorlog = '-'   # Log to stderr for debugging
\ No newline at end of file
+errorlog = '-'   # Log to stderr for debugging
+
+
+def post_worker_init(worker):
+    """Start background work once the worker has loaded the app (app.start_background)"""
+    if Config.RUN_BACKGROUND_TASKS:
+        from app import start_background
+
+        start_background(worker.wsgi)
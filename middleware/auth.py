@@ -5,6 +5,28 @@ from datetime import datetime
 
 from models.user import User
 from utils.database import db
+from utils.token_verifier import verify_id_token
+from utils import identity
+
+
+def get_current_user(fresh=False):
+    """
+    The signed-in user (g.user_id), resolved once per request and cached as
+    g.current_user. Pass fresh=True before read-modify-write on the user.
+    """
+    if not fresh and "current_user" in g:
+        return g.current_user
+    firebase_uid = g.user_id
+
+    def load():
+        query = User.query.filter_by(firebase_uid=firebase_uid)
+        if fresh:
+            # Overwrite a copy already in the session, which may be cached
+            query = query.populate_existing()
+        return query.first()
+
+    g.current_user = identity.get_user(firebase_uid, load, fresh=fresh)
+    return g.current_user
 
 def auth_required(pass_user=True):
     def decorator(f):
@@ -19,16 +41,13 @@ def auth_required(pass_user=True):
 
             try:
                 token = auth_header.split(" ")[1]
-                decoded_token = auth.verify_id_token(token)
+                decoded_token = verify_id_token(token)
                 
-                # Get user from database
-                user = User.query.filter_by(firebase_uid=decoded_token["uid"]).first()
-                if not user:
-                    return jsonify({"error": "User not found"}), 404
-
                 # Set both g.user_id and g.current_user
                 g.user_id = decoded_token["uid"]
-                g.current_user = user
+                user = get_current_user()
+                if not user:
+                    return jsonify({"error": "User not found"}), 404
                 
                 # Only pass current_user if requested
                 if pass_user:
@@ -65,8 +84,8 @@ def require_auth():
             try:
                 # Remove 'Bearer ' from token
                 id_token = auth_header.split(" ")[1]
-                # Verify the token with revocation check
-                decoded_token = auth.verify_id_token(id_token, check_revoked=True)
+                # Verify the token locally; revocation state is rechecked periodically
+                decoded_token = verify_id_token(id_token, check_revoked=True)
                 
                 # Check if token is expired
                 if 'exp' in decoded_token:
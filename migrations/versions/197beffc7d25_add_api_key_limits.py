@@ -0,0 +1,32 @@
+"""Add per-key rate limits and daily quotas to api_keys
+
+Revision ID: 197beffc7d25
+Revises: e17e2e8f6b8d
+Create Date: 2026-10-19 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '197beffc7d25'
+down_revision = 'e17e2e8f6b8d'
+branch_labels = None
+depends_on = None
+
+# NULL falls back to the RATE_LIMIT_KEY_* / API_KEY_DAILY_QUOTA settings
+LIMIT_COLUMNS = ('rate_limit_per_minute', 'rate_limit_burst', 'daily_quota')
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('api_keys')}
+    for name in LIMIT_COLUMNS:
+        if name not in columns:
+            op.add_column('api_keys', sa.Column(name, sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('api_keys') as batch_op:
+        for name in reversed(LIMIT_COLUMNS):
+            batch_op.drop_column(name)
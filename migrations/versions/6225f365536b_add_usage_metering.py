@@ -0,0 +1,79 @@
+"""Add usage metering: accrued totals on rental_gpus, usage_accruals and budget_alerts
+
+Revision ID: 6225f365536b
+Revises: cc664be2c709
+Create Date: 2026-10-19 07:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6225f365536b'
+down_revision = 'cc664be2c709'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() at startup may already have created the new tables,
+    # but never adds columns to an existing one
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    rental_columns = {column['name'] for column in inspector.get_columns('rental_gpus')}
+    if 'accrued_until' not in rental_columns:
+        op.add_column('rental_gpus', sa.Column('accrued_until', sa.DateTime(), nullable=True))
+    if 'accrued_amount' not in rental_columns:
+        op.add_column('rental_gpus', sa.Column(
+            'accrued_amount', sa.Float(), nullable=False, server_default='0'
+        ))
+
+    if 'usage_accruals' not in tables:
+        op.create_table(
+            'usage_accruals',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('rental_gpu_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('period_start', sa.DateTime(), nullable=False),
+            sa.Column('period_end', sa.DateTime(), nullable=False),
+            sa.Column('seconds', sa.Float(), nullable=False),
+            sa.Column('hourly_rate', sa.Float(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.Column('charged', sa.Float(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['rental_gpu_id'], ['rental_gpus.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_usage_accruals_rental_gpu_id', 'usage_accruals', ['rental_gpu_id'])
+        op.create_index(
+            'ix_usage_accruals_user_id_period_end', 'usage_accruals', ['user_id', 'period_end']
+        )
+
+    if 'budget_alerts' not in tables:
+        op.create_table(
+            'budget_alerts',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('threshold', sa.Integer(), nullable=False),
+            sa.Column('spent', sa.Float(), nullable=False),
+            sa.Column('triggered_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint(
+                'user_id', 'month', 'threshold', name='uq_budget_alerts_user_month_threshold'
+            ),
+        )
+
+
+def downgrade():
+    op.drop_table('budget_alerts')
+    op.drop_index('ix_usage_accruals_user_id_period_end', table_name='usage_accruals')
+    op.drop_index('ix_usage_accruals_rental_gpu_id', table_name='usage_accruals')
+    op.drop_table('usage_accruals')
+    with op.batch_alter_table('rental_gpus') as batch_op:
+        batch_op.drop_column('accrued_amount')
+        batch_op.drop_column('accrued_until')
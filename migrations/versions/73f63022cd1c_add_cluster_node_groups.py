@@ -0,0 +1,60 @@
+"""Add multi-node deployments: cluster_node_groups and the node columns on rental_gpus
+
+Revision ID: 73f63022cd1c
+Revises: 6225f365536b
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '73f63022cd1c'
+down_revision = '6225f365536b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() at startup may already have created the new table,
+    # but never adds columns to an existing one
+    inspector = sa.inspect(op.get_bind())
+
+    if 'cluster_node_groups' not in inspector.get_table_names():
+        op.create_table(
+            'cluster_node_groups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cluster_id', sa.Integer(), nullable=False),
+            sa.Column('gpu_listing_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('node_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['cluster_id'], ['clusters.id']),
+            sa.ForeignKeyConstraint(['gpu_listing_id'], ['gpu_listings.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_cluster_node_groups_cluster_id', 'cluster_node_groups', ['cluster_id'])
+
+    rental_columns = {column['name'] for column in inspector.get_columns('rental_gpus')}
+    if 'node_group_id' not in rental_columns:
+        # Batch mode, so SQLite (which can't add a foreign key in place) copies the table
+        with op.batch_alter_table('rental_gpus') as batch_op:
+            batch_op.add_column(sa.Column('node_group_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(
+                'fk_rental_gpus_node_group_id', 'cluster_node_groups', ['node_group_id'], ['id']
+            )
+            batch_op.create_index('ix_rental_gpus_node_group_id', ['node_group_id'])
+    if 'node_index' not in rental_columns:
+        op.add_column('rental_gpus', sa.Column('node_index', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    # Dropping the column drops its foreign key, whatever create_all named it
+    with op.batch_alter_table('rental_gpus') as batch_op:
+        batch_op.drop_index('ix_rental_gpus_node_group_id')
+        batch_op.drop_column('node_index')
+        batch_op.drop_column('node_group_id')
+    op.drop_index('ix_cluster_node_groups_cluster_id', table_name='cluster_node_groups')
+    op.drop_table('cluster_node_groups')
@@ -0,0 +1,56 @@
+"""Add the transactions indexes read by per-user history and spending reports
+
+Revision ID: cc664be2c709
+Revises: 
+Create Date: 2026-10-19 07:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc664be2c709'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY doesn't block writes to transactions, but can't
+    # run inside a transaction. IF NOT EXISTS covers databases where
+    # db.create_all() created the table, and so its indexes, already.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_id_created_at',
+            'transactions',
+            ['user_id', 'created_at'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_transactions_debits_user_id_created_at',
+            'transactions',
+            ['user_id', 'created_at'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=sa.text('amount < 0'),
+            postgresql_include=['amount', 'description'],
+            sqlite_where=sa.text('amount < 0'),
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_transactions_debits_user_id_created_at',
+            table_name='transactions',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_transactions_user_id_created_at',
+            table_name='transactions',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
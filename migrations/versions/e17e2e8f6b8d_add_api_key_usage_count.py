@@ -0,0 +1,30 @@
+"""Add api_keys.usage_count, written in batches by the API key usage buffer
+
+Revision ID: e17e2e8f6b8d
+Revises: 73f63022cd1c
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e17e2e8f6b8d'
+down_revision = '73f63022cd1c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('api_keys')}
+    if 'usage_count' not in columns:
+        # The server default fills existing keys, and lets the column be NOT NULL
+        op.add_column('api_keys', sa.Column(
+            'usage_count', sa.BigInteger(), nullable=False, server_default='0'
+        ))
+
+
+def downgrade():
+    with op.batch_alter_table('api_keys') as batch_op:
+        batch_op.drop_column('usage_count')
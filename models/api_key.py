@@ -16,7 +16,12 @@ class APIKey(db.Model):
     permission = db.Column(db.String(20), nullable=False, default=APIKeyPermission.READ.value)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     last_used_at = db.Column(db.DateTime, nullable=True)
+    usage_count = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
     is_active = db.Column(db.Boolean, default=True)
+    # Per-key limits; NULL falls back to the RATE_LIMIT_KEY_* / API_KEY_DAILY_QUOTA settings
+    rate_limit_per_minute = db.Column(db.Integer, nullable=True)
+    rate_limit_burst = db.Column(db.Integer, nullable=True)
+    daily_quota = db.Column(db.Integer, nullable=True)  # 0 = unlimited
     
     def __init__(self, key, name, permission=APIKeyPermission.READ):
         self.key = key
@@ -31,5 +36,9 @@ class APIKey(db.Model):
             'permission': self.permission,
             'created_at': self.created_at.isoformat(),
             'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'usage_count': self.usage_count or 0,
+            'rate_limit_per_minute': self.rate_limit_per_minute,
+            'rate_limit_burst': self.rate_limit_burst,
+            'daily_quota': self.daily_quota,
             'is_active': self.is_active
         }
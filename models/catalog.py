@@ -0,0 +1,65 @@
+from utils.database import db
+from datetime import datetime, timezone
+
+
+class CatalogVersion(db.Model):
+    """A monotonically increasing version of the GPU catalog, bumped by each ingest run"""
+
+    __tablename__ = "catalog_versions"
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)  # The version number itself
+    created_at = db.Column(
+        db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    offer_count = db.Column(db.Integer, nullable=False, default=0)
+    provider_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Relationships
+    market_stats = db.relationship(
+        "MarketStatsSnapshot", backref="catalog_version", uselist=False
+    )
+
+    def to_dict(self):
+        return {
+            "version": self.id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "offer_count": self.offer_count,
+            "provider_count": self.provider_count,
+        }
+
+
+class MarketStatsSnapshot(db.Model):
+    """Market statistics pre-aggregated at ingest time, one row per catalog version"""
+
+    __tablename__ = "market_stats_snapshots"
+    __table_args__ = {"extend_existing": True}
+
+    catalog_version_id = db.Column(
+        db.Integer, db.ForeignKey("catalog_versions.id"), primary_key=True
+    )
+    created_at = db.Column(
+        db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    total_gpus = db.Column(db.Integer, nullable=False, default=0)
+    total_listings = db.Column(db.Integer, nullable=False, default=0)
+    avg_price = db.Column(db.Float, nullable=True)
+    median_price = db.Column(db.Float, nullable=True)
+    # Full breakdown: price stats overall and per vendor/provider/model, spot discounts
+    stats = db.Column(db.JSON, nullable=False)
+
+    @classmethod
+    def latest(cls):
+        """Most recent snapshot, a single primary-key ordered lookup"""
+        return cls.query.order_by(cls.catalog_version_id.desc()).first()
+
+    def to_dict(self):
+        return {
+            "catalog_version": self.catalog_version_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "total_gpus": self.total_gpus,
+            "total_listings": self.total_listings,
+            "avg_price": self.avg_price,
+            "median_price": self.median_price,
+            **self.stats,
+        }
@@ -1,8 +1,11 @@
 from utils.database import db
 from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload, selectinload
 from models.gpu_listing import GPUListing
 from models.user import User
 from models.rental_gpu import RentalGPU
+from models.cluster_node_group import ClusterNodeGroup
 from datetime import timedelta
 
 
@@ -32,24 +35,140 @@ class Cluster(db.Model):
         cascade="all, delete-orphan",
     )
 
+    # Multi-node deployments, each a set of rentals in rental_history
+    node_groups = db.relationship(
+        "ClusterNodeGroup",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+        order_by="ClusterNodeGroup.created_at.desc()",
+    )
+
+    @staticmethod
+    def _active_filter(now=None):
+        now = now or datetime.utcnow()
+        return db.and_(
+            RentalGPU.status == "active",
+            db.or_(RentalGPU.end_time.is_(None), RentalGPU.end_time > now),
+        )
+
     @property
     def active_rental(self):
         """Get the currently active GPU rental for this cluster, if any"""
-        now = datetime.utcnow()
-        return self.rental_history.filter(
-            db.and_(
-                RentalGPU.status == "active",
-                db.or_(RentalGPU.end_time.is_(None), RentalGPU.end_time > now),
+        return self.rental_history.filter(self._active_filter()).first()
+
+    @property
+    def active_nodes(self):
+        """Every active rental of this cluster, in node order"""
+        return self._active_nodes_query().all()
+
+    def lock_active_nodes(self):
+        """
+        active_nodes, reloaded and locked until the transaction ends, so the
+        metering tick (utils/metering.py) can't accrue them meanwhile
+        """
+        return self._active_nodes_query().with_for_update().populate_existing().all()
+
+    def _active_nodes_query(self):
+        return self.rental_history.filter(self._active_filter()).order_by(
+            RentalGPU.node_index, RentalGPU.id
+        )
+
+    @classmethod
+    def for_user(cls, user_id):
+        """Query for a user's clusters with their current GPU, its configuration and host"""
+        return cls.query.filter_by(user_id=user_id).options(
+            selectinload(cls.current_gpu).joinedload(GPUListing.configuration),
+            selectinload(cls.current_gpu).joinedload(GPUListing.host),
+        )
+
+    @staticmethod
+    def rentals_with_listing(query):
+        """Eager-load the listing, configuration and host that RentalGPU.to_dict reads"""
+        return query.options(
+            joinedload(RentalGPU.gpu_listing).joinedload(GPUListing.configuration),
+            joinedload(RentalGPU.gpu_listing).joinedload(GPUListing.host),
+        )
+
+    @classmethod
+    def active_rentals(cls, cluster_ids):
+        """Map of cluster id to its active rental, in one query"""
+        if not cluster_ids:
+            return {}
+        rentals = cls.rentals_with_listing(RentalGPU.query).filter(
+            RentalGPU.cluster_id.in_(cluster_ids), cls._active_filter()
+        ).order_by(RentalGPU.start_time.desc())
+        active = {}
+        for rental in rentals:
+            active.setdefault(rental.cluster_id, rental)
+        return active
+
+    @classmethod
+    def history_summaries(cls, cluster_ids):
+        """Map of cluster id to a summary of its rental history, in one grouped query"""
+        summaries = {
+            cluster_id: {"total": 0, "active": 0, "last_start_time": None, "last_end_time": None}
+            for cluster_id in cluster_ids
+        }
+        if not cluster_ids:
+            return summaries
+        rows = db.session.query(
+            RentalGPU.cluster_id,
+            func.count(RentalGPU.id),
+            func.sum(case((cls._active_filter(), 1), else_=0)),
+            func.max(RentalGPU.start_time),
+            func.max(RentalGPU.end_time),
+        ).filter(RentalGPU.cluster_id.in_(cluster_ids)).group_by(RentalGPU.cluster_id)
+        for cluster_id, total, active, last_start, last_end in rows:
+            summaries[cluster_id] = {
+                "total": total,
+                "active": int(active or 0),
+                "last_start_time": _format_time(last_start),
+                "last_end_time": _format_time(last_end),
+            }
+        return summaries
+
+    @classmethod
+    def latest_node_groups(cls, cluster_ids):
+        """Map of cluster id to its most recent node group with its nodes loaded, in two queries"""
+        if not cluster_ids:
+            return {}
+        groups = ClusterNodeGroup.query.filter(
+            ClusterNodeGroup.cluster_id.in_(cluster_ids)
+        ).options(selectinload(ClusterNodeGroup.nodes)).order_by(
+            ClusterNodeGroup.created_at.desc(), ClusterNodeGroup.id.desc()
+        )
+        latest = {}
+        for group in groups:
+            latest.setdefault(group.cluster_id, group)
+        return latest
+
+    @classmethod
+    def serialize_many(cls, clusters):
+        """
+        Serialize clusters in a constant number of queries. Load them with
+        for_user() so current_gpu is already in the session.
+        """
+        ids = [cluster.id for cluster in clusters]
+        active = cls.active_rentals(ids)
+        summaries = cls.history_summaries(ids)
+        node_groups = cls.latest_node_groups(ids)
+        return [
+            cluster._serialize(
+                active.get(cluster.id), summaries[cluster.id], node_groups.get(cluster.id)
             )
-        ).first()
+            for cluster in clusters
+        ]
 
-    def deploy_current_gpu(self, ssh_keys=None, email_enabled=True, config=None):
+    def deploy_current_gpu(self, ssh_keys=None, email_enabled=True, config=None,
+                           node_group=None, node_index=None):
         """Deploy the current GPU, converting it to a rental
         
         Args:
             ssh_keys: Optional SSH keys to use for the deployment
             email_enabled: Whether to send email notifications
             config: Additional configuration options
+            node_group: ClusterNodeGroup the rental is a node of, if any
+            node_index: Position of the node in its group
         """
 
         if not self.current_gpu:
@@ -85,6 +204,8 @@ class Cluster(db.Model):
             configuration=base_config,
             ssh_keys=ssh_keys or [],
             email_enabled=email_enabled,
+            node_group_id=node_group.id if node_group is not None else None,
+            node_index=node_index,
         )
 
         rental_gpu.status = "active"
@@ -101,13 +222,14 @@ class Cluster(db.Model):
         return rental_gpu
 
     def to_dict(self):
-        """Convert cluster to dictionary representation"""
-        active_rental = self.active_rental
+        """
+        Convert cluster to dictionary representation. The rental history is
+        summarized; GET /api/clusters/<id>/history pages through it.
+        """
+        return self.serialize_many([self])[0]
+
+    def _serialize(self, active_rental, history_summary, node_group=None):
         current_gpu = self.current_gpu.to_dict() if self.current_gpu else None
-        rental_history = [
-            rental.to_dict()
-            for rental in self.rental_history.order_by(RentalGPU.start_time.desc())
-        ]
 
         return {
             "id": self.id,
@@ -118,5 +240,11 @@ class Cluster(db.Model):
             "user_id": self.user_id,
             "current_gpu": current_gpu,
             "rental_gpu": active_rental.to_dict() if active_rental else None,
-            "rental_history": rental_history,
+            "rental_history_summary": history_summary,
+            "node_group": node_group.summary() if node_group else None,
         }
+
+
+def _format_time(value):
+    # Same format as RentalGPU.to_dict
+    return value.strftime("%Y-%m-%dT%H:%M:%S+00:00") if value else None
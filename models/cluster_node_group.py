@@ -0,0 +1,62 @@
+from utils.database import db
+from datetime import datetime
+
+
+class ClusterNodeGroup(db.Model):
+    """
+    A multi-node deployment of one listing: node_count rentals deployed
+    together, each with its own instance, provisioning job and billing.
+    """
+
+    __tablename__ = "cluster_node_groups"
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    cluster_id = db.Column(db.Integer, db.ForeignKey("clusters.id"), nullable=False, index=True)
+    gpu_listing_id = db.Column(db.Integer, db.ForeignKey("gpu_listings.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    node_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    nodes = db.relationship(
+        "RentalGPU", back_populates="node_group", order_by="RentalGPU.node_index"
+    )
+    gpu_listing = db.relationship("GPUListing")
+
+    def status(self, now=None):
+        """
+        One status for the whole group: provisioning until every node has
+        finished provisioning, then active, degraded (some nodes failed or
+        stopped), completed or failed.
+        """
+        statuses = {node.current_status(now) for node in self.nodes}
+        if not statuses:
+            return "pending"
+        if statuses & {"pending", "provisioning"}:
+            return "provisioning"
+        if statuses == {"active"}:
+            return "active"
+        if "active" in statuses:
+            return "degraded"
+        return "failed" if statuses == {"failed"} else "completed"
+
+    def summary(self, now=None):
+        """Aggregate status and per-status node counts, from the loaded nodes only"""
+        counts = {}
+        for node in self.nodes:
+            status = node.current_status(now)
+            counts[status] = counts.get(status, 0) + 1
+        return {
+            "id": self.id,
+            "gpu_listing_id": self.gpu_listing_id,
+            "node_count": self.node_count,
+            "status": self.status(now),
+            "nodes_by_status": counts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "nodes": [node.to_dict() for node in self.nodes],
+        }
@@ -0,0 +1,32 @@
+from utils.database import db
+from datetime import datetime
+
+
+class IdempotencyKey(db.Model):
+    """
+    A request made with an Idempotency-Key header and the response it got,
+    replayed for retries of the same request (utils/idempotency.py).
+    """
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        db.Index("ix_idempotency_keys_created_at", "created_at"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # Method, path and body hash; a retry must match the original request
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # NULL until the first request finishes
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.JSON, nullable=True)
+    location = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_complete(self):
+        return self.status_code is not None
@@ -0,0 +1,68 @@
+from utils.database import db
+from datetime import datetime
+
+
+class ProvisioningJob(db.Model):
+    """A queued request to bring up the instance for a rental, run by utils/provisioning.py"""
+
+    __tablename__ = "provisioning_jobs"
+    __table_args__ = (
+        db.Index("ix_provisioning_jobs_status_created_at", "status", "created_at"),
+        {"extend_existing": True},
+    )
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    PENDING_STATUSES = (QUEUED, RUNNING)
+
+    id = db.Column(db.Integer, primary_key=True)
+    rental_gpu_id = db.Column(db.Integer, db.ForeignKey("rental_gpus.id"), nullable=False)
+    cluster_id = db.Column(db.Integer, db.ForeignKey("clusters.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    # Charge taken at enqueue time; refunded if the job fails
+    transaction_id = db.Column(db.Integer, db.ForeignKey("transactions.id"), nullable=True)
+
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    # Last step reached, for status polling: queued, launching, running, failed
+    step = db.Column(db.String(50), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+
+    # Which worker holds the job and since when; stale claims are taken over
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    rental_gpu = db.relationship("RentalGPU")
+
+    @property
+    def is_pending(self):
+        return self.status in self.PENDING_STATUSES
+
+    @classmethod
+    def pending_for_cluster(cls, cluster_id):
+        return cls.query.filter(
+            cls.cluster_id == cluster_id, cls.status.in_(cls.PENDING_STATUSES)
+        ).first()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "rental_gpu_id": self.rental_gpu_id,
+            "cluster_id": self.cluster_id,
+            "status": self.status,
+            "step": self.step,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -3,7 +3,6 @@ from datetime import datetime
 from sqlalchemy.dialects.postgresql import JSON
 from utils.aws_utils import AWSManager
 from typing import Dict
-import time
 
 
 class RentalGPU(db.Model):
@@ -18,6 +17,11 @@ class RentalGPU(db.Model):
         db.Integer, db.ForeignKey("gpu_listings.id"), nullable=False
     )
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    # Set for the nodes of a multi-node deployment (models/cluster_node_group.py)
+    node_group_id = db.Column(
+        db.Integer, db.ForeignKey("cluster_node_groups.id"), nullable=True, index=True
+    )
+    node_index = db.Column(db.Integer, nullable=True)
 
     # Configuration and status
     configuration = db.Column(JSON, nullable=False)
@@ -37,10 +41,14 @@ class RentalGPU(db.Model):
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
     price = db.Column(db.Float, nullable=False)
+    # Usage cost accrued by the metering tick (utils/metering.py), and up to when
+    accrued_until = db.Column(db.DateTime, nullable=True)
+    accrued_amount = db.Column(db.Float, nullable=False, default=0.0)
     # Relationships
     cluster = db.relationship("Cluster", back_populates="rental_history")
     gpu_listing = db.relationship("GPUListing")
     user = db.relationship("User", back_populates="rental_gpus", lazy=True)
+    node_group = db.relationship("ClusterNodeGroup", back_populates="nodes")
 
     def __init__(
         self,
@@ -53,6 +61,8 @@ class RentalGPU(db.Model):
         email_enabled=True,
         instance_id=None,
         instance_details=None,
+        node_group_id=None,
+        node_index=None,
     ):
         self.cluster_id = cluster_id
         self.gpu_listing_id = gpu_listing_id
@@ -63,13 +73,18 @@ class RentalGPU(db.Model):
         self.email_enabled = email_enabled
         self.instance_id = instance_id
         self.instance_details = instance_details
+        self.node_group_id = node_group_id
+        self.node_index = node_index
 
-    def update_status(self):
-        """Update the rental status based on current time"""
-        now = datetime.utcnow()
-        if self.end_time and now > self.end_time:
-            self.status = "completed"
-            db.session.commit()
+    def current_status(self, now=None):
+        """
+        Status as of now, without writing anything. An active rental past its
+        end time reads as completed until the expiry sweeper
+        (utils/rental_expiry.py) stores that.
+        """
+        now = now or datetime.utcnow()
+        if self.status == "active" and self.end_time and now > self.end_time:
+            return "completed"
         return self.status
 
     def to_dict(self):
@@ -100,10 +115,12 @@ class RentalGPU(db.Model):
         return {
             "id": self.id,
             "cluster_id": self.cluster_id,
+            "node_group_id": self.node_group_id,
+            "node_index": self.node_index,
             "gpu_listing_id": self.gpu_listing_id,
             "user_id": self.user_id,
             "configuration": self.configuration,
-            "status": self.update_status(),  # Get current status
+            "status": self.current_status(),
             "ssh_keys": self.ssh_keys,
             "email_enabled": self.email_enabled,
             "start_time": start_time,
@@ -116,6 +133,7 @@ class RentalGPU(db.Model):
             "gpu_memory": gpu_config.gpu_memory if gpu_config else None,
             "gpu_count": gpu_config.gpu_count if gpu_config else None,
             "price": self.price,
+            "accrued_amount": self.accrued_amount or 0.0,
             "provider": gpu.host.name if gpu and gpu.host else None,
             "instance_id": self.instance_id,
             "instance_details": self.instance_details,
@@ -128,83 +146,96 @@ class RentalGPU(db.Model):
         # A rental is active if status is 'active' and it has a start time
         return self.status == "active" and self.start_time is not None
 
+    @property
+    def region(self):
+        """Region the instance was launched in; None means the default region."""
+        return (self.instance_details or {}).get("region")
+
+    def ensure_ssh_key(self):
+        """
+        (private_key, public_key) for this rental's instance, generated and
+        stored on first use so that a retried launch installs the same key.
+        """
+        if self.ssh_keys and self.ssh_keys[0].get('public_key'):
+            key = self.ssh_keys[0]
+            return key['private_key'], key['public_key']
+        from utils.launch_resources import generate_ssh_key
+        private_key, public_key = generate_ssh_key()
+        self.ssh_keys = [{'private_key': private_key, 'public_key': public_key}]
+        return private_key, public_key
+
     def deploy_aws_instance(self):
-        """Deploy an AWS instance during cluster deployment."""
+        """
+        Deploy an AWS instance during cluster deployment and store its details
+        with the SSH key; the caller commits. The launch is idempotent per
+        rental, so a retry after a worker died mid-launch gets the instance
+        that worker started rather than a second one.
+        """
         from utils.aws_utils import AWSManager
 
         aws = AWSManager()
-        
-        # Generate a unique key name for this rental
-        key_name = f"neotix-{self.id}-{int(time.time())}"
-
-        try:
-            print(f"Starting AWS instance provisioning for rental: {self.id}")
-            print(f"Configuration: {self.configuration}")
-            print(f"GPU Listing: {self.gpu_listing.to_dict() if self.gpu_listing else None}")
-
-            # Create key pair first
-            key_pair = aws.create_key_pair(key_name)
-            private_key = key_pair['KeyMaterial']
-
-            # Launch instance
-            instance_id, instance_details = aws.launch_gpu_instance(
-                gpu_config=self.configuration,
-                key_name=key_name,
-            )
-
-            # Store SSH key and instance details
-            self.ssh_keys = [{
-                'private_key': private_key,
-                'instance_id': instance_id,
-                'instance_ip': instance_details['instance_ip'],
-                'instance_dns': instance_details['instance_dns'],
-                'instance_type': instance_details['instance_type']
-            }]
-            db.session.commit()
-
-            return instance_details
-
-        except Exception as e:
-            print(f"Error provisioning AWS instance: {str(e)}")
-            # Clean up key pair if it was created
-            if 'key_pair' in locals():
-                aws.delete_key_pair(key_name)
-            raise
+
+        print(f"Starting AWS instance provisioning for rental: {self.id}")
+        print(f"Configuration: {self.configuration}")
+
+        # A key of its own for this rental, installed by cloud-init; no EC2 key pair
+        private_key, public_key = self.ensure_ssh_key()
+
+        # Launch instance
+        instance_id, instance_details = aws.launch_gpu_instance(
+            gpu_config=self.configuration,
+            ssh_public_key=public_key,
+            tags={AWSManager.RENTAL_TAG: self.id},
+            client_token=f"neotix-rental-{self.id}",
+        )
+
+        # Store SSH key and instance details
+        self.ssh_keys = [{
+            'private_key': private_key,
+            'public_key': public_key,
+            'instance_id': instance_id,
+            'instance_ip': instance_details['instance_ip'],
+            'instance_dns': instance_details['instance_dns'],
+            'instance_type': instance_details['instance_type']
+        }]
+
+        return instance_details
 
     def get_ssh_key(self):
         """Get SSH key and connection details for an existing instance."""
         if not self.ssh_keys or len(self.ssh_keys) == 0:
             raise Exception("No SSH keys found. Please deploy the instance first.")
 
-        from utils.aws_utils import AWSManager
-        aws = AWSManager()
-        
-        # Get instance details
-        instance_id = self.ssh_keys[0].get('instance_id')
-        if not instance_id:
+        key = self.ssh_keys[0]
+        if not key.get('instance_id'):
             raise Exception("No instance ID found. Please deploy the instance first.")
 
-        instance = aws.get_instance_by_id(instance_id)
-        if not instance:
+        # Instance state comes from the reconciler's cache, not a DescribeInstances call
+        from models.rental_instance import RentalInstance
+        instance = RentalInstance.for_rental(self)
+        if instance is not None and not instance.is_live:
             raise Exception("Instance not found or not running. Please deploy a new instance.")
 
         return {
-            'ssh_key': self.ssh_keys[0]['private_key'],
+            'ssh_key': key['private_key'],
             'connection_details': {
-                'instance_ip': instance.public_ip_address,
-                'instance_dns': instance.public_dns_name,
-                'instance_type': instance.instance_type,
+                'instance_ip': instance.public_ip if instance else key.get('instance_ip'),
+                'instance_dns': instance.public_dns if instance else key.get('instance_dns'),
+                'instance_type': instance.instance_type if instance else key.get('instance_type'),
+                'instance_state': instance.state if instance else None,
                 'gpu_configuration': self.configuration
             }
         }
 
     def terminate_aws_instance(self) -> None:
         """
-        Terminate the AWS EC2 instance associated with this rental.
+        Complete this rental and terminate its EC2 instance without waiting
+        for it to stop; utils/termination.py confirms the termination.
         """
-        if self.instance_id:
-            aws = AWSManager()
-            aws.terminate_instance(self.instance_id)
-            self.status = "completed"
-            self.end_time = datetime.utcnow()
-            db.session.commit()
+        from utils import termination
+        instance_id = termination.request(self)
+        self.status = "completed"
+        self.end_time = datetime.utcnow()
+        db.session.commit()
+        if instance_id:
+            termination.send([instance_id])
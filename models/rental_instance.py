@@ -0,0 +1,62 @@
+from utils.database import db
+from datetime import datetime
+
+
+class RentalInstance(db.Model):
+    """
+    Last known state of a Neotix-managed EC2 instance, refreshed by the
+    instance reconciler (utils/instance_reconciler.py). Request paths read
+    this instead of calling DescribeInstances.
+    """
+
+    __tablename__ = "rental_instances"
+    __table_args__ = {"extend_existing": True}
+
+    LIVE_STATES = ("pending", "running")
+    GONE_STATES = ("shutting-down", "terminated")
+
+    instance_id = db.Column(db.String(50), primary_key=True)
+    rental_gpu_id = db.Column(
+        db.Integer, db.ForeignKey("rental_gpus.id"), nullable=True, index=True
+    )
+    region = db.Column(db.String(30), nullable=True)
+    state = db.Column(db.String(20), nullable=False)
+    instance_type = db.Column(db.String(50), nullable=True)
+    public_ip = db.Column(db.String(45), nullable=True)
+    public_dns = db.Column(db.String(255), nullable=True)
+    launch_time = db.Column(db.DateTime, nullable=True)
+    # When the reconciler last saw the instance in a describe call
+    last_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Set when the rental is terminated; utils/termination.py confirms it with EC2
+    terminate_requested_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def is_live(self):
+        return self.state in self.LIVE_STATES
+
+    @classmethod
+    def for_rental(cls, rental):
+        """The cached row for a rental's instance, or None if it hasn't been seen yet."""
+        instance_id = rental.instance_id
+        if not instance_id and rental.ssh_keys:
+            instance_id = rental.ssh_keys[0].get("instance_id")
+        if instance_id:
+            return db.session.get(cls, instance_id)
+        return cls.query.filter_by(rental_gpu_id=rental.id).first()
+
+    def to_dict(self):
+        return {
+            "instance_id": self.instance_id,
+            "rental_gpu_id": self.rental_gpu_id,
+            "region": self.region,
+            "state": self.state,
+            "instance_type": self.instance_type,
+            "public_ip": self.public_ip,
+            "public_dns": self.public_dns,
+            "launch_time": self.launch_time.isoformat() if self.launch_time else None,
+            "last_seen_at": self.last_seen_at.isoformat() if self.last_seen_at else None,
+            "terminate_requested_at": (
+                self.terminate_requested_at.isoformat() if self.terminate_requested_at else None
+            ),
+        }
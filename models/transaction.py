@@ -3,6 +3,18 @@ from datetime import datetime
 
 class Transaction(db.Model):
     __tablename__ = "transactions"
+    __table_args__ = (
+        db.Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+        # Spending reports only read debits; INCLUDE lets them skip the table
+        db.Index(
+            "ix_transactions_debits_user_id_created_at",
+            "user_id",
+            "created_at",
+            postgresql_where=db.text("amount < 0"),
+            postgresql_include=["amount", "description"],
+            sqlite_where=db.text("amount < 0"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,57 @@
+from utils.database import db
+from datetime import datetime
+
+
+class UsageAccrual(db.Model):
+    """
+    The cost of one stretch of a running rental, written by the metering
+    tick (utils/metering.py). charged is what the user's balance paid for
+    it: nothing while the rental's deposit still covers its usage.
+    """
+
+    __tablename__ = "usage_accruals"
+    __table_args__ = (
+        db.Index("ix_usage_accruals_rental_gpu_id", "rental_gpu_id"),
+        db.Index("ix_usage_accruals_user_id_period_end", "user_id", "period_end"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    rental_gpu_id = db.Column(db.Integer, db.ForeignKey("rental_gpus.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    period_end = db.Column(db.DateTime, nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    hourly_rate = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)  # Usage cost with tax and platform fee
+    charged = db.Column(db.Float, nullable=False, default=0.0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "rental_gpu_id": self.rental_gpu_id,
+            "period_start": self.period_start.isoformat(),
+            "period_end": self.period_end.isoformat(),
+            "seconds": self.seconds,
+            "hourly_rate": self.hourly_rate,
+            "amount": self.amount,
+            "charged": self.charged,
+        }
+
+
+class BudgetAlert(db.Model):
+    """A user's spending crossing a percentage of their monthly budget, recorded once per month"""
+
+    __tablename__ = "budget_alerts"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "month", "threshold", name="uq_budget_alerts_user_month_threshold"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of the month
+    threshold = db.Column(db.Integer, nullable=False)  # Percent of the monthly budget
+    spent = db.Column(db.Float, nullable=False)  # Month-to-date spending when it was crossed
+    triggered_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
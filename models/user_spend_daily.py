@@ -0,0 +1,28 @@
+from utils.database import db
+
+
+class UserSpendDaily(db.Model):
+    """
+    A user's completed spending for one UTC day and category, maintained as
+    transactions are written (utils/spend_rollup.py). Spending reports read
+    these rows instead of scanning transactions.
+    """
+
+    __tablename__ = "user_spend_daily"
+    __table_args__ = {"extend_existing": True}
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    # The transaction description up to its first colon, e.g. "GPU Rental Final Charge"
+    category = db.Column(db.String(255), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)  # Positive dollars spent
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "day": self.day.isoformat(),
+            "category": self.category,
+            "amount": self.amount,
+            "transaction_count": self.transaction_count,
+        }
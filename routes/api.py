@@ -6,14 +6,26 @@ from models.user import User
 from models.transaction import Transaction
 from models.cluster import Cluster
 from models.rental_gpu import RentalGPU
+from models.catalog import MarketStatsSnapshot
 from utils.database import db
+from utils.response_cache import CachePolicy, cache_response
+from utils.rate_limit import rate_limited
 from utils.api_auth import require_api_key, require_admin_key, generate_api_key, get_user_from_key
 from sqlalchemy import func, desc, and_
 from flask_cors import cross_origin
 import pytz
+from config import Config
 
 bp = Blueprint('api', __name__)
 
+# Listing data only changes when an ingest bumps the catalog version
+GPU_LISTINGS_CACHE_POLICY = CachePolicy(
+    ttl=Config.CATALOG_CACHE_TTL,
+    max_age=60,
+    stale_ttl=Config.CATALOG_CACHE_STALE_TTL,
+    refresh_ahead=Config.CATALOG_CACHE_REFRESH_AHEAD,
+)
+
 def get_current_est_time():
     est = pytz.timezone('US/Eastern')
     return datetime.now(est)
@@ -21,10 +33,36 @@ def get_current_est_time():
 # Public Routes
 @bp.route('/v1/market/overview', methods=['GET'])
 @cross_origin()
+@rate_limited
 def get_market_overview():
     """Get a high-level overview of the GPU market."""
     try:
-        # Use the actual configuration relationship and column
+        # Served from the snapshot computed at ingest time
+        snapshot = MarketStatsSnapshot.latest()
+        if snapshot:
+            stats = snapshot.stats
+            response = {
+                'timestamp': get_current_est_time().isoformat(),
+                'catalog_version': snapshot.catalog_version_id,
+                'snapshot_time': snapshot.created_at.isoformat(),
+                'total_gpus_available': snapshot.total_gpus,
+                'total_listings': snapshot.total_listings,
+                'price': stats['price'],
+                'spot_discount': stats['spot_discount'],
+                'vendor_statistics': [
+                    {
+                        **vendor,
+                        'average_price': vendor['avg_price'],
+                        'available_instances': vendor['count']
+                    }
+                    for vendor in stats['vendor_statistics']
+                ],
+                'provider_statistics': stats['provider_statistics'],
+                'model_statistics': stats['model_statistics']
+            }
+            return jsonify(response), 200
+
+        # No ingest has run yet - fall back to aggregating the listings directly
         total_gpus = db.session.query(
             func.sum(GPUConfiguration.gpu_count)
         ).join(
@@ -42,6 +80,7 @@ def get_market_overview():
         
         response = {
             'timestamp': get_current_est_time().isoformat(),
+            'catalog_version': None,
             'total_gpus_available': total_gpus,
             'vendor_statistics': [
                 {
@@ -58,9 +97,42 @@ def get_market_overview():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/v1/market/overview/history', methods=['GET'])
+@cross_origin()
+@rate_limited
+def get_market_overview_history():
+    """Get a time series of past market snapshots, newest first."""
+    try:
+        limit = min(request.args.get('limit', 30, type=int), 365)
+        snapshots = MarketStatsSnapshot.query.order_by(
+            MarketStatsSnapshot.catalog_version_id.desc()
+        ).limit(limit).all()
+        
+        response = {
+            'timestamp': get_current_est_time().isoformat(),
+            'snapshots': [
+                {
+                    'catalog_version': snapshot.catalog_version_id,
+                    'snapshot_time': snapshot.created_at.isoformat(),
+                    'total_gpus_available': snapshot.total_gpus,
+                    'total_listings': snapshot.total_listings,
+                    'average_price': snapshot.avg_price,
+                    'median_price': snapshot.median_price,
+                    'spot_discount': snapshot.stats.get('spot_discount')
+                }
+                for snapshot in snapshots
+            ]
+        }
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Protected Routes - Require API Key
 @bp.route('/v1/market/gpu-prices', methods=['GET'])
 @cross_origin()
+@rate_limited
 @require_api_key
 def get_gpu_prices():
     """Get real-time market data for all cloud GPU providers."""
@@ -134,6 +206,7 @@ def get_gpu_prices():
 
 @bp.route('/v1/market/provider/<provider>/gpu-prices', methods=['GET'])
 @cross_origin()
+@rate_limited
 @require_api_key
 def get_provider_gpu_prices(provider):
     """Get real-time market data for a specific cloud GPU provider."""
@@ -184,6 +257,7 @@ def get_provider_gpu_prices(provider):
 
 @bp.route('/v1/market/gpu/<model>/prices', methods=['GET'])
 @cross_origin()
+@rate_limited
 @require_api_key
 def get_gpu_model_prices(model):
     """Get price comparison for a specific GPU model across providers."""
@@ -234,6 +308,7 @@ def get_gpu_model_prices(model):
 # GPU Listing Routes
 @bp.route('/gpu/filtered', methods=['GET'])
 @cross_origin()
+@cache_response(GPU_LISTINGS_CACHE_POLICY)
 def get_gpu_listings():
     """Get filtered GPU listings."""
     try:
@@ -439,6 +514,7 @@ def list_api_keys():
                 'permission': k.permission,
                 'created_at': k.created_at.isoformat(),
                 'last_used_at': k.last_used_at.isoformat() if k.last_used_at else None,
+                'usage_count': k.usage_count or 0,
                 'is_active': k.is_active
             }
             for k in keys
@@ -1,14 +1,18 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, url_for
 from models.cluster import Cluster
 from models.rental_gpu import RentalGPU
 from models.gpu_listing import GPUListing
 from models.user import User
 from models.transaction import Transaction
 from models.deployment_cost import DeploymentCost
+from models.provisioning_job import ProvisioningJob
+from models.cluster_node_group import ClusterNodeGroup
 from utils.database import db
-from middleware.auth import auth_required, require_auth
+from middleware.auth import auth_required, require_auth, get_current_user
+from utils import balance, billing, instance_types, provisioning, settlement, termination
+from utils.idempotency import idempotent
 from datetime import datetime, timedelta
-from decimal import Decimal
+from config import Config
 
 bp = Blueprint("clusters", __name__)
 
@@ -18,12 +22,13 @@ bp = Blueprint("clusters", __name__)
 def get_clusters():
     """Get all clusters for the current user"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        clusters = Cluster.query.filter_by(user_id=user.id).all()
-        return jsonify([cluster.to_dict() for cluster in clusters]), 200
+        # Constant number of queries however many clusters or rentals there are
+        clusters = Cluster.for_user(user.id).all()
+        return jsonify(Cluster.serialize_many(clusters)), 200
 
     except Exception as e:
         print(f"Error in get_clusters: {str(e)}")
@@ -70,7 +75,7 @@ def create_cluster(current_user):
 def get_cluster(cluster_id):
     """Get a specific cluster"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -93,7 +98,7 @@ def get_cluster(cluster_id):
 def add_gpu_to_cluster(cluster_id):
     """Add a GPU to a cluster"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -144,29 +149,45 @@ def add_gpu_to_cluster(cluster_id):
         return jsonify({"error": str(e)}), 500
 
 
+def _locked_cluster(cluster_id):
+    """The cluster, locked (SELECT ... FOR UPDATE) until the transaction ends"""
+    return Cluster.query.filter_by(id=cluster_id).populate_existing().with_for_update().first()
+
+
 @bp.route("/<int:cluster_id>/gpu/deploy", methods=["POST"])
 @require_auth()
+@idempotent
 def deploy_cluster_gpu(cluster_id):
     """Deploy a GPU to a cluster"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user(fresh=True)  # Balance is updated below
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        cluster = Cluster.query.get(cluster_id)
+        # Concurrent deploys of this cluster wait here until this one commits
+        cluster = _locked_cluster(cluster_id)
         if not cluster:
             return jsonify({"error": "Cluster not found"}), 404
 
         if cluster.user_id != user.id:
             return jsonify({"error": "Unauthorized"}), 403
 
+        # Only one deployment per cluster at a time
+        pending_job = ProvisioningJob.pending_for_cluster(cluster.id)
+        if pending_job:
+            return jsonify({
+                "error": "Cluster already has a deployment in progress",
+                "job": pending_job.to_dict()
+            }), 409
+
         # Check if there's already an active rental
         active_rental = cluster.active_rental
         if active_rental:
             if not active_rental.ssh_keys:
                 # No instance was created, so we can safely delete this rental
+                # (committed with the deployment, keeping the cluster locked)
                 db.session.delete(active_rental)
-                db.session.commit()
+                db.session.flush()
             else:
                 return jsonify({"error": "Cluster already has an active GPU"}), 400
 
@@ -180,102 +201,122 @@ def deploy_cluster_gpu(cluster_id):
             return jsonify({"error": "GPU not found"}), 404
 
         data = request.get_json() or {}
-        # Using hourly rate for on-demand deployments
-        hourly_rate = Decimal(str(gpu.current_price))
-        
-        # Initial deposit is for one hour
+        # Multi-node deployments get one rental, job and charge per node
+        node_count = data.get("node_count", 1)
+        if not isinstance(node_count, int) or not 1 <= node_count <= Config.CLUSTER_MAX_NODES:
+            return jsonify({
+                "error": f"node_count must be between 1 and {Config.CLUSTER_MAX_NODES}"
+            }), 400
+
+        # Initial deposit is one hour at the on-demand hourly rate
         initial_hours = 1
-        base_cost = hourly_rate * Decimal(str(initial_hours))
-        
-        tax_rate = Decimal('0.08')  # 8% tax
-        platform_fee_rate = Decimal('0.05')  # 5% platform fee
-        
-        tax_amount = base_cost * tax_rate
-        platform_fee_amount = base_cost * platform_fee_rate
-        total_cost = float(base_cost + tax_amount + platform_fee_amount)
+        deposit = billing.charge(gpu.current_price, initial_hours)
+        total_cost = float(deposit.total_cost)
+        required_amount = total_cost * node_count
 
-        # Check if user has sufficient balance
-        if user.balance < total_cost:
+        def insufficient_balance():
             return jsonify({
                 "error": "Insufficient balance",
-                "required_amount": total_cost,
+                "required_amount": required_amount,
                 "current_balance": user.balance,
-                "cost_breakdown": {
-                    "base_cost": float(base_cost),
-                    "tax_rate": float(tax_rate),
-                    "tax_amount": float(tax_amount),
-                    "platform_fee_rate": float(platform_fee_rate),
-                    "platform_fee_amount": float(platform_fee_amount),
-                    "total_cost": total_cost
-                }
+                "cost_breakdown": dict(deposit.to_dict(), node_count=node_count)
             }), 400
 
-        rental_gpu = None
-        try:
-            # First, create and flush the rental GPU to get its ID
-            rental_gpu = cluster.deploy_current_gpu(
-                ssh_keys=[],  # Empty list since we'll add SSH keys after instance creation
-                email_enabled=data.get("email_enabled", True),
-                config=data.get("config", {})  # Store the full config
-            )
-            db.session.add(rental_gpu)
-            db.session.flush()  # This assigns the ID without committing
+        # Check if user has sufficient balance
+        if user.balance < required_amount:
+            return insufficient_balance()
 
-            # Deploy AWS instance and get instance details
-            try:
-                instance_details = rental_gpu.deploy_aws_instance()
-            except Exception as e:
-                # If instance creation fails, delete the rental
+        try:
+            # Checked again in the UPDATE, against the balance as of now
+            if balance.charge(user, required_amount) is None:
                 db.session.rollback()
-                if rental_gpu.id:
-                    db.session.delete(rental_gpu)
-                    db.session.commit()
-                raise e
-
-            # Create and flush the transaction to get its ID
-            transaction = Transaction(
-                user_id=user.id,
-                amount=-total_cost,  # Negative amount for a debit
-                status="completed",
-                description=f"GPU Rental Initial Deposit: {gpu.configuration.gpu_name} - On-demand usage"
-            )
-            db.session.add(transaction)
-            db.session.flush()  # This assigns the ID without committing
-
-            # Now we can create the deployment cost with valid IDs
-            deployment_cost = DeploymentCost(
-                rental_gpu_id=rental_gpu.id,  # Now we have this ID
-                transaction_id=transaction.id,  # Now we have this ID
-                base_cost=float(base_cost),
-                tax_rate=float(tax_rate),
-                tax_amount=float(tax_amount),
-                platform_fee_rate=float(platform_fee_rate),
-                platform_fee_amount=float(platform_fee_amount),
-                total_cost=total_cost
-            )
-            db.session.add(deployment_cost)
+                return insufficient_balance()
+
+            node_group = None
+            if node_count > 1:
+                node_group = ClusterNodeGroup(
+                    cluster_id=cluster.id,
+                    gpu_listing_id=gpu.id,
+                    user_id=user.id,
+                    node_count=node_count,
+                )
+                db.session.add(node_group)
+                db.session.flush()
+
+            jobs = []
+            deployment_costs = []
+            for node_index in range(node_count):
+                # Create and flush the rental GPU to get its ID; the instance is
+                # launched by a provisioning worker once this request commits
+                rental_gpu = cluster.deploy_current_gpu(
+                    ssh_keys=[],  # Filled in by the provisioning job
+                    email_enabled=data.get("email_enabled", True),
+                    config=data.get("config", {}),  # Store the full config
+                    node_group=node_group,
+                    node_index=node_index if node_group else None,
+                )
+                # Refused rather than launched on other hardware at this listing's price
+                # (rolled back with the charge)
+                if instance_types.for_configuration(rental_gpu.configuration) is None:
+                    raise ValueError(
+                        f"{gpu.configuration.gpu_name} is not available on AWS "
+                        "with the requested configuration"
+                    )
+                rental_gpu.status = "provisioning"
+                rental_gpu.start_time = None  # Set when the instance is running
+                db.session.add(rental_gpu)
+                db.session.flush()  # This assigns the ID without committing
+
+                # Charge the deposit now; the job refunds it if provisioning fails
+                description = f"GPU Rental Initial Deposit: {gpu.configuration.gpu_name} - On-demand usage"
+                if node_group:
+                    description += f" (node {node_index + 1} of {node_count})"
+                transaction = Transaction(
+                    user_id=user.id,
+                    amount=-total_cost,  # Negative amount for a debit
+                    status="completed",
+                    description=description
+                )
+                db.session.add(transaction)
+                db.session.flush()  # This assigns the ID without committing
+
+                # Now we can create the deployment cost with valid IDs
+                deployment_cost = DeploymentCost(
+                    rental_gpu_id=rental_gpu.id,  # Now we have this ID
+                    transaction_id=transaction.id,  # Now we have this ID
+                    **deposit.to_dict()
+                )
+                db.session.add(deployment_cost)
+                deployment_costs.append(deployment_cost)
+
+                jobs.append(provisioning.enqueue(rental_gpu, transaction))
 
-            # Update user's balance
-            user.balance -= total_cost
-            
             # Now commit everything
             db.session.commit()
 
-            return jsonify({
+            payload = {
+                "job": jobs[0].to_dict(),
                 "cluster": cluster.to_dict(),
-                "cost_breakdown": deployment_cost.to_dict()
-            }), 200
-
-        except Exception as e:
-            # If anything fails, make sure to clean up the rental
+                "cost_breakdown": deployment_costs[0].to_dict()
+            }
+            if node_group:
+                payload["node_group"] = node_group.summary()
+                payload["jobs"] = [job.to_dict() for job in jobs]
+                location = url_for(
+                    "clusters.get_node_group", cluster_id=cluster.id, group_id=node_group.id
+                )
+            else:
+                location = url_for(
+                    "clusters.get_provisioning_job", cluster_id=cluster.id, job_id=jobs[0].id
+                )
+            response = jsonify(payload)
+            response.status_code = 202
+            response.headers["Location"] = location
+            return response
+
+        except Exception:
             db.session.rollback()
-            if rental_gpu and rental_gpu.id:
-                try:
-                    db.session.delete(rental_gpu)
-                    db.session.commit()
-                except:
-                    pass  # Ignore cleanup errors
-            raise e
+            raise
 
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -284,6 +325,59 @@ def deploy_cluster_gpu(cluster_id):
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/<int:cluster_id>/jobs/<int:job_id>", methods=["GET"])
+@require_auth()
+def get_provisioning_job(cluster_id, job_id):
+    """Get the status of a deployment started by deploy_cluster_gpu"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        job = ProvisioningJob.query.filter_by(id=job_id, cluster_id=cluster_id).first()
+        if not job or job.user_id != user.id:
+            return jsonify({"error": "Job not found"}), 404
+
+        response = jsonify(job.to_dict())
+        if job.is_pending:
+            response.headers["Retry-After"] = "5"
+        return response, 200
+
+    except Exception as e:
+        print(f"Error in get_provisioning_job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/<int:cluster_id>/node-groups/<int:group_id>", methods=["GET"])
+@require_auth()
+def get_node_group(cluster_id, group_id):
+    """Get the aggregate status and nodes of a multi-node deployment"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        node_group = ClusterNodeGroup.query.filter_by(id=group_id, cluster_id=cluster_id).first()
+        if not node_group or node_group.user_id != user.id:
+            return jsonify({"error": "Node group not found"}), 404
+
+        jobs = ProvisioningJob.query.filter(
+            ProvisioningJob.rental_gpu_id.in_([node.id for node in node_group.nodes])
+        ).order_by(ProvisioningJob.id).all()
+
+        response = jsonify({
+            **node_group.to_dict(),
+            "jobs": [job.to_dict() for job in jobs],
+        })
+        if any(job.is_pending for job in jobs):
+            response.headers["Retry-After"] = "5"
+        return response, 200
+
+    except Exception as e:
+        print(f"Error in get_node_group: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @bp.route("/<int:cluster_id>/gpu", methods=["DELETE"])
 @require_auth()
 def remove_gpu_from_cluster(cluster_id):
@@ -294,111 +388,64 @@ def remove_gpu_from_cluster(cluster_id):
 
 @bp.route("/<int:cluster_id>/gpu/terminate", methods=["POST"])
 @require_auth()
+@idempotent
 def terminate_cluster_gpu(cluster_id):
     """Terminate an on-demand GPU deployment and calculate final charges"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user(fresh=True)  # Balance is updated below
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        cluster = Cluster.query.get(cluster_id)
+        # A concurrent terminate waits here, then finds nothing left to bill
+        cluster = _locked_cluster(cluster_id)
         if not cluster:
             return jsonify({"error": "Cluster not found"}), 404
 
         if cluster.user_id != user.id:
             return jsonify({"error": "Unauthorized"}), 403
 
-        # Get the active rental
-        active_rental = cluster.active_rental
-        if not active_rental:
+        # Every node of a multi-node deployment is terminated and billed together;
+        # locked so metering can't charge them while the final charge is made
+        active_rentals = cluster.lock_active_nodes()
+        if not active_rentals:
             return jsonify({"error": "No active GPU rental found"}), 404
-        
-        # All deployments are now on-demand (no fixed duration)
-        
-        # Calculate the hours used and final charges
+
         now = datetime.utcnow()
-        start_time = active_rental.start_time
-        
-        # Calculate the duration in hours (rounded up to the nearest hour)
-        duration = now - start_time
-        hours_used = max(1, (duration.total_seconds() + 3599) // 3600)  # Round up to nearest hour
-        
-        # Get the GPU to calculate costs
-        gpu = active_rental.gpu_listing
-        if not gpu:
-            return jsonify({"error": "GPU listing not found"}), 404
-            
-        # Calculate final costs
-        hourly_rate = Decimal(str(gpu.current_price))
-        base_cost = hourly_rate * Decimal(str(hours_used))
-        tax_rate = Decimal('0.08')  # 8% tax
-        platform_fee_rate = Decimal('0.05')  # 5% platform fee
-        
-        tax_amount = base_cost * tax_rate
-        platform_fee_amount = base_cost * platform_fee_rate
-        total_cost = float(base_cost + tax_amount + platform_fee_amount)
-        
-        # Retrieve the initial deposit transaction
-        # Find the DeploymentCost record for this rental
-        deployment_cost = DeploymentCost.query.filter_by(rental_gpu_id=active_rental.id).first()
-        if not deployment_cost:
-            return jsonify({"error": "Deployment cost record not found"}), 404
-            
-        # Get the initial transaction amount
-        initial_transaction = Transaction.query.get(deployment_cost.transaction_id)
-        if not initial_transaction:
-            return jsonify({"error": "Initial transaction record not found"}), 404
-            
-        initial_amount = abs(initial_transaction.amount)  # Convert to positive amount
-        
-        # Calculate the remaining amount to charge
-        remaining_amount = total_cost - initial_amount
-        
-        if remaining_amount > 0:
-            # Create a transaction for the remaining amount
-            transaction = Transaction(
-                user_id=user.id,
-                amount=-remaining_amount,  # Negative amount for a debit
-                status="completed",
-                description=f"GPU Rental Final Charge: {gpu.configuration.gpu_name} - {hours_used} hours used"
-            )
-            db.session.add(transaction)
-            db.session.flush()  # This assigns the ID without committing
-            
-            # Update the user's balance
-            user.balance -= remaining_amount
-            
-            # Update the deployment cost record with the final values
-            deployment_cost.base_cost = float(base_cost)
-            deployment_cost.tax_amount = float(tax_amount)
-            deployment_cost.platform_fee_amount = float(platform_fee_amount)
-            deployment_cost.total_cost = total_cost
-        
-        # Terminate the AWS instance if it exists
-        if active_rental.instance_id or (active_rental.ssh_keys and active_rental.ssh_keys[0].get('instance_id')):
-            try:
-                active_rental.terminate_aws_instance()
-            except Exception as e:
-                print(f"Error terminating AWS instance: {str(e)}")
-                # Continue even if instance termination fails
-        
-        # Mark the rental as completed
-        active_rental.status = "completed"
-        active_rental.end_time = now
+        try:
+            usages = [settlement.final_charge(rental, user, now) for rental in active_rentals]
+        except LookupError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 404
+
+        # Recorded with the billing; the TerminateInstances call happens after commit
+        instance_ids = []
+        for rental in active_rentals:
+            instance_ids.append(termination.request(rental, now))
+            # Mark the rental as completed
+            rental.status = "completed"
+            rental.end_time = now
         db.session.commit()
-        
-        return jsonify({
+
+        instance_ids = [instance_id for instance_id in instance_ids if instance_id]
+        if instance_ids:
+            termination.send(instance_ids)
+
+        payload = {
             "message": "GPU deployment terminated successfully",
             "cluster": cluster.to_dict(),
             "usage": {
-                "hours_used": int(hours_used),
-                "start_time": start_time.isoformat(),
+                "hours_used": max(usage["hours_used"] for usage in usages),
+                "start_time": min(usage["start_time"] for usage in usages),
                 "end_time": now.isoformat(),
-                "total_cost": total_cost,
-                "initial_charge": initial_amount,
-                "final_charge": max(0, remaining_amount)
+                "total_cost": sum(usage["total_cost"] for usage in usages),
+                "initial_charge": sum(usage["initial_charge"] for usage in usages),
+                "accrued_charge": sum(usage["accrued_charge"] for usage in usages),
+                "final_charge": sum(usage["final_charge"] for usage in usages)
             }
-        }), 200
+        }
+        if len(usages) > 1:
+            payload["nodes"] = usages
+        return jsonify(payload), 200
             
     except ValueError as e:
         db.session.rollback()
@@ -412,9 +459,9 @@ def terminate_cluster_gpu(cluster_id):
 @bp.route("/<int:cluster_id>/history", methods=["GET"])
 @require_auth()
 def get_cluster_history(cluster_id):
-    """Get rental history for a specific cluster"""
+    """Get a page of rental history for a specific cluster, newest first"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -422,10 +469,21 @@ def get_cluster_history(cluster_id):
         if not cluster:
             return jsonify({"error": "Cluster not found"}), 404
 
-        rental_history = cluster.rental_history.order_by(
-            RentalGPU.start_time.desc()
-        ).all()
-        return jsonify([rental.to_dict() for rental in rental_history]), 200
+        page = request.args.get("page", 1, type=int)
+        per_page = min(request.args.get("per_page", 20, type=int), 100)
+
+        query = Cluster.rentals_with_listing(
+            RentalGPU.query.filter_by(cluster_id=cluster.id)
+        ).order_by(RentalGPU.start_time.desc(), RentalGPU.id.desc())
+        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+
+        return jsonify({
+            "rentals": [rental.to_dict() for rental in paginated.items],
+            "summary": Cluster.history_summaries([cluster.id])[cluster.id],
+            "page": page,
+            "pages": paginated.pages,
+            "total": paginated.total,
+        }), 200
 
     except Exception as e:
         print(f"Error fetching cluster history: {str(e)}")
@@ -437,7 +495,7 @@ def get_cluster_history(cluster_id):
 def get_cluster_gpu_ssh_key(cluster_id):
     """Get SSH key for the cluster's GPU"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -448,8 +506,14 @@ def get_cluster_gpu_ssh_key(cluster_id):
         if cluster.user_id != user.id:
             return jsonify({"error": "Unauthorized"}), 403
 
-        # Check if there's an active rental
-        active_rental = cluster.active_rental
+        # Check if there's an active rental; ?node= picks one node of a multi-node deployment
+        node = request.args.get("node", type=int)
+        if node is None:
+            active_rental = cluster.active_rental
+        else:
+            active_rental = next(
+                (rental for rental in cluster.active_nodes if rental.node_index == node), None
+            )
         if not active_rental:
             return jsonify({"error": "No active GPU rental found"}), 400
 
@@ -473,7 +537,7 @@ def get_cluster_gpu_ssh_key(cluster_id):
 def delete_cluster(cluster_id):
     """Delete a cluster if it has no active rentals"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
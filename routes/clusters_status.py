@@ -1,40 +1,142 @@
 from flask import Blueprint, jsonify, g
 from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.gpu_listing import GPUListing, GPUConfiguration
 from models.user import User
 from models.transaction import Transaction
 from models.deployment_cost import DeploymentCost
-from middleware.auth import require_auth
+from models.rental_instance import RentalInstance
+from middleware.auth import require_auth, get_current_user
 from utils.database import db
+from utils import billing
 from datetime import datetime
-from decimal import Decimal
 
 bp = Blueprint("clusters_status", __name__)
 
 
+def _active_status(user_id, now, cluster_id=None):
+    """
+    Map of cluster id to the real-time status of its active rental, for all
+    of a user's clusters or one of them. Rentals, prices, deposits and
+    instance states come from one query. Costs are what metering has
+    accrued plus the few seconds since, so this takes the same time for one
+    cluster as for a hundred. A multi-node cluster reports its first node,
+    with costs and deposits summed over nodes.
+    """
+    query = db.session.query(
+        RentalGPU,
+        GPUListing.current_price,
+        GPUConfiguration.gpu_name,
+        GPUConfiguration.gpu_vendor,
+        DeploymentCost.total_cost,
+        Transaction.amount,
+        RentalInstance.state,
+    ).join(
+        Cluster, RentalGPU.cluster_id == Cluster.id
+    ).outerjoin(
+        GPUListing, RentalGPU.gpu_listing_id == GPUListing.id
+    ).outerjoin(
+        GPUConfiguration, GPUListing.configuration_id == GPUConfiguration.id
+    ).outerjoin(
+        DeploymentCost, DeploymentCost.rental_gpu_id == RentalGPU.id
+    ).outerjoin(
+        Transaction, DeploymentCost.transaction_id == Transaction.id
+    ).outerjoin(
+        RentalInstance, RentalInstance.rental_gpu_id == RentalGPU.id
+    ).filter(
+        Cluster.user_id == user_id,
+        Cluster._active_filter(now),
+        RentalGPU.start_time.isnot(None),
+    ).order_by(RentalGPU.cluster_id, RentalGPU.node_index, RentalGPU.id)
+    if cluster_id is not None:
+        query = query.filter(Cluster.id == cluster_id)
+
+    # The outer joins can repeat a rental (several cost or instance rows); keep its first row
+    rows = {}
+    for row in query:
+        rows.setdefault(row[0].id, row)
+    rows = list(rows.values())
+    costs = billing.accrued_costs(
+        [row[0].accrued_amount for row in rows],
+        [row.current_price for row in rows],
+        [row[0].accrued_until or row[0].start_time for row in rows],
+        now,
+    )
+
+    status = {}
+    for row, current_cost in zip(rows, costs):
+        rental = row[0]
+        # Initial deposit: what was charged, else the recorded deployment cost
+        if row.amount is not None:
+            initial_deposit = abs(row.amount)
+        else:
+            initial_deposit = row.total_cost or 0.0
+        cluster_status = status.get(rental.cluster_id)
+        if cluster_status:
+            cluster_status["node_count"] += 1
+            cluster_status["current_cost"] += float(current_cost)
+            cluster_status["initial_deposit"] += initial_deposit
+            continue
+        has_gpu = row.current_price is not None
+        status[rental.cluster_id] = {
+            "rental": rental,
+            "gpu_type": (row.gpu_name or "Unknown GPU") if has_gpu else None,
+            "gpu_vendor": row.gpu_vendor if has_gpu else None,
+            "hourly_rate": float(row.current_price) if has_gpu else None,
+            "start_time": rental.start_time,
+            "running_seconds": (now - rental.start_time).total_seconds(),
+            "current_cost": float(current_cost),
+            "initial_deposit": initial_deposit,
+            "instance_state": row.state,
+            "node_count": 1,
+        }
+    return status
+
+
+def _apply_status(data, active):
+    """Fill a cluster's response fields from its _active_status entry"""
+    if active["gpu_type"] is not None:
+        data["gpu_type"] = active["gpu_type"]
+        data["gpu_vendor"] = active["gpu_vendor"]
+        data["hourly_rate"] = active["hourly_rate"]
+    running_seconds = active["running_seconds"]
+    current_cost = active["current_cost"]
+    initial_deposit = active["initial_deposit"]
+    data["is_active"] = True
+    data["start_time"] = active["start_time"].isoformat()
+    data["running_time_seconds"] = int(running_seconds)
+    data["running_time_hours"] = round(running_seconds / 3600, 2)
+    data["current_cost"] = round(current_cost, 2)
+    data["initial_deposit"] = round(initial_deposit, 2)
+    data["additional_charges"] = round(max(0, current_cost - initial_deposit), 2)
+    data["rental_id"] = active["rental"].id
+    data["node_count"] = active["node_count"]
+
+
 @bp.route("/", methods=["GET"])
 @bp.route("", methods=["GET"])
 @require_auth()
 def get_all_clusters_status():
     """Get detailed real-time status for all clusters of the current user"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        # Get all clusters for the user
+        # Get all clusters for the user, and the status of every active rental
         clusters = Cluster.query.filter_by(user_id=user.id).all()
+        now = datetime.utcnow()
+        active_status = _active_status(user.id, now)
         
         response = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
             "active_clusters_count": 0,
             "total_clusters_count": len(clusters),
             "total_current_cost": 0.0,
             "clusters": []
         }
 
-        # Process each cluster for real-time status
         for cluster in clusters:
-            # Calculate real-time metrics for active rentals
             cluster_data = {
                 "id": cluster.id,
                 "name": cluster.name,
@@ -45,62 +147,20 @@ def get_all_clusters_status():
                 "running_time": None,
                 "current_cost": None,
                 "hourly_rate": None,
-                "initial_deposit": None
+                "initial_deposit": None,
+                "instance_state": None
             }
-            
-            # Check if the cluster has an active rental
-            active_rental = cluster.active_rental
-            if active_rental and active_rental.start_time:
-                # Get the GPU details
-                gpu = active_rental.gpu_listing
-                if gpu:
-                    cluster_data["gpu_type"] = gpu.configuration.gpu_name if gpu.configuration else "Unknown GPU"
-                    cluster_data["gpu_vendor"] = gpu.gpu_vendor
-                    cluster_data["hourly_rate"] = float(gpu.current_price)
-                
-                # Calculate running time in hours
-                start_time = active_rental.start_time
-                now = datetime.utcnow()
-                running_seconds = (now - start_time).total_seconds()
-                running_hours = running_seconds / 3600
-                
-                # Get initial deposit from deployment cost
-                deployment_cost = DeploymentCost.query.filter_by(rental_gpu_id=active_rental.id).first()
-                initial_deposit = 0.0
-                if deployment_cost:
-                    initial_deposit = deployment_cost.total_cost
-                    transaction = Transaction.query.get(deployment_cost.transaction_id)
-                    if transaction:
-                        initial_deposit = abs(transaction.amount)
-                
-                # Calculate current cost based on running time and hourly rate
-                hourly_rate = float(gpu.current_price) if gpu else 0.0
-                current_cost = running_hours * hourly_rate
-                
-                # Apply tax and platform fee (same as in deployment)
-                tax_rate = Decimal('0.08')  # 8% tax
-                platform_fee_rate = Decimal('0.05')  # 5% platform fee
-                
-                base_cost = Decimal(str(current_cost))
-                tax_amount = base_cost * tax_rate
-                platform_fee_amount = base_cost * platform_fee_rate
-                total_current_cost = float(base_cost + tax_amount + platform_fee_amount)
-                
-                # Update cluster data
-                cluster_data["is_active"] = True
-                cluster_data["start_time"] = start_time.isoformat()
-                cluster_data["running_time_seconds"] = int(running_seconds)
-                cluster_data["running_time_hours"] = round(running_hours, 2)
-                cluster_data["current_cost"] = round(total_current_cost, 2)
-                cluster_data["initial_deposit"] = round(initial_deposit, 2)
-                cluster_data["additional_charges"] = round(max(0, total_current_cost - initial_deposit), 2)
-                
-                # Update totals
+
+            active = active_status.get(cluster.id)
+            if active:
+                _apply_status(cluster_data, active)
+                # Instance state from the reconciler's cache
+                cluster_data["instance_state"] = active["instance_state"]
                 response["active_clusters_count"] += 1
-                response["total_current_cost"] += total_current_cost
+                response["total_current_cost"] += active["current_cost"]
             
             response["clusters"].append(cluster_data)
-        
+
         # Sort clusters to show active ones first
         response["clusters"] = sorted(response["clusters"], key=lambda x: (not x["is_active"], x["name"]))
         response["total_current_cost"] = round(response["total_current_cost"], 2)
@@ -117,7 +177,7 @@ def get_all_clusters_status():
 def get_cluster_status(cluster_id):
     """Get detailed real-time status for a specific cluster"""
     try:
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -129,9 +189,10 @@ def get_cluster_status(cluster_id):
         if cluster.user_id != user.id:
             return jsonify({"error": "Unauthorized"}), 403
 
+        now = datetime.utcnow()
         # Initialize the response
         response = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
             "id": cluster.id,
             "name": cluster.name,
             "description": cluster.description,
@@ -144,54 +205,15 @@ def get_cluster_status(cluster_id):
             "initial_deposit": None
         }
 
-        # Check if the cluster has an active rental
-        active_rental = cluster.active_rental
-        if active_rental and active_rental.start_time:
-            # Get the GPU details
-            gpu = active_rental.gpu_listing
-            if gpu:
-                response["gpu_type"] = gpu.configuration.gpu_name if gpu.configuration else "Unknown GPU"
-                response["gpu_vendor"] = gpu.gpu_vendor
-                response["hourly_rate"] = float(gpu.current_price)
-            
-            # Calculate running time in hours
-            start_time = active_rental.start_time
-            now = datetime.utcnow()
-            running_seconds = (now - start_time).total_seconds()
-            running_hours = running_seconds / 3600
-            
-            # Get initial deposit from deployment cost
-            deployment_cost = DeploymentCost.query.filter_by(rental_gpu_id=active_rental.id).first()
-            initial_deposit = 0.0
-            if deployment_cost:
-                initial_deposit = deployment_cost.total_cost
-                transaction = Transaction.query.get(deployment_cost.transaction_id)
-                if transaction:
-                    initial_deposit = abs(transaction.amount)
-            
-            # Calculate current cost based on running time and hourly rate
-            hourly_rate = float(gpu.current_price) if gpu else 0.0
-            current_cost = running_hours * hourly_rate
-            
-            # Apply tax and platform fee (same as in deployment)
-            tax_rate = Decimal('0.08')  # 8% tax
-            platform_fee_rate = Decimal('0.05')  # 5% platform fee
-            
-            base_cost = Decimal(str(current_cost))
-            tax_amount = base_cost * tax_rate
-            platform_fee_amount = base_cost * platform_fee_rate
-            total_current_cost = float(base_cost + tax_amount + platform_fee_amount)
-            
-            # Update cluster data
-            response["is_active"] = True
-            response["start_time"] = start_time.isoformat()
-            response["running_time_seconds"] = int(running_seconds)
-            response["running_time_hours"] = round(running_hours, 2)
-            response["current_cost"] = round(total_current_cost, 2)
-            response["initial_deposit"] = round(initial_deposit, 2)
-            response["additional_charges"] = round(max(0, total_current_cost - initial_deposit), 2)
+        active = _active_status(user.id, now, cluster_id=cluster.id).get(cluster.id)
+        if active:
+            _apply_status(response, active)
+            active_rental = active["rental"]
             response["instance_id"] = active_rental.instance_id
-            response["rental_id"] = active_rental.id
+
+            # Last state seen by the instance reconciler; no AWS call here
+            instance = RentalInstance.for_rental(active_rental)
+            response["instance"] = instance.to_dict() if instance else None
         
         return jsonify(response), 200
 
@@ -1,13 +1,16 @@
 from flask import Blueprint, jsonify, g
 from models.user import User
-from models.transaction import Transaction
+from models.user_spend_daily import UserSpendDaily
+from models.usage_accrual import BudgetAlert
 from models.cluster import Cluster
 from models.rental_gpu import RentalGPU
-from middleware.auth import require_auth
+from models.gpu_listing import GPUListing
+from middleware.auth import require_auth, get_current_user
 from utils.database import db
-from sqlalchemy import func, desc
+from utils import billing
+from sqlalchemy import func
 from datetime import datetime, timedelta
-from decimal import Decimal
+from config import Config
 
 bp = Blueprint("financial_dashboard", __name__)
 
@@ -19,7 +22,7 @@ def get_financial_dashboard():
     """Get comprehensive financial data for the dashboard"""
     try:
         # Get the user
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -35,129 +38,59 @@ def get_financial_dashboard():
         
         # Get user's current balance
         current_balance = user.balance
-        
-        # Get current month's costs
-        current_month_costs = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= first_day_of_month,
-            Transaction.amount < 0  # Only count negative transactions (expenses)
-        ).scalar() or 0.0
-        
-        # Get previous month's costs
-        previous_month_costs = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= first_day_of_prev_month,
-            Transaction.created_at < first_day_of_month,
-            Transaction.amount < 0  # Only count negative transactions (expenses)
-        ).scalar() or 0.0
+
+        # Every spending figure comes from the user's daily rollup rows
+        spending = _spending_summary(user.id, {
+            'current_month': first_day_of_month,
+            'previous_month': (first_day_of_prev_month, first_day_of_month),
+            'last_7_days': last_7_days,
+            'last_30_days': last_30_days,
+            'last_90_days': last_90_days,
+        }, trend_since=last_30_days)
+        totals = spending['totals']
+        current_month_costs = totals['current_month']
+        previous_month_costs = totals['previous_month']
         
         # Calculate month-over-month change percentage
         if previous_month_costs > 0:
             mom_change_percentage = ((current_month_costs - previous_month_costs) / previous_month_costs) * 100
         else:
             mom_change_percentage = 100 if current_month_costs > 0 else 0
-            
-        # Get spending by time periods
-        spending_7_days = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= last_7_days,
-            Transaction.amount < 0
-        ).scalar() or 0.0
-        
-        spending_30_days = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= last_30_days,
-            Transaction.amount < 0
-        ).scalar() or 0.0
-        
-        spending_90_days = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= last_90_days,
-            Transaction.amount < 0
-        ).scalar() or 0.0
-        
-        # Get daily spending for the last 30 days for trend analysis
-        daily_spending_query = db.session.query(
-            func.date(Transaction.created_at).label('date'),
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= last_30_days,
-            Transaction.amount < 0
-        ).group_by(func.date(Transaction.created_at))
-        
-        daily_spending = []
-        for date, total in daily_spending_query:
-            daily_spending.append({
-                'date': date.isoformat(),
-                'amount': float(total)
-            })
-        
-        # Sort by date
-        daily_spending.sort(key=lambda x: x['date'])
-        
-        # Get top spending categories (based on transaction descriptions)
-        top_spending_categories = db.session.query(
-            Transaction.description,
-            func.sum(Transaction.amount * -1).label('total')
+
+        spending_7_days = totals['last_7_days']
+        spending_30_days = totals['last_30_days']
+        spending_90_days = totals['last_90_days']
+
+        daily_spending = spending['daily']
+
+        # Top spending categories, e.g. "GPU Rental: A100 - 2 hours" -> "GPU Rental"
+        categories = [
+            {'category': category, 'amount': float(total)}
+            for category, total in spending['top_categories']
+        ]
+        
+        # Get active rentals with what they have accrued, with their listing's price in the same query
+        active_rentals = db.session.query(
+            RentalGPU.start_time, RentalGPU.accrued_until, RentalGPU.accrued_amount,
+            GPUListing.current_price
+        ).join(
+            Cluster, RentalGPU.cluster_id == Cluster.id
+        ).outerjoin(
+            GPUListing, RentalGPU.gpu_listing_id == GPUListing.id
         ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= last_30_days,
-            Transaction.amount < 0
-        ).group_by(Transaction.description).order_by(desc('total')).limit(5).all()
-        
-        categories = []
-        for description, total in top_spending_categories:
-            # Skip if description is None
-            if description is None:
-                continue
-                
-            # Extract category from description
-            # Example: "GPU Rental: A100 - 2 hours" -> "GPU Rental"
-            category = description.split(':')[0] if ':' in description else description
-            categories.append({
-                'category': category,
-                'amount': float(total)
-            })
-        
-        # Get active rentals with ongoing costs
-        active_rentals = db.session.query(RentalGPU).join(Cluster).filter(
             Cluster.user_id == user.id,
             RentalGPU.status == 'active',
             RentalGPU.start_time.isnot(None),
             RentalGPU.end_time.is_(None)
         ).all()
         
-        active_costs = 0.0
-        for rental in active_rentals:
-            gpu = rental.gpu_listing
-            if gpu and rental.start_time:
-                # Calculate ongoing cost
-                start_time = rental.start_time
-                running_seconds = (now - start_time).total_seconds()
-                running_hours = running_seconds / 3600
-                hourly_rate = float(gpu.current_price) if gpu.current_price else 0.0
-                
-                # Apply tax and fees consistent with deployment
-                base_cost = Decimal(str(running_hours * hourly_rate))
-                tax_rate = Decimal('0.08')  # 8% tax
-                platform_fee_rate = Decimal('0.05')  # 5% platform fee
-                
-                tax_amount = base_cost * tax_rate
-                platform_fee_amount = base_cost * platform_fee_rate
-                total_cost = float(base_cost + tax_amount + platform_fee_amount)
-                
-                active_costs += total_cost
+        # Accrued by metering, plus the stretch since its last tick
+        active_costs = float(billing.accrued_costs(
+            [rental.accrued_amount for rental in active_rentals],
+            [rental.current_price for rental in active_rentals],
+            [rental.accrued_until or rental.start_time for rental in active_rentals],
+            now,
+        ).sum())
         
         # Compile the response
         response = {
@@ -184,55 +117,98 @@ def get_financial_dashboard():
         return jsonify({"error": str(e)}), 500
 
 
+def _spending_summary(user_id, periods, trend_since, top_categories=5):
+    """
+    Spending totals per period, the daily trend and the top categories since
+    trend_since, from the user's rows in the daily rollup (one query, one row
+    per day and category). Periods are whole UTC days.
+
+    periods maps a name to a start datetime or a (start, end) pair.
+    """
+    bounds = {}
+    for name, period in periods.items():
+        start, end = period if isinstance(period, tuple) else (period, None)
+        bounds[name] = (start.date(), end.date() if end else None)
+    trend_start = trend_since.date()
+    since = min([start for start, _ in bounds.values()] + [trend_start])
+
+    rows = db.session.query(
+        UserSpendDaily.day, UserSpendDaily.category, UserSpendDaily.amount
+    ).filter(
+        UserSpendDaily.user_id == user_id,
+        UserSpendDaily.day >= since,
+    )
+
+    totals = {name: 0.0 for name in periods}
+    daily = {}
+    categories = {}
+    for day, category, amount in rows:
+        for name, (start, end) in bounds.items():
+            if day >= start and (end is None or day < end):
+                totals[name] += amount
+        if day >= trend_start:
+            daily[day] = daily.get(day, 0.0) + amount
+            categories[category] = categories.get(category, 0.0) + amount
+
+    return {
+        'totals': totals,
+        'daily': [{'date': day.isoformat(), 'amount': amount} for day, amount in sorted(daily.items())],
+        'top_categories': sorted(categories.items(), key=lambda item: item[1], reverse=True)[:top_categories],
+    }
+
+
+def _month_to_date_spend(user_id, now):
+    """The user's spending so far this month, from the daily rollup"""
+    return db.session.query(func.sum(UserSpendDaily.amount)).filter(
+        UserSpendDaily.user_id == user_id,
+        UserSpendDaily.day >= now.date().replace(day=1),
+    ).scalar() or 0.0
+
+
 @bp.route("/budget", methods=["GET"])
 @require_auth()
 def get_user_budget():
     """Get user's budget settings and status"""
     try:
         # Get the user
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
             
-        # For now, return placeholder data
-        # In a real implementation, this would be stored in a user_budget table
         now = datetime.utcnow()
-        first_day_of_month = datetime(now.year, now.month, 1)
         
         # Get current month's costs
-        current_month_costs = db.session.query(
-            func.sum(Transaction.amount * -1).label('total')
-        ).filter(
-            Transaction.user_id == user.id,
-            Transaction.created_at >= first_day_of_month,
-            Transaction.amount < 0  # Only count negative transactions (expenses)
-        ).scalar() or 0.0
+        current_month_costs = _month_to_date_spend(user.id, now)
         
-        placeholder_budget = 500.0  # 500 USD monthly budget
-        budget_used_percentage = (current_month_costs / placeholder_budget) * 100 if placeholder_budget > 0 else 0
+        monthly_budget = Config.MONTHLY_BUDGET
+        budget_used_percentage = (current_month_costs / monthly_budget) * 100 if monthly_budget > 0 else 0
+
+        # Thresholds the metering tick has recorded crossing this month
+        triggered_at = dict(
+            db.session.query(BudgetAlert.threshold, BudgetAlert.triggered_at).filter(
+                BudgetAlert.user_id == user.id,
+                BudgetAlert.month == now.date().replace(day=1),
+            )
+        )
+        budget_alerts = []
+        for threshold in Config.BUDGET_ALERT_THRESHOLDS:
+            if threshold >= 100:
+                message = 'You have exceeded your monthly budget'
+            else:
+                message = f'You have used {threshold}% of your monthly budget'
+            budget_alerts.append({
+                'threshold': threshold,
+                'triggered': budget_used_percentage >= threshold or threshold in triggered_at,
+                'triggered_at': triggered_at[threshold].isoformat() if threshold in triggered_at else None,
+                'message': message
+            })
         
         response = {
-            'monthly_budget': placeholder_budget,
+            'monthly_budget': monthly_budget,
             'current_usage': float(current_month_costs),
             'percentage_used': float(budget_used_percentage),
-            'remaining_budget': float(max(0, placeholder_budget - current_month_costs)),
-            'budget_alerts': [
-                {
-                    'threshold': 50,
-                    'triggered': budget_used_percentage >= 50,
-                    'message': 'You have used 50% of your monthly budget'
-                },
-                {
-                    'threshold': 80,
-                    'triggered': budget_used_percentage >= 80,
-                    'message': 'You have used 80% of your monthly budget'
-                },
-                {
-                    'threshold': 100,
-                    'triggered': budget_used_percentage >= 100,
-                    'message': 'You have exceeded your monthly budget'
-                }
-            ]
+            'remaining_budget': float(max(0, monthly_budget - current_month_costs)),
+            'budget_alerts': budget_alerts
         }
         
         return jsonify(response), 200
@@ -12,6 +12,8 @@ from utils.database import db
 from datetime import datetime
 from sqlalchemy import func
 from utils.cache import memory_cache
+from utils.response_cache import CachePolicy, cache_response
+from config import Config
 
 # Configure logging
 logging.basicConfig(
@@ -26,16 +28,34 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint("gpu", __name__, url_prefix="/api/gpu")
 
+# Catalog responses only change when an ingest bumps the catalog version
+CATALOG_CACHE_POLICY = CachePolicy(
+    ttl=Config.CATALOG_CACHE_TTL,
+    max_age=60,
+    stale_ttl=Config.CATALOG_CACHE_STALE_TTL,
+    refresh_ahead=Config.CATALOG_CACHE_REFRESH_AHEAD,
+)
+
+
+@memory_cache(
+    expiration=Config.CATALOG_CACHE_TTL,
+    versioned=True,  # Refreshed by each ingest
+    stale_ttl=Config.CATALOG_CACHE_STALE_TTL,
+    refresh_ahead=Config.CATALOG_CACHE_REFRESH_AHEAD,
+)
+def _all_gpu_listings():
+    """Every listing as a dict; errors propagate, so only results are cached"""
+    listings = GPUListing.query.join(GPUConfiguration).all()
+    logger.info(f"Found {len(listings)} GPU listings")
+    return [listing.to_dict() for listing in listings]
+
 
 @bp.route("/get_all", methods=["GET"])
-@memory_cache(expiration=60)  # Cache for 1 minute
 def get_all_gpus():
     try:
         logger.info("Starting get_all_gpus request")
-        listings = GPUListing.query.join(GPUConfiguration).all()
-        logger.info(f"Found {len(listings)} GPU listings")
-        result = [listing.to_dict() for listing in listings]
-        logger.info(f"Converted {len(result)} listings to dict")
+        result = _all_gpu_listings()
+        logger.info(f"Returning {len(result)} listings")
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in get_all_gpus: {str(e)}", exc_info=True)
@@ -43,6 +63,7 @@ def get_all_gpus():
 
 
 @bp.route("/search", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def search_gpus():
     try:
         logger.info("Starting search_gpus request")
@@ -142,6 +163,7 @@ def get_gpu(id):
 
 
 @bp.route("/hosts", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def get_hosts():
     try:
         logger.info("Starting get_hosts request")
@@ -187,6 +209,7 @@ def get_paginated_gpus(page_number):
 
 
 @bp.route("/filtered", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def get_filtered_gpus():
     try:
         logger.info("Starting get_filtered_gpus request")
@@ -304,6 +327,7 @@ def get_filtered_gpus():
 
 
 @bp.route("/vendors", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def get_gpu_vendors():
     try:
         logger.info("Starting get_gpu_vendors request")
@@ -316,6 +340,7 @@ def get_gpu_vendors():
 
 
 @bp.route("/gpu_types", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def get_gpu_types():
     try:
         logger.info("Starting get_gpu_types request")
@@ -386,6 +411,7 @@ def get_gpu_price_points(gpu_id):
 
 
 @bp.route("/compare", methods=["GET"])
+@cache_response(CATALOG_CACHE_POLICY)
 def compare_gpus():
     """Find similar GPUs for comparison"""
     try:
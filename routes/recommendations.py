@@ -3,7 +3,7 @@ from models.user import User
 from models.transaction import Transaction
 from models.cluster import Cluster
 from models.rental_gpu import RentalGPU
-from middleware.auth import require_auth
+from middleware.auth import require_auth, get_current_user
 from utils.database import db
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
@@ -19,7 +19,7 @@ def get_recommendations():
     """Get personalized recommendations based on user's activity and usage patterns"""
     try:
         # Get the user
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -144,7 +144,7 @@ def dismiss_recommendation(recommendation_id):
     """Dismiss a recommendation so it won't be shown again"""
     try:
         # Get the user
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
             
@@ -3,6 +3,8 @@ from models.transaction import Transaction
 from models.user import User
 from utils.database import db
 from middleware.auth import auth_required
+from utils import balance
+from utils.idempotency import idempotent
 import stripe
 import os
 from flask_cors import cross_origin
@@ -85,6 +87,7 @@ def get_payment_methods(current_user):
 
 @bp.route("/create-payment-intent", methods=["POST"])
 @auth_required
+@idempotent
 def create_payment_intent(current_user):
     """Create a Stripe PaymentIntent for adding funds"""
     try:
@@ -149,6 +152,7 @@ def create_payment_intent(current_user):
 
 @bp.route("/confirm", methods=["POST"])
 @auth_required
+@idempotent
 def confirm_transaction(current_user):
     """Confirm a successful transaction and update user's balance"""
     try:
@@ -184,11 +188,11 @@ def confirm_transaction(current_user):
             print(f"Stripe error: {str(e)}")
             return jsonify({"error": str(e)}), 400
 
-        # Get and update the transaction
+        # Get and update the transaction, locked so a concurrent confirm waits and then sees it completed
         transaction = Transaction.query.filter_by(
             stripe_payment_id=payment_intent_id,
             user_id=current_user.id
-        ).first()
+        ).populate_existing().with_for_update().first()
 
         if not transaction:
             return jsonify({"error": "Transaction not found"}), 404
@@ -196,9 +200,9 @@ def confirm_transaction(current_user):
         if transaction.status == "completed":
             return jsonify({"error": "Transaction already completed"}), 400
 
-        # Update transaction and user balance
+        # Update transaction and user balance, in SQL rather than from a cached copy
         transaction.status = "completed"
-        current_user.balance += transaction.amount
+        balance.credit(current_user, transaction.amount)
         db.session.commit()
 
         return jsonify({"message": "Transaction completed successfully"}), 200
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, g
 from utils.database import db
 from models.user import User
-from middleware.auth import auth_required
+from middleware.auth import auth_required, get_current_user
 import traceback
 from datetime import datetime
 import firebase_admin
@@ -16,7 +16,7 @@ def sync_user():
     """Sync Firebase user with backend database"""
     try:
         # Check if user already exists
-        user = User.query.filter_by(firebase_uid=g.user_id).first()
+        user = get_current_user()
 
         # Get user data from Firebase
         firebase_user = firebase_auth.get_user(g.user_id)
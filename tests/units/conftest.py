@@ -10,6 +10,147 @@ project_root = str(Path(__file__).parent.parent.parent)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
+class FakeEC2:
+    """
+    In-memory stand-in for the EC2 calls AWSManager makes. Instances map id to
+    state; described holds what describe_managed_instances lists.
+    """
+
+    region = "us-east-1"
+
+    def __init__(self):
+        self.instances = {}
+        self.described = []
+        self.key_pairs = set()
+        self.tags = {}
+        self.public_keys = {}
+        self.client_tokens = {}
+        self.terminate_calls = []
+        self.describe_calls = 0
+        self.launch_error = None
+        self.terminate_error = None
+
+    def manager(self):
+        """A class to patch over AWSManager; it is this EC2 in every region"""
+        from utils.aws_utils import AWSManager
+        ec2 = self
+
+        class FakeAWSManager:
+            RENTAL_TAG = AWSManager.RENTAL_TAG
+
+            def __new__(cls, region=None):
+                return ec2
+
+        return FakeAWSManager
+
+    def create_key_pair(self, key_name):
+        self.key_pairs.add(key_name)
+        return {"KeyName": key_name, "KeyMaterial": f"PRIVATE KEY for {key_name}"}
+
+    def delete_key_pair(self, key_name):
+        self.key_pairs.discard(key_name)
+
+    def launch_gpu_instance(self, gpu_config, key_name=None, ami_id=None, subnet_id=None,
+                            tags=None, ssh_public_key=None, client_token=None):
+        if self.launch_error:
+            raise Exception(self.launch_error)
+        # Like RunInstances, a repeated client token gets the same instance back
+        instance_id = self.client_tokens.get(client_token) or f"i-{len(self.instances) + 1:017x}"
+        if client_token:
+            self.client_tokens[client_token] = instance_id
+        self.instances[instance_id] = "running"
+        self.tags[instance_id] = dict(tags or {})
+        self.public_keys[instance_id] = ssh_public_key
+        return instance_id, {
+            "instance_id": instance_id,
+            "instance_type": "g4dn.xlarge",
+            "instance_ip": "203.0.113.10",
+            "instance_dns": "ec2-203-0-113-10.compute-1.amazonaws.com",
+            "gpu_configuration": gpu_config,
+        }
+
+    def terminate_instances(self, instance_ids):
+        self.terminate_calls.append(list(instance_ids))
+        if self.terminate_error:
+            raise Exception(self.terminate_error)
+        for instance_id in instance_ids:
+            if self.instances.get(instance_id) in ("pending", "running"):
+                self.instances[instance_id] = "shutting-down"
+
+    def instance_states(self, instance_ids):
+        return {i: self.instances[i] for i in instance_ids if i in self.instances}
+
+    def describe_managed_instances(self):
+        self.describe_calls += 1
+        return iter(list(self.described))
+
+
+@pytest.fixture
+def ec2():
+    """A FakeEC2 that AWSManager() returns while the test runs"""
+    fake = FakeEC2()
+    with patch("utils.aws_utils.AWSManager", fake.manager()):
+        yield fake
+
+
+@pytest.fixture
+def database_uri():
+    """Database the app fixture runs on"""
+    return "sqlite://"
+
+
+@pytest.fixture
+def blueprints():
+    """(blueprint, url_prefix) pairs the app fixture registers"""
+    return []
+
+
+@pytest.fixture
+def seed():
+    """Adds a module's rows, given the signed-in user, before the app is used"""
+    return lambda user: None
+
+
+@pytest.fixture
+def app(monkeypatch, database_uri, blueprints, seed):
+    """
+    Flask app on a fresh database with one user, uid-1, whom any bearer token
+    authenticates as. Modules override blueprints and seed for the rest.
+    """
+    import models.cluster
+    from flask import Flask
+    from models.gpu_listing import GPUListing
+    from models.user import User
+    from utils import identity
+    from utils.database import db
+
+    # Other tests assign a mock to User.query; use the real query property here
+    if "query" in User.__dict__:
+        monkeypatch.delattr(User, "query")
+    # A fixture that fails part-way through its patches leaves these mocked
+    monkeypatch.setattr(models.cluster, "db", db)
+    monkeypatch.setattr(models.cluster, "GPUListing", GPUListing)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    db.init_app(app)
+    for blueprint, url_prefix in blueprints:
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
+    with app.app_context():
+        db.create_all()
+        user = User(firebase_uid="uid-1", email="a@example.com", first_name="Ada", last_name="L")
+        db.session.add(user)
+        db.session.flush()
+        seed(user)
+        db.session.commit()
+    identity.clear()
+    with patch("middleware.auth.verify_id_token", return_value={"uid": "uid-1"}):
+        yield app
+    identity.clear()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
 @pytest.fixture
 def db_fixture():
     """Mock database fixture for unit testing"""
@@ -285,4 +426,7 @@ def pytest_configure(config):
     """Register custom markers."""
     config.addinivalue_line(
         "markers", "unit_tests: mark tests as unit tests to run them separately"
+    )
+    config.addinivalue_line(
+        "markers", "postgres: needs a PostgreSQL database named by TEST_POSTGRES_URL"
     )
\ No newline at end of file
@@ -64,7 +64,7 @@ def test_invalid_token_format(app):
 def test_valid_token_user_not_found(app):
     """Test when token is valid but user is not found in database"""
     with app.test_request_context(headers={"Authorization": "Bearer valid_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             mock_verify.return_value = {"uid": "test_uid"}
             
             # Patch at module level where auth_required uses it
@@ -91,7 +91,7 @@ def test_valid_token_user_not_found(app):
 def test_valid_token_with_user_pass_user_true(app, mock_user):
     """Test when token is valid and user is found, pass_user=True"""
     with app.test_request_context(headers={"Authorization": "Bearer valid_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             mock_verify.return_value = {"uid": "test_uid"}
             
             # Patch at module level
@@ -121,7 +121,7 @@ def test_valid_token_with_user_pass_user_true(app, mock_user):
 def test_valid_token_with_user_pass_user_false(app, mock_user):
     """Test when token is valid and user is found, pass_user=False"""
     with app.test_request_context(headers={"Authorization": "Bearer valid_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             mock_verify.return_value = {"uid": "test_uid"}
             
             # Patch at module level
@@ -150,7 +150,7 @@ def test_valid_token_with_user_pass_user_false(app, mock_user):
 def test_expired_token(app):
     """Test when token is expired"""
     with app.test_request_context(headers={"Authorization": "Bearer expired_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             # Fix: Add required 'cause' argument
             mock_verify.side_effect = auth.ExpiredIdTokenError("Token expired", None)
             
@@ -167,7 +167,7 @@ def test_expired_token(app):
 def test_invalid_token(app):
     """Test when token is invalid"""
     with app.test_request_context(headers={"Authorization": "Bearer invalid_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             # Fix: Add required 'cause' argument
             mock_verify.side_effect = auth.InvalidIdTokenError("Invalid token", None)
             
@@ -184,7 +184,7 @@ def test_invalid_token(app):
 def test_revoked_token(app):
     """Test when token is revoked"""
     with app.test_request_context(headers={"Authorization": "Bearer revoked_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             # Fix: Add required 'cause' argument
             mock_verify.side_effect = auth.RevokedIdTokenError("Token revoked")
             
@@ -202,7 +202,7 @@ def test_revoked_token(app):
 def test_other_exception(app):
     """Test when an unexpected exception occurs"""
     with app.test_request_context(headers={"Authorization": "Bearer token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             mock_verify.side_effect = Exception("Unexpected error")
             
             @auth_required
@@ -218,7 +218,7 @@ def test_other_exception(app):
 def test_decorator_without_parentheses(app, mock_user):
     """Test decorator when used as @auth_required"""
     with app.test_request_context(headers={"Authorization": "Bearer valid_token"}):
-        with patch('firebase_admin.auth.verify_id_token') as mock_verify:
+        with patch('middleware.auth.verify_id_token') as mock_verify:
             mock_verify.return_value = {"uid": "test_uid"}
             
             # Patch the User module directly instead of User.query
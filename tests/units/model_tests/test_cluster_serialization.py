@@ -0,0 +1,140 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import event
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+from routes.cluster import bp as cluster_bp
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+def add_clusters(count, rentals_each=3, first=0):
+    """Clusters on their own listing, each with an active rental and some history"""
+    user = User.query.filter_by(firebase_uid="uid-1").one()
+    start = datetime(2026, 1, 1)
+    for n in range(first, first + count):
+        host = Host(name=f"host-{n}")
+        config = GPUConfiguration(f"hash-{n}", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+        db.session.add_all([host, config])
+        db.session.flush()
+        listing = GPUListing(f"g4dn-{n}", config.id, 1.0, host.id)
+        db.session.add(listing)
+        db.session.flush()
+        cluster = Cluster(name=f"cluster-{n}", user_id=user.id, current_gpu_id=listing.id)
+        db.session.add(cluster)
+        db.session.flush()
+        for r in range(rentals_each):
+            rental = RentalGPU(cluster_id=cluster.id, gpu_listing_id=listing.id, user_id=user.id,
+                               configuration={}, price=1.0)
+            rental.start_time = start + timedelta(days=r)
+            last = r == rentals_each - 1
+            rental.status = "active" if last else "completed"
+            rental.end_time = None if last else rental.start_time + timedelta(hours=1)
+            db.session.add(rental)
+    db.session.commit()
+
+
+@pytest.fixture
+def blueprints():
+    return [(cluster_bp, "/api/clusters")]
+
+
+@pytest.fixture
+def selects(app):
+    """Counts SELECT statements"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def list_clusters(app, selects):
+    del selects[:]
+    response = app.test_client().get("/api/clusters/", headers=HEADERS)
+    assert response.status_code == 200
+    return response.get_json(), len(selects)
+
+
+@pytest.mark.unit_tests
+class TestClusterListing:
+    """Tests for the batched cluster serialization"""
+
+    def test_query_count_is_constant(self, app, selects):
+        list_clusters(app, selects)  # Warm the identity cache
+        with app.app_context():
+            add_clusters(2)
+        small, small_queries = list_clusters(app, selects)
+
+        with app.app_context():
+            add_clusters(8, rentals_each=6, first=2)
+        large, large_queries = list_clusters(app, selects)
+
+        assert (len(small), len(large)) == (2, 10)
+        assert small_queries == large_queries
+
+    def test_payload(self, app):
+        with app.app_context():
+            add_clusters(1)
+        cluster = app.test_client().get("/api/clusters/", headers=HEADERS).get_json()[0]
+
+        assert cluster["current_gpu"]["provider"] == "host-0"
+        assert cluster["rental_gpu"]["provider"] == "host-0"
+        assert cluster["rental_gpu"]["start_time"] == "2026-01-03T00:00:00+00:00"
+        assert "rental_history" not in cluster
+        assert cluster["rental_history_summary"] == {
+            "total": 3,
+            "active": 1,
+            "last_start_time": "2026-01-03T00:00:00+00:00",
+            "last_end_time": "2026-01-02T01:00:00+00:00",
+        }
+
+    def test_single_cluster_matches_listing(self, app):
+        with app.app_context():
+            add_clusters(2)
+            db.session.get(Cluster, 1).rental_history.filter_by(status="active").update({"status": "completed"})
+            db.session.commit()
+            listed = Cluster.serialize_many(Cluster.for_user(1).all())
+            assert [db.session.get(Cluster, c["id"]).to_dict() for c in listed] == listed
+            assert listed[0]["rental_gpu"] is None
+            assert listed[0]["rental_history_summary"]["active"] == 0
+
+    def test_empty_cluster(self, app):
+        with app.app_context():
+            db.session.add(Cluster(name="empty", user_id=1))
+            db.session.commit()
+        cluster = app.test_client().get("/api/clusters/", headers=HEADERS).get_json()[0]
+        assert cluster["rental_gpu"] is None
+        assert cluster["rental_history_summary"]["total"] == 0
+
+
+@pytest.mark.unit_tests
+def test_history_is_paginated(app):
+    with app.app_context():
+        add_clusters(1, rentals_each=5)
+    client = app.test_client()
+
+    first = client.get("/api/clusters/1/history?per_page=2", headers=HEADERS).get_json()
+    assert (first["total"], first["pages"], first["page"]) == (5, 3, 1)
+    assert [r["start_time"][:10] for r in first["rentals"]] == ["2026-01-05", "2026-01-04"]
+    assert first["summary"]["total"] == 5
+
+    last = client.get("/api/clusters/1/history?per_page=2&page=3", headers=HEADERS).get_json()
+    assert [r["start_time"][:10] for r in last["rentals"]] == ["2026-01-01"]
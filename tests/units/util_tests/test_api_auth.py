@@ -5,6 +5,7 @@ import pytest
 from unittest.mock import MagicMock, patch, call
 from datetime import datetime, timedelta, timezone
 from flask import Flask, jsonify, Response
+from sqlalchemy import event
 
 # Add the project root to the Python path
 project_root = str(Path(__file__).parent.parent.parent.parent)
@@ -12,6 +13,9 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.api_auth import generate_api_key, check_api_key, require_api_key, require_admin_key
+from utils.api_auth import usage_buffer, invalidate_api_key, hash_api_key, flush_api_key_usage
+from utils.rate_limit import MemoryRateStore, set_store
+from utils.database import db
 from models.api_key import APIKeyPermission, APIKey
 
 @pytest.mark.unit_tests
@@ -45,6 +49,17 @@ class TestGenerateApiKey:
 class TestApiKeyDecorator:
     """Tests for the API key checking decorator"""
     
+    @pytest.fixture(autouse=True)
+    def clear_key_state(self):
+        """Start each test with an empty key table and usage buffer"""
+        invalidate_api_key()
+        usage_buffer._counts.clear()
+        previous_store = set_store(MemoryRateStore())
+        yield
+        set_store(previous_store)
+        invalidate_api_key()
+        usage_buffer._counts.clear()
+    
     @pytest.fixture
     def mock_app(self):
         """Create a test Flask app"""
@@ -98,20 +113,28 @@ class TestApiKeyDecorator:
     def valid_api_key(self):
         """Create a valid API key record"""
         key = MagicMock()
+        key.id = 1
         key.key = "valid_test_key_123"
         key.permission = APIKeyPermission.READ.value
         key.is_active = True
         key.last_used_at = None
+        key.rate_limit_per_minute = None
+        key.rate_limit_burst = None
+        key.daily_quota = None
         return key
     
     @pytest.fixture
     def admin_api_key(self):
         """Create a valid admin API key record"""
         key = MagicMock()
+        key.id = 2
         key.key = "valid_admin_key_456"
         key.permission = APIKeyPermission.ADMIN.value
         key.is_active = True
         key.last_used_at = None
+        key.rate_limit_per_minute = None
+        key.rate_limit_burst = None
+        key.daily_quota = None
         return key
         
     def test_no_api_key_provided(self, mock_app, mock_api_key_model):
@@ -173,27 +196,101 @@ class TestApiKeyDecorator:
         assert response.json['error'] == 'Insufficient permissions'
         assert APIKeyPermission.ADMIN.value in response.json['message']
     
-    def test_valid_key_updates_timestamp(self, mock_app, mock_api_key_model, mock_db, valid_api_key):
-        """Test that last_used_at is updated on successful authentication"""
+    def test_valid_key_usage_buffered(self, mock_app, mock_api_key_model, mock_db, valid_api_key):
+        """Test that usage is counted in memory instead of committed per request"""
         client = mock_app.test_client()
         
         # Configure mock to return a valid key
         mock_api_key_model.query.filter_by().first.return_value = valid_api_key
         
-        # Make request with valid key
-        before_request = datetime.now(timezone.utc)
-        response = client.get('/protected', headers={"X-API-Key": valid_api_key.key})
+        # Make requests with valid key
+        for _ in range(3):
+            response = client.get('/protected', headers={"X-API-Key": valid_api_key.key})
+            assert response.status_code == 200
         
-        # Verify response
-        assert response.status_code == 200
+        # Usage is buffered for the periodic flush; nothing is committed per request
+        count, used_at = usage_buffer._counts[valid_api_key.id]
+        assert count == 3
+        assert isinstance(used_at, datetime)
+        mock_db.session.commit.assert_not_called()
+    
+    def test_key_table_avoids_repeat_queries(self, mock_app, mock_api_key_model, valid_api_key):
+        """Test that a known key is authorized from memory after the first request"""
+        client = mock_app.test_client()
+        mock_api_key_model.query.filter_by.return_value.first.return_value = valid_api_key
+        
+        for _ in range(3):
+            assert client.get('/protected', headers={"X-API-Key": valid_api_key.key}).status_code == 200
+        
+        assert mock_api_key_model.query.filter_by.call_count == 1
+    
+    def test_unknown_key_cached_briefly(self, mock_app, mock_api_key_model):
+        """Test that repeated unknown keys don't each hit the database"""
+        client = mock_app.test_client()
+        mock_api_key_model.query.filter_by.return_value.first.return_value = None
+        
+        for _ in range(3):
+            assert client.get('/protected', headers={"X-API-Key": "unknown"}).status_code == 401
         
-        # Verify last_used_at was updated
-        assert valid_api_key.last_used_at is not None
-        assert isinstance(valid_api_key.last_used_at, datetime)
+        assert mock_api_key_model.query.filter_by.call_count == 1
+    
+    def test_invalidated_key_rechecked(self, mock_app, mock_api_key_model, valid_api_key):
+        """Test that a deactivated key stops working once its entry is invalidated"""
+        client = mock_app.test_client()
+        mock_api_key_model.query.filter_by.return_value.first.return_value = valid_api_key
+        assert client.get('/protected', headers={"X-API-Key": valid_api_key.key}).status_code == 200
         
-        # Verify database session was committed
-        mock_db.session.commit.assert_called_once()
+        mock_api_key_model.query.filter_by.return_value.first.return_value = None
+        invalidate_api_key(hash_api_key(valid_api_key.key))
+        assert client.get('/protected', headers={"X-API-Key": valid_api_key.key}).status_code == 401
     
+    def test_raw_key_not_logged(self, mock_app, mock_api_key_model, valid_api_key, caplog):
+        """Test that keys never appear in logs"""
+        client = mock_app.test_client()
+        caplog.set_level("DEBUG")
+        mock_api_key_model.query.filter_by.return_value.first.return_value = None
+        client.get('/protected', headers={"X-API-Key": "secret_key_value"})
+        mock_api_key_model.query.filter_by.return_value.first.return_value = valid_api_key
+        client.get('/admin', headers={"X-API-Key": valid_api_key.key})
+        
+        assert "secret_key_value" not in caplog.text
+        assert valid_api_key.key not in caplog.text
+
+    def test_key_rate_limit(self, mock_app, mock_api_key_model, valid_api_key):
+        """Test that a key over its burst gets a 429 with Retry-After"""
+        client = mock_app.test_client()
+        valid_api_key.rate_limit_per_minute = 60
+        valid_api_key.rate_limit_burst = 2
+        mock_api_key_model.query.filter_by.return_value.first.return_value = valid_api_key
+
+        first = client.get('/protected', headers={"X-API-Key": valid_api_key.key})
+        assert first.status_code == 200
+        assert first.headers['RateLimit-Limit'] == '2'
+        assert first.headers['RateLimit-Remaining'] == '1'
+        assert client.get('/protected', headers={"X-API-Key": valid_api_key.key}).status_code == 200
+
+        refused = client.get('/protected', headers={"X-API-Key": valid_api_key.key})
+        assert refused.status_code == 429
+        assert refused.headers['Retry-After'] == '1'
+        assert refused.headers['RateLimit-Remaining'] == '0'
+        # Refused requests aren't counted as usage
+        assert usage_buffer._counts[valid_api_key.id][0] == 2
+
+    def test_key_daily_quota(self, mock_app, mock_api_key_model, valid_api_key):
+        """Test that a key stops at its daily quota"""
+        client = mock_app.test_client()
+        valid_api_key.daily_quota = 2
+        mock_api_key_model.query.filter_by.return_value.first.return_value = valid_api_key
+
+        for _ in range(2):
+            assert client.get('/protected', headers={"X-API-Key": valid_api_key.key}).status_code == 200
+        response = client.get('/protected', headers={"X-API-Key": valid_api_key.key})
+
+        assert response.status_code == 429
+        assert response.json['message'] == 'Daily quota exceeded for this API key'
+        assert response.headers['RateLimit-Limit'] == '2'
+        assert 0 < int(response.headers['Retry-After']) <= 86400
+
     def test_require_api_key_decorator(self, mock_app, mock_api_key_model, valid_api_key):
         """Test the require_api_key convenience decorator"""
         client = mock_app.test_client()
@@ -245,4 +342,58 @@ class TestApiKeyDecorator:
             
         # Verify the decorated function keeps its metadata
         assert test_function.__name__ == 'test_function'
-        assert test_function.__doc__ == 'Test docstring'
\ No newline at end of file
+        assert test_function.__doc__ == 'Test docstring'
+
+@pytest.mark.unit_tests
+class TestUsageFlush:
+    """Tests for writing buffered API key usage"""
+
+    @pytest.fixture
+    def app(self):
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([APIKey(key="key-a", name="a"), APIKey(key="key-b", name="b")])
+            db.session.commit()
+        usage_buffer._counts.clear()
+        yield app
+        usage_buffer._counts.clear()
+
+    def test_flush_writes_counts_in_one_batch(self, app):
+        with app.app_context():
+            a, b = APIKey.query.order_by(APIKey.id).all()
+            used_at = datetime(2024, 1, 1, 12, 0)
+            for _ in range(3):
+                usage_buffer.record(a.id, used_at)
+            usage_buffer.record(b.id, used_at)
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                assert flush_api_key_usage() == 2
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+
+            assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 1
+            db.session.expire_all()
+            a, b = APIKey.query.order_by(APIKey.id).all()
+            assert (a.usage_count, b.usage_count) == (3, 1)
+            assert a.last_used_at == used_at
+            assert len(usage_buffer) == 0
+
+            # Counts accumulate across flushes
+            usage_buffer.record(a.id, used_at)
+            flush_api_key_usage()
+            db.session.expire_all()
+            assert db.session.get(APIKey, a.id).usage_count == 4
+
+    def test_failed_flush_keeps_usage(self, app):
+        with app.app_context():
+            usage_buffer.record(1)
+            with patch.object(db.session, "execute", side_effect=Exception("database down")):
+                with pytest.raises(Exception):
+                    flush_api_key_usage()
+            assert usage_buffer._counts[1][0] == 1
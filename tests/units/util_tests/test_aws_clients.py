@@ -0,0 +1,69 @@
+import sys
+import threading
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils import aws_clients
+from utils.aws_utils import AWSManager
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIATEST")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    aws_clients.clear()
+    yield
+    aws_clients.clear()
+
+
+@pytest.mark.unit_tests
+class TestAwsClients:
+    """Tests for the shared boto3 client registry"""
+
+    def test_client_shared_across_threads(self):
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(aws_clients.get_client("ec2")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len({id(client) for client in clients}) == 1
+        assert aws_clients.get_client("ec2") is clients[0]
+
+    def test_keyed_by_region_and_credentials(self, monkeypatch):
+        east = aws_clients.get_client("ec2", "us-east-1")
+        assert aws_clients.get_client("ec2", "us-west-2") is not east
+        assert east.meta.region_name == "us-east-1"
+
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIAROTATED")
+        assert aws_clients.get_client("ec2", "us-east-1") is not east
+
+    def test_tuned_config(self):
+        config = aws_clients.get_client("ec2").meta.config
+        assert config.max_pool_connections == aws_clients.Config.AWS_MAX_POOL_CONNECTIONS
+        assert config.retries["mode"] == "adaptive"
+        assert config.retries["total_max_attempts"] == aws_clients.Config.AWS_MAX_ATTEMPTS
+
+    def test_resources_per_thread(self):
+        mine = aws_clients.get_resource("ec2")
+        assert aws_clients.get_resource("ec2") is mine
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(aws_clients.get_resource("ec2")))
+        thread.start()
+        thread.join()
+        assert other[0] is not mine
+
+    def test_aws_manager_reuses_registry(self):
+        first, second = AWSManager(), AWSManager()
+        assert first.ec2_client is second.ec2_client
+        assert first.ec2_resource is second.ec2_resource
@@ -0,0 +1,70 @@
+import sys
+import threading
+from pathlib import Path
+import pytest
+from flask import Flask, current_app
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils import background
+from utils.background import PeriodicTask
+
+
+@pytest.mark.unit_tests
+class TestPeriodicTask:
+    """Tests for periodic background tasks"""
+
+    def test_runs_repeatedly_in_app_context(self):
+        app = Flask("background_app")
+        seen = []
+        ran_twice = threading.Event()
+
+        def work():
+            seen.append(current_app.name)
+            if len(seen) >= 2:
+                ran_twice.set()
+
+        task = PeriodicTask("work", 0.01, work)
+        task.start(app)
+        assert ran_twice.wait(2)
+        task.stop(2)
+        assert set(seen) == {"background_app"}
+
+    def test_failure_does_not_stop_task(self):
+        calls = []
+        recovered = threading.Event()
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("transient")
+            recovered.set()
+
+        task = PeriodicTask("flaky", 0.01, flaky)
+        task.start(Flask(__name__))
+        assert recovered.wait(2)
+        task.stop(2)
+
+    def test_run_on_exit(self):
+        calls = []
+        task = PeriodicTask("flush", 60, lambda: calls.append(1), run_on_exit=True)
+        task.start(Flask(__name__))
+        task.stop(2)
+        assert calls == [1]
+
+    def test_registering_again_keeps_one_thread(self):
+        app = Flask(__name__)
+        name = "test-reregistered"
+        try:
+            for _ in range(5):  # started again
+                task = background.register_task(name, 60, lambda: None)
+                task.start(app)
+            threads = [t for t in threading.enumerate() if t.name == f"task-{name}"]
+            assert len(threads) == 1
+            assert background.get_task(name) is task
+        finally:
+            background.get_task(name).stop(2)
+            background._tasks.pop(name, None)
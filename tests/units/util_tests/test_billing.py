@@ -0,0 +1,157 @@
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+import pytest
+from sqlalchemy import event
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import billing
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from models.deployment_cost import DeploymentCost
+from models.rental_instance import RentalInstance
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+from routes.clusters_status import bp as clusters_status_bp
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+@pytest.mark.unit_tests
+class TestBilling:
+    """Tests for pricing usage with tax and platform fee"""
+
+    def test_charge(self):
+        charge = billing.charge(2.0, 3)
+        assert charge.base_cost == Decimal("6.0")
+        assert charge.tax_amount == Decimal("0.48")
+        assert charge.platform_fee_amount == Decimal("0.30")
+        assert charge.total_cost == Decimal("6.78")
+        assert charge.to_dict() == {
+            "base_cost": 6.0,
+            "tax_rate": 0.08,
+            "tax_amount": 0.48,
+            "platform_fee_rate": 0.05,
+            "platform_fee_amount": 0.3,
+            "total_cost": 6.78,
+        }
+
+    def test_running_costs_match_charge(self):
+        now = datetime(2026, 3, 15, 12, 0)
+        starts = [now - timedelta(hours=2), now - timedelta(minutes=30), now - timedelta(hours=1)]
+        seconds, costs = billing.running_costs([2.0, 1.5, None], starts, now)
+
+        assert list(seconds) == [7200, 1800, 3600]
+        assert costs[0] == pytest.approx(float(billing.charge(2.0, 2).total_cost))
+        assert costs[1] == pytest.approx(float(billing.charge(1.5, 0.5).total_cost))
+        assert costs[2] == 0
+
+    def test_running_costs_empty(self):
+        seconds, costs = billing.running_costs([], [], datetime.utcnow())
+        assert len(seconds) == len(costs) == 0
+
+
+@pytest.fixture
+def blueprints():
+    return [(clusters_status_bp, "/api/clusters-status")]
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        host = Host(name="aws")
+        config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+        db.session.add_all([host, config])
+        db.session.flush()
+        db.session.add(GPUListing("g4dn.xlarge", config.id, 2.0, host.id))
+    return add
+
+
+def add_cluster(name, nodes=1, hours=2.0, state="running"):
+    """A cluster whose active rental (one per node) has run for hours, with its deposit"""
+    cluster = Cluster(name=name, user_id=1)
+    db.session.add(cluster)
+    db.session.flush()
+    for node_index in range(nodes):
+        rental = RentalGPU(cluster.id, 1, 1, {}, 2.0)
+        rental.status = "active"
+        rental.start_time = datetime.utcnow() - timedelta(hours=hours)
+        rental.node_index = node_index if nodes > 1 else None
+        db.session.add(rental)
+        db.session.flush()
+        transaction = Transaction(user_id=1, amount=-2.26, status="completed", description="Deposit")
+        db.session.add(transaction)
+        db.session.flush()
+        db.session.add(DeploymentCost(rental_gpu_id=rental.id, transaction_id=transaction.id,
+                                      **billing.charge(2.0, 1).to_dict()))
+        db.session.add(RentalInstance(instance_id=f"i-{rental.id}", rental_gpu_id=rental.id, state=state))
+    db.session.commit()
+    return cluster.id
+
+
+def count_queries(app, client, url):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get(url, headers=HEADERS)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    return len(statements), response
+
+
+@pytest.mark.unit_tests
+class TestClustersStatus:
+    """Tests for the batch-loaded cluster status endpoints"""
+
+    def test_status_figures(self, app):
+        with app.app_context():
+            active_id = add_cluster("training")
+            db.session.add(Cluster(name="idle", user_id=1))
+            db.session.commit()
+        response = app.test_client().get("/api/clusters-status/", headers=HEADERS)
+        data = response.json
+
+        assert (data["active_clusters_count"], data["total_clusters_count"]) == (1, 2)
+        active, idle = data["clusters"]
+        assert active["id"] == active_id and not idle["is_active"]
+        assert active["gpu_type"] == "T4" and active["gpu_vendor"] == "NVIDIA"
+        assert active["hourly_rate"] == 2.0
+        # Two hours at $2 plus 8% tax and 5% fee
+        assert active["current_cost"] == pytest.approx(4.52, abs=0.01)
+        assert active["initial_deposit"] == 2.26
+        assert active["additional_charges"] == pytest.approx(2.26, abs=0.01)
+        assert active["instance_state"] == "running"
+        assert data["total_current_cost"] == pytest.approx(4.52, abs=0.01)
+
+    def test_multi_node_costs_summed(self, app):
+        with app.app_context():
+            cluster_id = add_cluster("multi", nodes=3)
+        data = app.test_client().get(f"/api/clusters-status/{cluster_id}", headers=HEADERS).json
+        assert data["node_count"] == 3
+        assert data["current_cost"] == pytest.approx(3 * 4.52, abs=0.01)
+        assert data["initial_deposit"] == pytest.approx(3 * 2.26)
+        assert data["instance"]["state"] == "running"
+
+    def test_query_count_independent_of_clusters(self, app):
+        client = app.test_client()
+        with app.app_context():
+            add_cluster("first")
+        client.get("/api/clusters-status/", headers=HEADERS)  # Caches the user
+        one, _ = count_queries(app, client, "/api/clusters-status/")
+
+        with app.app_context():
+            for index in range(20):
+                add_cluster(f"cluster-{index}", nodes=2)
+        many, response = count_queries(app, client, "/api/clusters-status/")
+        assert response.json["active_clusters_count"] == 21
+        assert one == many == 2
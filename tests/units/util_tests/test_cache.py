@@ -11,9 +11,11 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 # Import cache functions
-from utils.cache import memory_cache, invalidate_cache, _cache
+from utils.cache import memory_cache, invalidate_cache, cache_stats, _cache, LRUCache, wait_for_refreshes
+import threading
+from unittest.mock import patch
+from flask import Flask, current_app
 
-@pytest.mark.unit_tests
 @pytest.fixture(autouse=True)
 def clear_cache():
     """Clear the cache before and after each test"""
@@ -217,4 +219,237 @@ def test_cache_key_generation():
     # Keys should contain function name and arguments
     assert any("key_test:(1,):{}" in key for key in keys)
     assert any("key_test:(2, 3):{}" in key for key in keys)
-    assert any("key_test:(4,):{'b': 5}" in key for key in keys)
\ No newline at end of file
+    assert any("key_test:(4,):{'b': 5}" in key for key in keys)
+
+@pytest.mark.unit_tests
+def test_lru_evicts_least_recently_used():
+    """Test that the cache stays within its entry budget by evicting the LRU entry"""
+    cache = LRUCache(max_entries=2, max_bytes=1024)
+    cache.set("a", "1", ttl=60)
+    cache.set("b", "2", ttl=60)
+    
+    # Touch "a" so that "b" becomes least recently used
+    assert cache.get("a") == (True, "1")
+    cache.set("c", "3", ttl=60)
+    
+    assert cache.keys() == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+@pytest.mark.unit_tests
+def test_lru_byte_budget():
+    """Test byte-size accounting and eviction by size"""
+    cache = LRUCache(max_entries=100, max_bytes=10)
+    cache.set("a", "12345", ttl=60)
+    cache.set("b", "12345", ttl=60)
+    assert cache.stats()["bytes"] == 10
+    
+    cache.set("c", "123", ttl=60)
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 8
+    
+    # Values larger than the whole budget are not cached
+    cache.set("huge", "x" * 11, ttl=60)
+    assert "huge" not in cache
+    assert cache.stats()["bytes"] == 8
+
+@pytest.mark.unit_tests
+def test_expired_entries_are_evicted():
+    """Test that expired entries are removed from the cache, not just ignored"""
+    cache = LRUCache(max_entries=10, max_bytes=1024)
+    cache.set("a", "value", ttl=0.05)
+    time.sleep(0.1)
+    
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+    assert cache.stats()["expirations"] == 1
+
+@pytest.mark.unit_tests
+def test_concurrent_misses_compute_once():
+    """Test that concurrent misses for one key collapse into a single computation"""
+    call_count = 0
+    started = threading.Event()
+    release = threading.Event()
+    
+    @memory_cache()
+    def slow_function():
+        nonlocal call_count
+        call_count += 1
+        started.set()
+        release.wait(timeout=5)
+        return "result"
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow_function())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    started.wait(timeout=5)
+    time.sleep(0.05)  # Let the other threads pile up on the in-flight computation
+    release.set()
+    for t in threads:
+        t.join(timeout=5)
+    
+    assert call_count == 1
+    assert results == ["result"] * 8
+
+@pytest.mark.unit_tests
+def test_failed_computation_is_not_cached():
+    """Test that an exception propagates to the caller and nothing is cached"""
+    call_count = 0
+    
+    @memory_cache()
+    def failing_function():
+        nonlocal call_count
+        call_count += 1
+        raise ValueError("boom")
+    
+    with pytest.raises(ValueError):
+        failing_function()
+    with pytest.raises(ValueError):
+        failing_function()
+    assert call_count == 2
+    assert len(_cache) == 0
+
+@pytest.mark.unit_tests
+def test_cache_stats_counters():
+    """Test that hit and miss counters are exposed"""
+    @memory_cache()
+    def stats_function(x):
+        return x
+    
+    before = cache_stats()
+    stats_function(1)
+    stats_function(1)
+    stats_function(2)
+    after = cache_stats()
+    
+    assert after["misses"] - before["misses"] == 2
+    assert after["hits"] - before["hits"] == 1
+    assert after["entries"] == 2
+
+
+@pytest.mark.unit_tests
+def test_stale_value_served_while_refreshing():
+    """Test that an expired entry is served while one background thread recomputes it"""
+    call_count = 0
+    release = threading.Event()
+
+    @memory_cache(expiration=0.1, stale_ttl=10)
+    def slow_function():
+        nonlocal call_count
+        call_count += 1
+        if call_count > 1:
+            release.wait(5)
+        return call_count
+
+    assert slow_function() == 1
+    time.sleep(0.15)
+
+    # Every caller gets the stale value immediately; only one refresh runs
+    assert [slow_function() for _ in range(5)] == [1] * 5
+    release.set()
+    wait_for_refreshes(5)
+    assert call_count == 2
+    assert slow_function() == 2
+
+
+@pytest.mark.unit_tests
+def test_refresh_ahead_recomputes_before_expiry():
+    """Test that entries requested shortly before expiry are refreshed in the background"""
+    call_count = 0
+
+    @memory_cache(expiration=0.5, refresh_ahead=0.45)
+    def sample_function():
+        nonlocal call_count
+        call_count += 1
+        return call_count
+
+    assert sample_function() == 1
+    time.sleep(0.1)
+    assert sample_function() == 1  # Still fresh, but within the refresh window
+    wait_for_refreshes(5)
+    assert call_count == 2
+    assert sample_function() == 2
+
+
+@pytest.mark.unit_tests
+def test_failed_refresh_keeps_stale_value():
+    """Test that a failing background refresh leaves the stale entry in place"""
+    call_count = 0
+
+    @memory_cache(expiration=0.1, stale_ttl=10)
+    def flaky_function():
+        nonlocal call_count
+        call_count += 1
+        if call_count > 1:
+            raise ValueError("upstream down")
+        return "ok"
+
+    assert flaky_function() == "ok"
+    time.sleep(0.15)
+    assert flaky_function() == "ok"
+    wait_for_refreshes(5)
+    assert flaky_function() == "ok"
+
+
+@pytest.mark.unit_tests
+def test_previous_version_served_after_bump():
+    """Test that a catalog version bump serves the previous entry while recomputing"""
+    version = [1]
+    call_count = 0
+
+    @memory_cache(expiration=60, versioned=True, stale_ttl=60)
+    def catalog_function():
+        nonlocal call_count
+        call_count += 1
+        return f"v{version[0]}"
+
+    with patch('utils.cache.current_catalog_version', side_effect=lambda: version[0]):
+        assert catalog_function() == "v1"
+        version[0] = 2
+        assert catalog_function() == "v1"
+        wait_for_refreshes(5)
+        assert catalog_function() == "v2"
+    assert call_count == 2
+
+
+@pytest.mark.unit_tests
+def test_background_refresh_runs_in_app_context():
+    """Test that background recomputes see the caller's Flask app"""
+    app = Flask("refresh_app")
+    seen = []
+
+    @memory_cache(expiration=0.05, stale_ttl=10)
+    def app_function():
+        seen.append(current_app.name)
+        return len(seen)
+
+    with app.app_context():
+        app_function()
+        time.sleep(0.1)
+        app_function()
+    wait_for_refreshes(5)
+    assert seen == ["refresh_app", "refresh_app"]
+
+
+@pytest.mark.unit_tests
+def test_error_responses_not_cached():
+    """Test that a view's error response is recomputed rather than served from cache"""
+    app = Flask("error_app")
+    results = [({"error": "database unavailable"}, 500), {"gpus": []}]
+
+    @memory_cache(expiration=60)
+    def view():
+        return results.pop(0)
+
+    with app.app_context():
+        assert view() == ({"error": "database unavailable"}, 500)
+        assert view() == {"gpus": []}
+        assert view() == {"gpus": []}
+
+        @memory_cache(expiration=60)
+        def response_view():
+            return app.response_class("body")
+
+        first = response_view()
+        assert response_view() is not first
@@ -0,0 +1,253 @@
+import os
+import sys
+import time
+import threading
+import socketserver
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils import cache
+from utils.cache import memory_cache, set_backend
+from utils.cache_backends import SharedMemoryBackend, RedisBackend, RespClient, RespError
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough of the Redis protocol for the cache backend"""
+
+    def handle(self):
+        while True:
+            try:
+                command = RespClient.read_reply(self.rfile)
+            except EOFError:
+                return
+            name, args = command[0].decode().upper(), command[1:]
+            try:
+                reply = self.server.dispatch(name, args)
+            except Exception as e:
+                self.wfile.write(b"-ERR %s\r\n" % str(e).encode())
+                continue
+            self.wfile.write(self.encode(reply))
+
+    @classmethod
+    def encode(cls, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(cls.encode(item) for item in reply)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Local stand-in for a Redis server"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data = {}  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def dispatch(self, name, args):
+        with self.lock:
+            if name == "PING":
+                return "PONG"
+            if name == "GET":
+                entry = self._live(args[0])
+                return entry[0] if entry else None
+            if name == "SET":
+                key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+                if "NX" in options and self._live(key):
+                    return None
+                expires_at = None
+                if "PX" in options:
+                    expires_at = time.time() + int(options[options.index("PX") + 1]) / 1000
+                self.data[key] = (value, expires_at)
+                return "OK"
+            if name == "DEL":
+                return sum(1 for key in args if self.data.pop(key, None) is not None)
+            if name == "SCAN":
+                prefix = args[2][:-1] if len(args) > 2 else b""
+                return [b"0", [k for k in list(self.data) if k.startswith(prefix) and self._live(k)]]
+            raise ValueError(f"unknown command '{name}'")
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_backend(redis_server):
+    host, port = redis_server.server_address
+    return RedisBackend(url=f"redis://{host}:{port}/0")
+
+
+@pytest.fixture
+def shared_backend(tmp_path):
+    return SharedMemoryBackend(path=str(tmp_path / "cache"), max_entries=3, max_bytes=1024 * 1024)
+
+
+@pytest.fixture
+def use_backend():
+    """Swap the memory_cache backend for the duration of a test"""
+    previous = cache.get_backend()
+    yield lambda backend: set_backend(backend)
+    set_backend(previous)
+
+
+@pytest.mark.unit_tests
+class TestSharedMemoryBackend:
+    """Tests for the mmap backend shared by workers on one host"""
+
+    def test_roundtrip_and_miss(self, shared_backend):
+        shared_backend.set("key", {"gpus": [1, 2, 3]}, ttl=60)
+        assert shared_backend.get("key") == (True, {"gpus": [1, 2, 3]})
+        assert shared_backend.get("other") == (False, None)
+        assert shared_backend.stats()["hits"] == 1
+        assert shared_backend.stats()["misses"] == 1
+
+    def test_visible_to_other_instances(self, shared_backend):
+        """A second backend on the same path stands in for another worker process"""
+        other_worker = SharedMemoryBackend(path=shared_backend.path)
+        shared_backend.set("key", "value", ttl=60)
+        assert other_worker.get("key") == (True, "value")
+        other_worker.delete("key")
+        assert shared_backend.get("key") == (False, None)
+
+    def test_expiry(self, shared_backend):
+        shared_backend.set("key", "value", ttl=0.05)
+        time.sleep(0.1)
+        assert shared_backend.get("key") == (False, None)
+        assert shared_backend.keys() == []
+
+    def test_prune_keeps_entry_budget(self, shared_backend):
+        for i in range(5):
+            shared_backend.set(f"key{i}", i, ttl=60)
+            time.sleep(0.01)
+        shared_backend.prune()
+        assert sorted(shared_backend.keys()) == ["key2", "key3", "key4"]
+        assert shared_backend.stats()["evictions"] == 2
+
+    def test_lock_files_are_bounded(self, tmp_path):
+        backend = SharedMemoryBackend(path=str(tmp_path / "cache"), lock_stripes=4)
+        for i in range(50):
+            with backend.lock(f"catalog:v{i}:gpus"):
+                pass
+        lock_files = [name for name in os.listdir(backend.path) if "lock" in name]
+        assert 0 < len(lock_files) <= 4
+
+    def test_clear(self, shared_backend):
+        shared_backend.set("a", 1, ttl=60)
+        shared_backend.set("b", 2, ttl=60)
+        shared_backend.clear()
+        assert shared_backend.keys() == []
+
+    def test_memory_cache_uses_backend(self, shared_backend, use_backend):
+        use_backend(shared_backend)
+        call_count = 0
+
+        @memory_cache()
+        def cached_function(x):
+            nonlocal call_count
+            call_count += 1
+            return x * 2
+
+        assert cached_function(2) == 4
+        # Another worker sharing the host reads the same entry
+        assert SharedMemoryBackend(path=shared_backend.path).keys() == [
+            next(k for k in shared_backend.keys() if "cached_function" in k)
+        ]
+        assert cached_function(2) == 4
+        assert call_count == 1
+
+
+@pytest.mark.unit_tests
+class TestRedisBackend:
+    """Tests for the Redis-protocol backend against a local stand-in server"""
+
+    def test_roundtrip_and_miss(self, redis_backend):
+        redis_backend.set("key", {"gpus": [1, 2]}, ttl=60)
+        assert redis_backend.get("key") == (True, {"gpus": [1, 2]})
+        assert redis_backend.get("missing") == (False, None)
+
+    def test_ttl(self, redis_backend):
+        redis_backend.set("key", "value", ttl=0.05)
+        time.sleep(0.1)
+        assert redis_backend.get("key") == (False, None)
+
+    def test_keys_and_clear(self, redis_backend):
+        redis_backend.set("a", 1, ttl=60)
+        redis_backend.set("b", 2, ttl=60)
+        assert sorted(redis_backend.keys()) == ["a", "b"]
+        redis_backend.clear()
+        assert redis_backend.keys() == []
+
+    def test_lock_is_exclusive(self, redis_backend, redis_server):
+        with redis_backend.lock("key"):
+            assert any(k.endswith(b"lock:key") for k in redis_server.data)
+            # A second holder can't take it while held
+            assert redis_backend.client.execute(
+                "SET", redis_backend.prefix + "lock:key", "other", "NX", "PX", 1000
+            ) is None
+        assert not any(k.endswith(b"lock:key") for k in redis_server.data)
+
+    def test_error_reply(self, redis_backend):
+        with pytest.raises(RespError):
+            redis_backend.client.execute("FLUSHALL")
+
+    def test_memory_cache_shared_across_workers(self, redis_server, use_backend):
+        host, port = redis_server.server_address
+        url = f"redis://{host}:{port}/0"
+        call_count = 0
+
+        @memory_cache()
+        def cached_function():
+            nonlocal call_count
+            call_count += 1
+            return "result"
+
+        # Two independent backends stand in for two worker processes
+        use_backend(RedisBackend(url=url))
+        assert cached_function() == "result"
+        use_backend(RedisBackend(url=url))
+        assert cached_function() == "result"
+        assert call_count == 1
+
+
+@pytest.mark.unit_tests
+@pytest.mark.parametrize("backend_fixture", ["shared_backend", "redis_backend"])
+def test_lock_timeout_computes_without_the_lock(request, backend_fixture):
+    """A stuck lock holder delays other callers by the timeout but never fails them"""
+    backend = request.getfixturevalue(backend_fixture)
+    waits = []
+    with backend.lock("key"):
+        for _ in range(2):
+            start = time.time()
+            with backend.lock("key", timeout=0.2):
+                waits.append(time.time() - start)
+    # The second caller still waited: the first didn't release the holder's lock
+    assert len(waits) == 2
+    assert min(waits) >= 0.2
+    with backend.lock("key", timeout=0.2):
+        pass
@@ -0,0 +1,146 @@
+import sys
+from pathlib import Path
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils import catalog_version, identity
+from utils.catalog_version import (
+    current_catalog_version,
+    set_catalog_version,
+    reset_catalog_version,
+    notify_catalog_version,
+    handle_notification,
+)
+from utils.cache import memory_cache, invalidate_cache
+from utils.pg_listener import NotificationListener, libpq_dsn
+
+
+@pytest.fixture(autouse=True)
+def fresh_version():
+    """Start every test without a known catalog version or listener"""
+    reset_catalog_version()
+    invalidate_cache()
+    with patch('utils.catalog_version.get_listener', return_value=None):
+        yield
+    reset_catalog_version()
+
+
+@pytest.fixture
+def mock_load():
+    with patch('utils.catalog_version.load_catalog_version') as mock_load:
+        yield mock_load
+
+
+@pytest.mark.unit_tests
+class TestCatalogVersion:
+    """Tests for tracking the catalog version served by a worker"""
+
+    def test_versions_only_move_forward(self, mock_load):
+        assert set_catalog_version(5) is True
+        assert set_catalog_version(3) is False
+        assert set_catalog_version("6") is True
+        assert current_catalog_version() == 6
+        mock_load.assert_not_called()
+
+    def test_loaded_on_first_use(self, mock_load):
+        mock_load.return_value = 4
+        assert current_catalog_version() == 4
+        assert current_catalog_version() == 4
+        mock_load.assert_called_once()
+
+    def test_polled_without_listener(self, mock_load):
+        mock_load.return_value = 4
+        current_catalog_version()
+        mock_load.return_value = 5
+        with patch.object(catalog_version.Config, 'CATALOG_VERSION_POLL_INTERVAL', 0):
+            assert current_catalog_version() == 5
+
+    def test_not_polled_while_listening(self, mock_load):
+        listener = MagicMock()
+        listener.connected.is_set.return_value = True
+        mock_load.return_value = 4
+        current_catalog_version()
+        mock_load.return_value = 5
+        with patch('utils.catalog_version.get_listener', return_value=listener), \
+                patch.object(catalog_version.Config, 'CATALOG_VERSION_POLL_INTERVAL', 0):
+            assert current_catalog_version() == 4
+        mock_load.assert_called_once()
+
+    def test_load_failure_falls_back(self, mock_load):
+        mock_load.side_effect = Exception("no database")
+        assert current_catalog_version() == 0
+
+    def test_notification_updates_version(self, mock_load):
+        set_catalog_version(1)
+        handle_notification("2")
+        handle_notification("not-a-version")
+        assert current_catalog_version() == 2
+
+    def test_notify_only_on_postgresql(self):
+        session = MagicMock()
+        session.get_bind.return_value.dialect.name = "postgresql"
+        notify_catalog_version(session, 9)
+        args = session.execute.call_args[0]
+        assert "pg_notify" in str(args[0])
+        assert args[1] == {"channel": "catalog_version", "version": "9"}
+
+        session = MagicMock()
+        session.get_bind.return_value.dialect.name = "sqlite"
+        notify_catalog_version(session, 9)
+        session.execute.assert_not_called()
+
+    def test_versioned_cache_switches_on_bump(self, mock_load):
+        set_catalog_version(1)
+        call_count = 0
+
+        @memory_cache(expiration=3600, versioned=True)
+        def cached_function():
+            nonlocal call_count
+            call_count += 1
+            return call_count
+
+        assert cached_function() == 1
+        assert cached_function() == 1
+        handle_notification("2")
+        assert cached_function() == 2
+        assert call_count == 2
+
+
+@pytest.mark.unit_tests
+class TestNotificationListener:
+    """Tests for the LISTEN/NOTIFY dispatcher"""
+
+    def test_dispatch_to_channel_handlers(self):
+        listener = NotificationListener("postgresql://localhost/neotix")
+        received = []
+        listener.subscribe("catalog_version", received.append)
+        listener.subscribe("other", lambda payload: received.append(("other", payload)))
+        listener.dispatch("catalog_version", "3")
+        assert received == ["3"]
+
+    def test_failing_handler_does_not_stop_others(self):
+        listener = NotificationListener("postgresql://localhost/neotix")
+        received = []
+        listener.subscribe("catalog_version", MagicMock(side_effect=Exception("boom")))
+        listener.subscribe("catalog_version", received.append)
+        listener.dispatch("catalog_version", "3")
+        assert received == ["3"]
+
+    def test_registering_again_replaces_handlers(self):
+        listener = NotificationListener("postgresql://localhost/neotix")
+        app = MagicMock()
+        for _ in range(5):  # registering again, e.g. a second start_background()
+            catalog_version.register(app, listener)
+            identity.register(listener)
+        assert len(listener._handlers[catalog_version.CHANNEL]) == 1
+        assert len(listener._handlers[identity.CHANNEL]) == 1
+        assert len(listener._connect_hooks) == 2
+
+    def test_libpq_dsn_drops_driver(self):
+        dsn = libpq_dsn("postgresql+psycopg2://user:secret@db:5432/neotix")
+        assert dsn == "postgresql://user:secret@db:5432/neotix"
@@ -0,0 +1,183 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import event
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import spend_rollup
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from models.user_spend_daily import UserSpendDaily
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+from routes import financial_dashboard
+from routes.financial_dashboard import bp as financial_dashboard_bp
+
+NOW = datetime(2026, 3, 15, 12, 0)
+
+
+@pytest.fixture
+def blueprints():
+    return [(financial_dashboard_bp, "/api/financial")]
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        user.balance = 50.0
+        other = User(firebase_uid="uid-2", email="b@example.com", first_name="Bo", last_name="M")
+        host = Host(name="aws")
+        config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+        db.session.add_all([other, host, config])
+        db.session.flush()
+        listing = GPUListing("g4dn.xlarge", config.id, 2.0, host.id)
+        db.session.add(listing)
+        db.session.flush()
+        cluster = Cluster(name="training", user_id=user.id)
+        db.session.add(cluster)
+        db.session.flush()
+        rental = RentalGPU(cluster.id, listing.id, user.id, {}, 2.0)
+        rental.status = "active"
+        rental.start_time = NOW - timedelta(hours=2)
+        db.session.add(rental)
+
+        def spend(days_ago, amount, description, user_id=user.id):
+            db.session.add(Transaction(user_id=user_id, amount=amount, status="completed",
+                                       description=description,
+                                       created_at=NOW - timedelta(days=days_ago)))
+
+        spend(1, -10.0, "GPU Rental Initial Deposit: T4 - On-demand usage")
+        spend(1, -5.0, "GPU Rental Final Charge: T4 - 5 hours used")
+        spend(3, -20.0, "GPU Rental Initial Deposit: T4 - On-demand usage")
+        spend(20, -7.0, "Support plan")
+        spend(40, -100.0, "GPU Rental Final Charge: T4 - 90 hours used")  # February
+        spend(2, 500.0, "Add $500 to balance")  # Top-ups aren't spending
+        spend(1, -999.0, "Someone else", user_id=other.id)
+    return add
+
+
+@pytest.fixture
+def frozen_now(monkeypatch):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return NOW
+    monkeypatch.setattr(financial_dashboard, "datetime", FrozenDatetime)
+
+
+@pytest.mark.unit_tests
+def test_dashboard_figures(app, frozen_now):
+    response = app.test_client().get("/api/financial/", headers={"Authorization": "Bearer token"})
+    assert response.status_code == 200
+    data = response.json
+
+    assert data["current_month"]["costs"] == pytest.approx(35.0)
+    # February: 107.0
+    assert data["current_month"]["month_over_month_percentage"] == pytest.approx((35 - 107) / 107 * 100)
+    assert data["spending_periods"] == {
+        "last_7_days": pytest.approx(35.0),
+        "last_30_days": pytest.approx(42.0),
+        "last_90_days": pytest.approx(142.0),
+    }
+    assert data["daily_spending_trend"] == [
+        {"date": "2026-02-23", "amount": pytest.approx(7.0)},
+        {"date": "2026-03-12", "amount": pytest.approx(20.0)},
+        {"date": "2026-03-14", "amount": pytest.approx(15.0)},
+    ]
+    assert data["top_spending_categories"] == [
+        {"category": "GPU Rental Initial Deposit", "amount": pytest.approx(30.0)},
+        {"category": "Support plan", "amount": pytest.approx(7.0)},
+        {"category": "GPU Rental Final Charge", "amount": pytest.approx(5.0)},
+    ]
+    # Two hours at $2 plus 8% tax and 5% fee
+    assert data["active_costs"] == pytest.approx(4.52)
+
+
+@pytest.mark.unit_tests
+def test_dashboard_takes_two_queries(app, frozen_now):
+    client = app.test_client()
+    headers = {"Authorization": "Bearer token"}
+    client.get("/api/financial/", headers=headers)  # Caches the user
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get("/api/financial/", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 2
+
+
+def rollup():
+    return {
+        (row.user_id, row.day.isoformat(), row.category): (row.amount, row.transaction_count)
+        for row in UserSpendDaily.query
+    }
+
+
+@pytest.mark.unit_tests
+def test_budget_reads_rollup(app, frozen_now):
+    response = app.test_client().get("/api/financial/budget", headers={"Authorization": "Bearer token"})
+    assert response.json["current_usage"] == pytest.approx(35.0)
+    assert response.json["remaining_budget"] == pytest.approx(465.0)
+
+
+@pytest.mark.unit_tests
+class TestSpendRollup:
+    """Tests for the daily spending rollup"""
+
+    def test_maintained_on_write(self, app):
+        with app.app_context():
+            assert rollup()[(1, "2026-03-12", "GPU Rental Initial Deposit")] == (20.0, 1)
+            assert rollup()[(1, "2026-03-14", "GPU Rental Initial Deposit")] == (10.0, 1)
+            # Credits aren't spending
+            assert not [key for key in rollup() if key[2].startswith("Add $")]
+
+            # Counted once it completes, not while pending
+            pending = Transaction(user_id=1, amount=-3.0, status="pending",
+                                  description="GPU Rental Final Charge: T4 - 1 hours used",
+                                  created_at=NOW - timedelta(days=3))
+            db.session.add(pending)
+            db.session.commit()
+            assert (1, "2026-03-12", "GPU Rental Final Charge") not in rollup()
+            pending.status = "completed"
+            db.session.commit()
+            pending.description = "edited"
+            db.session.commit()
+            assert rollup()[(1, "2026-03-12", "GPU Rental Final Charge")] == (3.0, 1)
+
+    def test_rolled_back_with_transaction(self, app):
+        with app.app_context():
+            before = rollup()
+            db.session.add(Transaction(user_id=1, amount=-4.0, status="completed",
+                                       description="Support plan", created_at=NOW))
+            db.session.flush()
+            db.session.rollback()
+            assert rollup() == before
+
+    def test_backfill_matches(self, app):
+        with app.app_context():
+            maintained = rollup()
+            UserSpendDaily.query.delete()
+            db.session.commit()
+            assert spend_rollup.backfill(user_id=2) == 1
+            assert list(rollup()) == [(2, "2026-03-14", "Someone else")]
+            assert spend_rollup.backfill() == len(maintained)
+            assert rollup() == maintained
+
+
+@pytest.mark.unit_tests
+def test_category_of():
+    assert spend_rollup.category_of("GPU Rental Final Charge: T4 - 3 hours used") == "GPU Rental Final Charge"
+    assert spend_rollup.category_of("Support plan") == "Support plan"
+    assert spend_rollup.category_of(None) == "Other"
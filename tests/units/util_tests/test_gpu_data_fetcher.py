@@ -13,6 +13,7 @@ if project_root not in sys.path:
 
 from utils.gpu_data_fetcher import hash_gpu_configuration, fetch_gpu_data
 from models.gpu_listing import GPUListing, GPUPricePoint, GPUPriceHistory, Host, GPUConfiguration
+from models.catalog import CatalogVersion, MarketStatsSnapshot
 
 @pytest.fixture
 def mock_gpu_vendor():
@@ -191,7 +192,7 @@ class TestFetchGpuData:
         fetch_gpu_data()
         
         # Verify only one set of database operations occurred (for the GPU offer)
-        assert mock_db_session.session.add.call_count == 5 # Host, Config, Listing, History and PricePoint
+        assert mock_db_session.session.add.call_count == 7 # Host, Config, Listing, History, PricePoint, CatalogVersion and MarketStatsSnapshot
         mock_db_session.session.commit.assert_called_once()
         
     def test_single_offer_processing(self, mock_gpuhunt, mock_db_session, mock_offer_factory):
@@ -423,4 +424,64 @@ class TestFetchGpuData:
             fetch_gpu_data()
             
         # Verify rollback was called
-        mock_db_session.session.rollback.assert_called_once()
\ No newline at end of file
+        mock_db_session.session.rollback.assert_called_once()
+
+    def test_market_snapshot_recorded(self, mock_gpuhunt, mock_db_session, mock_offer_factory):
+        """Test that each run records a catalog version and its market snapshot"""
+        mock_gpuhunt.query.return_value = [
+            mock_offer_factory(provider="aws", gpu_name="A100", price=4.0, spot=False),
+            mock_offer_factory(provider="aws", gpu_name="A100", price=2.0, spot=True),
+            mock_offer_factory(provider="gcp", gpu_name="T4", price=0.5, spot=False),
+        ]
+
+        def add_side_effect(obj):
+            if isinstance(obj, CatalogVersion):
+                obj.id = 12
+
+        mock_db_session.session.add.side_effect = add_side_effect
+
+        fetch_gpu_data()
+
+        add_calls = mock_db_session.session.add.call_args_list
+        versions = [c[0][0] for c in add_calls if isinstance(c[0][0], CatalogVersion)]
+        snapshots = [c[0][0] for c in add_calls if isinstance(c[0][0], MarketStatsSnapshot)]
+        assert len(versions) == 1
+        assert versions[0].offer_count == 3
+        assert versions[0].provider_count == 2
+        assert len(snapshots) == 1
+        assert snapshots[0].catalog_version_id == 12
+        assert snapshots[0].total_listings == 3
+        models = {m["model"]: m for m in snapshots[0].stats["model_statistics"]}
+        assert models["A100"]["spot_discount"] == 0.5
+
+    def test_catalog_version_published(self, mock_gpuhunt, mock_db_session, mock_offer_factory):
+        """Test that workers are notified of the new catalog version only once it is committed"""
+        mock_gpuhunt.query.return_value = [mock_offer_factory()]
+
+        def add_side_effect(obj):
+            if isinstance(obj, CatalogVersion):
+                obj.id = 7
+
+        mock_db_session.session.add.side_effect = add_side_effect
+        events = []
+        mock_db_session.session.commit.side_effect = lambda: events.append("commit")
+
+        with patch('utils.gpu_data_fetcher.notify_catalog_version') as mock_notify, \
+                patch('utils.gpu_data_fetcher.set_catalog_version') as mock_set_version:
+            mock_notify.side_effect = lambda session, version: events.append(("notify", version))
+            mock_set_version.side_effect = lambda version: events.append(("set", version))
+            fetch_gpu_data()
+
+        assert events == [("notify", 7), "commit", ("set", 7)]
+        mock_notify.assert_called_once_with(mock_db_session.session, 7)
+
+    def test_catalog_version_not_published_on_failure(self, mock_gpuhunt, mock_db_session, mock_offer_factory):
+        """Test that a failed ingest does not move workers to a new version"""
+        mock_gpuhunt.query.return_value = [mock_offer_factory()]
+        mock_db_session.session.commit.side_effect = Exception("Database error")
+
+        with patch('utils.gpu_data_fetcher.set_catalog_version') as mock_set_version:
+            with pytest.raises(Exception):
+                fetch_gpu_data()
+
+        mock_set_version.assert_not_called()
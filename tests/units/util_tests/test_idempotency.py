@@ -0,0 +1,166 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from flask import jsonify
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import balance, idempotency
+from models.user import User
+from models.cluster import Cluster
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+from models.idempotency_key import IdempotencyKey
+from models.provisioning_job import ProvisioningJob
+from models.transaction import Transaction
+from middleware.auth import require_auth
+from routes.cluster import bp as cluster_bp
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture
+def blueprints():
+    return [(cluster_bp, "/api/clusters")]
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        user.balance = 100.0
+        host = Host(name="aws")
+        config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+        db.session.add_all([host, config])
+        db.session.flush()
+        listing = GPUListing("g4dn.xlarge", config.id, 1.0, host.id)
+        db.session.add(listing)
+        db.session.flush()
+        db.session.add(Cluster(name="training", user_id=user.id, current_gpu_id=listing.id))
+    return add
+
+
+@pytest.fixture
+def app(app):
+    calls = []
+
+    @app.route("/flaky", methods=["POST"])
+    @require_auth()
+    @idempotency.idempotent
+    def flaky():
+        calls.append(1)
+        return jsonify({"calls": len(calls)}), 503 if len(calls) == 1 else 200
+
+    app.calls = calls
+    return app
+
+
+def deploy(app, key=None, json=None):
+    headers = dict(HEADERS, **({"Idempotency-Key": key} if key else {}))
+    return app.test_client().post("/api/clusters/1/gpu/deploy", json=json or {}, headers=headers)
+
+
+@pytest.mark.unit_tests
+class TestIdempotencyKey:
+    """Tests for replaying responses to retried requests"""
+
+    def test_retry_replays_response(self, app):
+        first = deploy(app, key="deploy-1")
+        retry = deploy(app, key="deploy-1")
+
+        assert (first.status_code, retry.status_code) == (202, 202)
+        assert retry.json == first.json
+        assert retry.headers["Location"] == first.headers["Location"]
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        with app.app_context():
+            # Deployed and charged once
+            assert ProvisioningJob.query.count() == 1
+            assert db.session.get(User, 1).balance == pytest.approx(100 - 1.13)
+
+    def test_new_key_runs_again(self, app):
+        assert deploy(app, key="deploy-1").status_code == 202
+        # A different key is a different request: the cluster is already deploying
+        assert deploy(app, key="deploy-2").status_code == 409
+
+    def test_key_reused_for_different_request(self, app):
+        deploy(app, key="deploy-1")
+        response = deploy(app, key="deploy-1", json={"node_count": 2})
+        assert response.status_code == 422
+
+    def test_request_in_progress(self, app):
+        with app.app_context():
+            db.session.add(IdempotencyKey(user_id=1, key="deploy-1", fingerprint="x"))
+            db.session.commit()
+        # Same fingerprint as the real request, still without a response
+        with app.test_request_context("/api/clusters/1/gpu/deploy", method="POST", json={}):
+            fingerprint = idempotency._fingerprint()
+        with app.app_context():
+            IdempotencyKey.query.one().fingerprint = fingerprint
+            db.session.commit()
+
+        response = deploy(app, key="deploy-1")
+        assert response.status_code == 409
+        assert response.headers["Retry-After"] == "1"
+
+    def test_server_errors_not_stored(self, app):
+        client = app.test_client()
+        headers = dict(HEADERS, **{"Idempotency-Key": "flaky-1"})
+        assert client.post("/flaky", headers=headers).status_code == 503
+        response = client.post("/flaky", headers=headers)
+        assert (response.status_code, response.json) == (200, {"calls": 2})
+        assert client.post("/flaky", headers=headers).json == {"calls": 2}
+        assert len(app.calls) == 2
+
+    def test_purge_expired(self, app):
+        now = datetime.utcnow()
+        with app.app_context():
+            db.session.add_all([
+                IdempotencyKey(user_id=1, key="old", fingerprint="x",
+                               created_at=now - timedelta(seconds=idempotency.Config.IDEMPOTENCY_KEY_TTL + 1)),
+                IdempotencyKey(user_id=1, key="new", fingerprint="x", created_at=now),
+            ])
+            db.session.commit()
+            assert idempotency.purge_expired(now) == 1
+            assert [record.key for record in IdempotencyKey.query] == ["new"]
+
+
+@pytest.mark.unit_tests
+class TestBalance:
+    """Tests for balance changes made in SQL"""
+
+    def test_charge_and_credit(self, app):
+        with app.app_context():
+            user = db.session.get(User, 1)
+            assert balance.charge(user, 60.0) == pytest.approx(40.0)
+            # Not enough left: nothing changes
+            assert balance.charge(user, 60.0) is None
+            assert balance.credit(user, 5.0) == pytest.approx(45.0)
+            assert user.balance == pytest.approx(45.0)
+            db.session.commit()
+            assert db.session.get(User, 1).balance == pytest.approx(45.0)
+
+    def test_stale_copy_does_not_lose_updates(self, app):
+        with app.app_context():
+            stale = db.session.get(User, 1)
+            db.session.expunge(stale)
+            # Another request charged the user meanwhile
+            balance.charge(db.session.get(User, 1), 30.0)
+            db.session.commit()
+            db.session.expunge_all()
+
+            # Applied to the row as it is now, not to the stale copy's balance
+            assert balance.charge(stale, 30.0) == pytest.approx(40.0)
+            assert balance.charge(stale, 50.0) is None
+
+    def test_deploy_insufficient_balance(self, app):
+        with app.app_context():
+            db.session.get(User, 1).balance = 1.0
+            db.session.commit()
+        response = deploy(app)
+        assert response.status_code == 400
+        assert response.json["error"] == "Insufficient balance"
+        with app.app_context():
+            assert Transaction.query.count() == 0
@@ -0,0 +1,123 @@
+import sys
+from pathlib import Path
+import pytest
+from flask import g
+from sqlalchemy import event
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import identity
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from middleware.auth import get_current_user
+from utils.pg_listener import NotificationListener
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        user.balance = 10.0
+    return add
+
+
+@pytest.fixture
+def user_queries(app):
+    """Counts SELECTs against the users table"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def resolve(app, uid="uid-1", fresh=False):
+    """Resolve the user as a request would and return a plain copy of it"""
+    with app.test_request_context():
+        g.user_id = uid
+        user = get_current_user(fresh=fresh)
+        return user and {"id": user.id, "balance": user.balance, "first_name": user.first_name}
+
+
+@pytest.mark.unit_tests
+class TestIdentityCache:
+    """Tests for resolving the signed-in user across requests"""
+
+    def test_cached_across_requests(self, app, user_queries):
+        first = resolve(app)
+        second = resolve(app)
+        assert first == second
+        assert first["first_name"] == "Ada"
+        assert len(user_queries) == 1
+
+    def test_resolved_once_per_request(self, app, user_queries):
+        with app.test_request_context():
+            g.user_id = "uid-1"
+            assert get_current_user() is get_current_user()
+        assert len(user_queries) == 1
+
+    def test_cached_user_is_usable_in_session(self, app):
+        resolve(app)
+        with app.test_request_context():
+            g.user_id = "uid-1"
+            user = get_current_user()
+            assert user in db.session
+            assert user.clusters == []  # Relationships still lazy-load
+            user.first_name = "Grace"
+            db.session.commit()
+        with app.app_context():
+            assert User.query.filter_by(firebase_uid="uid-1").first().first_name == "Grace"
+
+    def test_write_invalidates(self, app, user_queries):
+        resolve(app)
+        with app.app_context():
+            user = User.query.filter_by(firebase_uid="uid-1").first()
+            user.balance = 25.0
+            db.session.commit()
+        assert resolve(app)["balance"] == 25.0
+
+    def test_delete_invalidates(self, app):
+        resolve(app)
+        with app.app_context():
+            db.session.delete(User.query.filter_by(firebase_uid="uid-1").first())
+            db.session.commit()
+        assert resolve(app) is None
+
+    def test_missing_user_not_cached(self, app, user_queries):
+        assert resolve(app, uid="missing") is None
+        assert resolve(app, uid="missing") is None
+        assert len(user_queries) == 2
+
+    def test_fresh_bypasses_cache(self, app, user_queries):
+        resolve(app)
+        with app.app_context():
+            # A bulk update skips the ORM events, like a write from another worker
+            User.query.filter_by(firebase_uid="uid-1").update({"balance": 99.0})
+            db.session.commit()
+        assert resolve(app)["balance"] == 10.0
+        assert resolve(app, fresh=True)["balance"] == 99.0
+
+    def test_notification_invalidates(self, app):
+        resolve(app)
+        with app.app_context():
+            User.query.filter_by(firebase_uid="uid-1").update({"balance": 42.0})
+            db.session.commit()
+        listener = NotificationListener("postgresql://localhost/neotix")
+        identity.register(listener)
+        listener.dispatch("user_identity", "uid-1")
+        assert resolve(app)["balance"] == 42.0
+
+    def test_unmapped_objects_not_cached(self):
+        identity.remember("uid-mock", object())
+        assert "uid-mock" not in identity._users
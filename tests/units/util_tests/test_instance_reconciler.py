@@ -0,0 +1,191 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+import pytest
+from botocore.stub import Stubber
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import aws_clients, billing
+from utils.aws_utils import AWSManager
+from utils.instance_reconciler import reconcile, record_instance
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.rental_instance import RentalInstance
+from models.transaction import Transaction
+from models.deployment_cost import DeploymentCost
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+
+
+def described(instance_id, state="running", rental_id=None, ip="203.0.113.5"):
+    tags = [{"Key": AWSManager.MANAGED_TAG, "Value": "true"}]
+    if rental_id is not None:
+        tags.append({"Key": AWSManager.RENTAL_TAG, "Value": str(rental_id)})
+    return {
+        "InstanceId": instance_id,
+        "InstanceType": "g4dn.xlarge",
+        "State": {"Name": state},
+        "PublicIpAddress": ip,
+        "PublicDnsName": f"ec2-{ip.replace('.', '-')}.compute-1.amazonaws.com",
+        "LaunchTime": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "Tags": tags,
+    }
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        cluster = Cluster(name="training", user_id=user.id)
+        db.session.add(cluster)
+        db.session.flush()
+        for instance_id in ("i-aaa", "i-bbb"):
+            rental = RentalGPU(
+                cluster_id=cluster.id, gpu_listing_id=1, user_id=user.id, configuration={}, price=1.0,
+                instance_id=instance_id,
+                ssh_keys=[{"private_key": "KEY", "instance_id": instance_id,
+                           "instance_ip": "198.51.100.1", "instance_dns": "launch-time-dns",
+                           "instance_type": "g4dn.xlarge"}],
+            )
+            rental.status = "active"
+            rental.start_time = datetime.utcnow()
+            db.session.add(rental)
+    return add
+
+
+@pytest.mark.unit_tests
+class TestReconcile:
+    """Tests for the periodic EC2 reconciliation"""
+
+    def test_caches_described_instances(self, app, ec2):
+        ec2.described = [described("i-aaa", rental_id=1), described("i-bbb", state="pending", rental_id=2)]
+        with app.app_context():
+            assert reconcile(aws=ec2) == {"instances": 2, "vanished": 0, "rentals_ended": 0}
+            row = db.session.get(RentalInstance, "i-aaa")
+            assert (row.rental_gpu_id, row.state, row.public_ip) == (1, "running", "203.0.113.5")
+            assert row.launch_time == datetime(2026, 1, 2, 3, 4, 5)  # Stored as naive UTC
+            assert db.session.get(RentalInstance, "i-bbb").state == "pending"
+        assert ec2.describe_calls == 1
+
+    def test_updates_existing_rows(self, app, ec2):
+        with app.app_context():
+            ec2.described = [described("i-aaa", rental_id=1)]
+            reconcile(aws=ec2)
+            ec2.described = [described("i-aaa", state="stopped", rental_id=1, ip="203.0.113.9")]
+            reconcile(aws=ec2)
+            row = db.session.get(RentalInstance, "i-aaa")
+            assert (row.state, row.public_ip) == ("stopped", "203.0.113.9")
+            assert RentalInstance.query.count() == 1
+
+    def test_terminated_instance_ends_rental(self, app, ec2):
+        ec2.described = [described("i-aaa", state="terminated", rental_id=1), described("i-bbb", rental_id=2)]
+        with app.app_context():
+            summary = reconcile(aws=ec2)
+            assert summary["rentals_ended"] == 1
+            ended, running = db.session.get(RentalGPU, 1), db.session.get(RentalGPU, 2)
+            assert (ended.status, ended.end_time is not None) == ("completed", True)
+            assert running.status == "active"
+
+    def test_vanished_instances(self, app, ec2):
+        now = datetime.utcnow()
+        with app.app_context():
+            record_instance("i-aaa", rental_gpu_id=1, now=now - timedelta(minutes=10))
+            # Just launched: may not be listed yet, so it is left alone
+            record_instance("i-bbb", rental_gpu_id=2, now=now)
+            db.session.commit()
+
+            summary = reconcile(aws=ec2, now=now)
+            assert (summary["vanished"], summary["rentals_ended"]) == (1, 1)
+            assert db.session.get(RentalInstance, "i-aaa").state == "terminated"
+            assert db.session.get(RentalInstance, "i-bbb").state == "running"
+            assert db.session.get(RentalGPU, 2).status == "active"
+
+    def test_ended_rental_gets_final_charge(self, app, ec2):
+        now = datetime.utcnow()
+        with app.app_context():
+            host = Host(name="aws")
+            config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+            db.session.add_all([host, config])
+            db.session.flush()
+            db.session.add(GPUListing("g4dn.xlarge", config.id, 2.0, host.id))
+            rental = db.session.get(RentalGPU, 1)
+            rental.start_time = now - timedelta(hours=2, minutes=30)
+            db.session.get(User, 1).balance = 50.0
+            deposit = Transaction(user_id=1, amount=-2.26, status="completed",
+                                  description="GPU Rental Initial Deposit: T4 - On-demand usage")
+            db.session.add(deposit)
+            db.session.flush()
+            db.session.add(DeploymentCost(rental_gpu_id=1, transaction_id=deposit.id,
+                                          **billing.charge(2.0, 1).to_dict()))
+            db.session.commit()
+
+            ec2.described = [described("i-aaa", state="terminated", rental_id=1)]
+            reconcile(aws=ec2, now=now)
+            # Billed like a terminate: three hours, less the deposit
+            final = Transaction.query.filter(Transaction.description.like("GPU Rental Final Charge%")).one()
+            assert final.amount == pytest.approx(-2 * 2.26)
+            assert db.session.get(User, 1).balance == pytest.approx(50 - 2 * 2.26)
+            assert db.session.get(RentalGPU, 1).status == "completed"
+
+
+@pytest.mark.unit_tests
+class TestSshKeyFromCache:
+    """Tests for get_ssh_key reading the cached instance view"""
+
+    @pytest.fixture(autouse=True)
+    def no_aws(self):
+        with patch("utils.aws_utils.AWSManager.__init__", side_effect=AssertionError("AWS called")):
+            yield
+
+    def test_reads_cached_state(self, app):
+        with app.app_context():
+            record_instance("i-aaa", rental_gpu_id=1, public_ip="203.0.113.7", public_dns="cached-dns")
+            db.session.commit()
+            details = db.session.get(RentalGPU, 1).get_ssh_key()
+            assert details["ssh_key"] == "KEY"
+            assert details["connection_details"]["instance_ip"] == "203.0.113.7"
+            assert details["connection_details"]["instance_state"] == "running"
+
+    def test_not_yet_reconciled_uses_launch_details(self, app):
+        with app.app_context():
+            details = db.session.get(RentalGPU, 1).get_ssh_key()
+            assert details["connection_details"]["instance_dns"] == "launch-time-dns"
+
+    def test_stopped_instance(self, app):
+        with app.app_context():
+            record_instance("i-aaa", rental_gpu_id=1, state="stopped")
+            db.session.commit()
+            with pytest.raises(Exception, match="not running"):
+                db.session.get(RentalGPU, 1).get_ssh_key()
+
+
+@pytest.mark.unit_tests
+def test_describe_managed_instances_pages(monkeypatch):
+    """One paginated describe, filtered to Neotix-tagged instances"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIATEST")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    aws_clients.clear()
+    aws = AWSManager()
+    expected = {
+        "Filters": [{"Name": "tag:neotix:managed", "Values": ["true"]}],
+        "MaxResults": 1000,
+    }
+    with Stubber(aws.ec2_client) as stubber:
+        stubber.add_response(
+            "describe_instances",
+            {"Reservations": [{"Instances": [{"InstanceId": "i-aaa"}]}], "NextToken": "page-2"},
+            expected,
+        )
+        stubber.add_response(
+            "describe_instances",
+            {"Reservations": [{"Instances": [{"InstanceId": "i-bbb"}, {"InstanceId": "i-ccc"}]}]},
+            {**expected, "NextToken": "page-2"},
+        )
+        ids = [instance["InstanceId"] for instance in aws.describe_managed_instances()]
+    aws_clients.clear()
+    assert ids == ["i-aaa", "i-bbb", "i-ccc"]
@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.instance_types import resolve
+from utils.aws_utils import AWSManager
+
+
+@pytest.mark.unit_tests
+@pytest.mark.parametrize("gpu_name, gpu_count, specs, expected", [
+    # Written out from the AWS instance type pages, not from the catalog table
+    ("T4", 1, {}, "g4dn.xlarge"),
+    ("T4", 1, {"cpu": 32}, "g4dn.8xlarge"),
+    ("T4", 4, {}, "g4dn.12xlarge"),
+    ("T4", 8, {}, "g4dn.metal"),
+    ("A10G", 1, {}, "g5.xlarge"),
+    ("A10G", 4, {"memory": 300}, "g5.24xlarge"),
+    ("A10G", 8, {}, "g5.48xlarge"),
+    ("L4", 1, {}, "g6.xlarge"),
+    ("L4", 4, {}, "g6.12xlarge"),
+    ("L40S", 1, {"memory": 64}, "g6e.2xlarge"),
+    ("L40S", 8, {}, "g6e.48xlarge"),
+    ("K80", 16, {}, "p2.16xlarge"),
+    ("V100", 1, {}, "p3.2xlarge"),
+    ("V100", 8, {"gpu_memory": 32}, "p3dn.24xlarge"),
+    ("A100", 8, {}, "p4d.24xlarge"),
+    ("A100", 8, {"gpu_memory": 80}, "p4de.24xlarge"),
+    ("H100", 8, {}, "p5.48xlarge"),
+    # Models AWS doesn't offer
+    ("RTX 4090", 1, {}, None),
+    ("RTX A6000", 1, {"gpu_memory": 48}, None),
+    ("MI300X", 8, {}, None),
+])
+def test_known_instance_types(gpu_name, gpu_count, specs, expected):
+    instance_type = resolve(gpu_name, gpu_count, **specs)
+    assert (instance_type.name if instance_type else None) == expected
+
+
+@pytest.mark.unit_tests
+class TestResolve:
+    """Tests for choosing an instance type"""
+
+    @pytest.mark.parametrize("gpu_name", ["T4", "NVIDIA T4", "nvidia t4", " t4 "])
+    def test_spellings(self, gpu_name):
+        assert resolve(gpu_name).name == "g4dn.xlarge"
+
+    def test_gpu_count_respected(self):
+        assert resolve("T4", 4).name == "g4dn.12xlarge"
+        assert resolve("A10G", 8).name == "g5.48xlarge"
+
+    def test_more_gpus_when_no_exact_count(self):
+        assert resolve("A10G", 2).name == "g5.12xlarge"
+        assert resolve("A100", 1).name == "p4d.24xlarge"
+
+    def test_specs_narrow_the_choice(self):
+        assert resolve("A100", 8, gpu_memory=80).name == "p4de.24xlarge"
+        assert resolve("L4", 1, cpu=10, memory=20).name == "g6.4xlarge"
+        assert resolve("V100", 8, memory=600).name == "p3dn.24xlarge"
+
+    def test_model_not_on_aws(self):
+        # Never another model's hardware at this listing's price
+        assert resolve("RTX 4090", 1, gpu_memory=24) is None
+        assert resolve("RTX 4090") is None
+
+    def test_unsatisfiable(self):
+        assert resolve("H100", 16) is None
+        assert resolve("T4", 1, gpu_memory=80) is None
+        assert resolve("MI300X", 32) is None
+
+
+@pytest.mark.unit_tests
+def test_aws_manager_instance_type():
+    aws = AWSManager.__new__(AWSManager)
+    assert aws.get_instance_type({"gpu_name": "NVIDIA L40S", "gpu_count": 4}) == "g6e.12xlarge"
+    assert aws.get_instance_type({"gpu_name": "A10G", "gpu_count": None}) == "g5.xlarge"
+    assert aws.get_instance_type({"gpu_name": "H100", "gpu_count": 64}) is None
+    assert aws.get_instance_type({"gpu_name": "RTX 4090", "gpu_count": 1}) is None
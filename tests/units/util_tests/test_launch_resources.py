@@ -0,0 +1,115 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pytest
+from botocore.stub import Stubber
+from cryptography.hazmat.primitives import serialization
+from flask import Flask
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import aws_clients, launch_resources
+from utils.aws_utils import AWSManager
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+FIND_GROUP = {
+    "Filters": [
+        {"Name": "group-name", "Values": ["neotix-gpu-ssh"]},
+        {"Name": "tag:neotix:managed", "Values": ["true"]},
+    ]
+}
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIATEST")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    aws_clients.clear()
+    launch_resources.clear()
+    aws = AWSManager()
+    with Stubber(aws.ec2_client) as stubber:
+        aws.stubber = stubber
+        yield aws
+        stubber.assert_no_pending_responses()
+    aws_clients.clear()
+    launch_resources.clear()
+
+
+@pytest.mark.unit_tests
+class TestSecurityGroup:
+    """Tests for the shared, tagged security group"""
+
+    def test_existing_group_looked_up_once(self, aws):
+        aws.stubber.add_response(
+            "describe_security_groups", {"SecurityGroups": [{"GroupId": "sg-shared"}]}, FIND_GROUP
+        )
+        assert aws.ensure_security_group_exists() == "sg-shared"
+        # Cached for the process: no further calls are stubbed
+        assert AWSManager().ensure_security_group_exists() == "sg-shared"
+
+    def test_created_with_tag_and_ssh_rule(self, aws):
+        aws.stubber.add_response("describe_security_groups", {"SecurityGroups": []}, FIND_GROUP)
+        aws.stubber.add_response("create_security_group", {"GroupId": "sg-new"}, {
+            "GroupName": "neotix-gpu-ssh",
+            "Description": launch_resources.SECURITY_GROUP_DESCRIPTION,
+            "TagSpecifications": [{
+                "ResourceType": "security-group",
+                "Tags": [{"Key": "neotix:managed", "Value": "true"}],
+            }],
+        })
+        aws.stubber.add_response(
+            "authorize_security_group_ingress", {},
+            {"GroupId": "sg-new", "IpPermissions": launch_resources.SSH_INGRESS},
+        )
+        assert aws.ensure_security_group_exists() == "sg-new"
+
+    def test_concurrent_create(self, aws):
+        aws.stubber.add_response("describe_security_groups", {"SecurityGroups": []}, FIND_GROUP)
+        aws.stubber.add_client_error("create_security_group", "InvalidGroup.Duplicate")
+        aws.stubber.add_response(
+            "describe_security_groups", {"SecurityGroups": [{"GroupId": "sg-theirs"}]}, FIND_GROUP
+        )
+        assert aws.ensure_security_group_exists() == "sg-theirs"
+
+
+@pytest.mark.unit_tests
+def test_ssh_key_and_cloud_init():
+    private_key, public_key = launch_resources.generate_ssh_key()
+    loaded = serialization.load_ssh_private_key(private_key.encode(), password=None)
+    assert loaded.public_key().public_bytes(
+        serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH
+    ).decode() == public_key
+    assert launch_resources.generate_ssh_key()[1] != public_key
+
+    user_data = launch_resources.cloud_config(public_key)
+    assert user_data.startswith("#cloud-config\n")
+    assert f"  - {public_key}\n" in user_data
+
+
+@pytest.mark.unit_tests
+def test_cleanup_orphans(aws):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+
+    aws.stubber.add_response("describe_security_groups", {"SecurityGroups": [
+        {"GroupId": "sg-shared", "GroupName": "neotix-gpu-ssh"},
+        {"GroupId": "sg-old", "GroupName": "neotix-gpu-1700000000"},
+        {"GroupId": "sg-attached", "GroupName": "neotix-gpu-1700000001"},
+    ]}, {"Filters": [{"Name": "group-name", "Values": ["neotix-gpu-*"]}]})
+    aws.stubber.add_response("delete_security_group", {}, {"GroupId": "sg-old"})
+    aws.stubber.add_client_error("delete_security_group", "DependencyViolation",
+                                 expected_params={"GroupId": "sg-attached"})
+    aws.stubber.add_response("describe_key_pairs", {"KeyPairs": [
+        {"KeyName": "neotix-1-1700000000", "CreateTime": NOW - timedelta(days=3)},
+        {"KeyName": "neotix-2-1772366000", "CreateTime": NOW - timedelta(minutes=5)},
+    ]}, {"Filters": [{"Name": "key-name", "Values": ["neotix-*"]}]})
+    aws.stubber.add_response("delete_key_pair", {}, {"KeyName": "neotix-1-1700000000"})
+
+    with app.app_context():
+        summary = launch_resources.cleanup_orphans(aws=aws, now=NOW)
+    assert summary == {"security_groups": 1, "key_pairs": 1}
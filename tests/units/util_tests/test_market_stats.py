@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.market_stats import MarketStatsAccumulator, percentile, price_summary, spot_discount
+
+@pytest.mark.unit_tests
+class TestPriceHelpers:
+    """Tests for the percentile and summary helpers"""
+
+    def test_percentile_interpolates(self):
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert percentile(values, 0.5) == 3.0
+        assert percentile(values, 0.1) == pytest.approx(1.4)
+        assert percentile(values, 0.9) == pytest.approx(4.6)
+        assert percentile([], 0.5) is None
+
+    def test_price_summary_empty(self):
+        summary = price_summary([])
+        assert summary["count"] == 0
+        assert summary["avg_price"] is None
+
+    def test_price_summary_unsorted_input(self):
+        summary = price_summary([3.0, 1.0, 2.0])
+        assert summary["count"] == 3
+        assert summary["avg_price"] == 2.0
+        assert summary["median_price"] == 2.0
+
+    def test_spot_discount(self):
+        assert spot_discount([1.0], [4.0]) == 0.75
+        assert spot_discount([], [4.0]) is None
+        assert spot_discount([1.0], []) is None
+
+@pytest.mark.unit_tests
+class TestMarketStatsAccumulator:
+    """Tests for the ingest-time accumulator"""
+
+    def test_summary_breakdowns(self):
+        stats = MarketStatsAccumulator()
+        stats.add("aws", "nvidia", "A100", 8, 32.0, False)
+        stats.add("aws", "nvidia", "A100", 8, 16.0, True)
+        stats.add("vastai", "nvidia", "RTX4090", 1, 0.4, False)
+        stats.add("gcp", "amd", "MI300X", 1, None, False)  # Offers without a price are ignored
+
+        summary = stats.summary()
+        assert summary["total_listings"] == 3
+        assert summary["total_gpus"] == 17
+        assert stats.provider_count == 2
+        assert [v["vendor"] for v in summary["vendor_statistics"]] == ["nvidia"]
+        assert {p["provider"]: p["count"] for p in summary["provider_statistics"]} == {"aws": 2, "vastai": 1}
+
+        models = {m["model"]: m for m in summary["model_statistics"]}
+        assert models["A100"]["gpus"] == 16
+        assert models["A100"]["spot_discount"] == 0.5
+        assert models["RTX4090"]["spot_discount"] is None
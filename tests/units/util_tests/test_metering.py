@@ -0,0 +1,201 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import billing, metering, spend_rollup
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from models.deployment_cost import DeploymentCost
+from models.rental_instance import RentalInstance
+from models.usage_accrual import UsageAccrual, BudgetAlert
+from models.user_spend_daily import UserSpendDaily
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+from routes.cluster import bp as cluster_bp
+from routes.clusters_status import bp as clusters_status_bp
+from routes.financial_dashboard import bp as financial_dashboard_bp
+
+HEADERS = {"Authorization": "Bearer token"}
+# One hour at $2 with 8% tax and 5% fee
+HOUR = 2.26
+
+
+@pytest.fixture
+def blueprints():
+    return [
+        (cluster_bp, "/api/clusters"),
+        (clusters_status_bp, "/api/clusters-status"),
+        (financial_dashboard_bp, "/api/financial"),
+    ]
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        user.balance = 50.0
+        host = Host(name="aws")
+        config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+        db.session.add_all([host, config])
+        db.session.flush()
+        listing = GPUListing("g4dn.xlarge", config.id, 2.0, host.id)
+        db.session.add(listing)
+        db.session.flush()
+        db.session.add(Cluster(name="training", user_id=user.id, current_gpu_id=listing.id))
+    return add
+
+
+def start_rental(started, instance_id=None):
+    """An active rental on cluster 1 started at started, with its one-hour deposit paid"""
+    rental = RentalGPU(1, 1, 1, {}, 2.0, instance_id=instance_id)
+    rental.status = "active"
+    rental.start_time = started
+    db.session.add(rental)
+    db.session.flush()
+    transaction = Transaction(user_id=1, amount=-HOUR, status="completed",
+                              description="GPU Rental Initial Deposit: T4 - On-demand usage")
+    db.session.add(transaction)
+    db.session.flush()
+    db.session.add(DeploymentCost(rental_gpu_id=rental.id, transaction_id=transaction.id,
+                                  **billing.charge(2.0, 1).to_dict()))
+    db.session.commit()
+    return rental.id
+
+
+def user_balance():
+    db.session.expire_all()
+    return db.session.get(User, 1).balance
+
+
+@pytest.mark.unit_tests
+class TestAccrual:
+    """Tests for the metering tick"""
+
+    def test_deposit_covers_first_hour(self, app):
+        now = datetime.utcnow()
+        with app.app_context():
+            rental_id = start_rental(now - timedelta(minutes=30))
+            summary = metering.accrue(now=now)
+
+            assert (summary["rentals"], summary["charged"]) == (1, 0)
+            accrual = UsageAccrual.query.one()
+            assert accrual.seconds == 1800
+            assert accrual.amount == pytest.approx(HOUR / 2)
+            assert accrual.charged == 0
+            rental = db.session.get(RentalGPU, rental_id)
+            assert (rental.accrued_until, rental.accrued_amount) == (now, pytest.approx(HOUR / 2))
+            assert user_balance() == 50.0
+
+    def test_charges_beyond_deposit(self, app):
+        # Both ticks on one UTC day
+        now = datetime.utcnow().replace(hour=10, minute=0, second=0, microsecond=0)
+        with app.app_context():
+            start_rental(now - timedelta(hours=3))
+            assert metering.accrue(now=now)["charged"] == pytest.approx(2 * HOUR)
+            assert user_balance() == pytest.approx(50 - 2 * HOUR)
+
+            # The next tick accrues only from where this one stopped
+            later = now + timedelta(hours=1)
+            assert metering.accrue(now=later)["charged"] == pytest.approx(HOUR)
+            assert user_balance() == pytest.approx(50 - 3 * HOUR)
+            assert [accrual.period_start for accrual in UsageAccrual.query.order_by(UsageAccrual.id)] == [
+                now - timedelta(hours=3), now
+            ]
+
+            # The day's charges add up in one completed debit, so the ledger matches the balance
+            charges = Transaction.query.filter(Transaction.description.like(f"{metering.CATEGORY}:%")).all()
+            assert [charge.amount for charge in charges] == [pytest.approx(-3 * HOUR)]
+            # start_rental records its deposit without taking it from the balance
+            ledger = sum(transaction.amount for transaction in Transaction.query) + HOUR
+            assert 50 + ledger == pytest.approx(user_balance())
+
+            # Charged usage reaches the spending rollup, and survives rebuilding it
+            row = db.session.get(UserSpendDaily, (1, later.date(), metering.CATEGORY))
+            assert (row.amount, row.transaction_count) == (pytest.approx(3 * HOUR), 1)
+            spend_rollup.backfill(user_id=1)
+            row = db.session.get(UserSpendDaily, (1, later.date(), metering.CATEGORY))
+            assert (row.amount, row.transaction_count) == (pytest.approx(3 * HOUR), 1)
+
+            # The next day's charges start a new transaction
+            assert metering.accrue(now=later + timedelta(days=1))["charged"] == pytest.approx(24 * HOUR)
+            assert Transaction.query.filter(Transaction.description.like(f"{metering.CATEGORY}:%")).count() == 2
+
+    def test_stops_rentals_out_of_funds(self, app, ec2):
+        now = datetime.utcnow()
+        with app.app_context():
+            db.session.get(User, 1).balance = 3.0
+            db.session.commit()
+            rental_id = start_rental(now - timedelta(hours=3), instance_id="i-aaa")
+
+            summary = metering.accrue(aws=ec2, now=now)
+            assert summary["rentals_stopped"] == 1
+            assert user_balance() == pytest.approx(3 - 2 * HOUR)
+            rental = db.session.get(RentalGPU, rental_id)
+            assert (rental.status, rental.end_time) == ("completed", now)
+            assert db.session.get(RentalInstance, "i-aaa").terminate_requested_at == now
+            assert ec2.terminate_calls == [["i-aaa"]]
+
+            # Nothing left to accrue
+            assert metering.accrue(aws=ec2, now=now + timedelta(hours=1))["rentals"] == 0
+
+    def test_budget_alerts_recorded_once(self, app, monkeypatch):
+        monkeypatch.setattr(metering.Config, "MONTHLY_BUDGET", 10.0)
+        now = datetime.utcnow()
+        with app.app_context():
+            start_rental(now - timedelta(hours=3))
+            # Deposit and accrued charges: 6.78, then 9.04, then 11.30
+            assert metering.accrue(now=now)["budget_alerts"] == 1
+            assert metering.accrue(now=now + timedelta(hours=1))["budget_alerts"] == 1
+            assert metering.accrue(now=now + timedelta(hours=2))["budget_alerts"] == 1
+            assert metering.accrue(now=now + timedelta(hours=3))["budget_alerts"] == 0
+            assert sorted(alert.threshold for alert in BudgetAlert.query) == [50, 80, 100]
+
+        response = app.test_client().get("/api/financial/budget", headers=HEADERS)
+        alerts = {alert["threshold"]: alert for alert in response.json["budget_alerts"]}
+        assert all(alert["triggered"] and alert["triggered_at"] for alert in alerts.values())
+        assert alerts[100]["message"] == "You have exceeded your monthly budget"
+
+
+@pytest.mark.unit_tests
+class TestAccruedReads:
+    """Tests for termination and dashboards reading accrued totals"""
+
+    def test_final_charge_less_accrued(self, app):
+        now = datetime.utcnow()
+        with app.app_context():
+            start_rental(now - timedelta(hours=2, minutes=30))
+            metering.accrue(now=now)  # 2.5 hours accrued, 1.5 of them charged
+            assert user_balance() == pytest.approx(50 - 1.5 * HOUR)
+
+        response = app.test_client().post("/api/clusters/1/gpu/terminate", headers=HEADERS)
+        usage = response.json["usage"]
+        # Billed for 3 hours in all: the deposit, the accrued charge and the rest
+        assert usage["total_cost"] == pytest.approx(3 * HOUR)
+        assert usage["accrued_charge"] == pytest.approx(1.5 * HOUR)
+        assert usage["final_charge"] == pytest.approx(0.5 * HOUR)
+        with app.app_context():
+            assert user_balance() == pytest.approx(50 - 2 * HOUR)
+
+    def test_status_reads_accrued_total(self, app):
+        now = datetime.utcnow()
+        with app.app_context():
+            rental_id = start_rental(now - timedelta(hours=2))
+            # Whatever metering accrued stands; only the time since is priced on read
+            rental = db.session.get(RentalGPU, rental_id)
+            rental.accrued_amount = 10.0
+            rental.accrued_until = now
+            db.session.commit()
+
+        client = app.test_client()
+        status = client.get("/api/clusters-status/1", headers=HEADERS).json
+        assert status["current_cost"] == pytest.approx(10.0, abs=0.01)
+        assert status["running_time_hours"] == pytest.approx(2.0, abs=0.01)
+        dashboard = client.get("/api/financial/", headers=HEADERS).json
+        assert dashboard["active_costs"] == pytest.approx(10.0, abs=0.01)
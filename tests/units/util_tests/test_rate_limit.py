@@ -0,0 +1,171 @@
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+import pytest
+from flask import Flask, jsonify
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from config import Config
+from utils.rate_limit import (
+    Limit, MemoryRateStore, SharedRateStore, RedisRateStore, take, rate_limited, set_store,
+)
+from utils.cache_backends import RespError
+
+
+@pytest.mark.unit_tests
+class TestTokenBucket:
+    """Tests for the bucket arithmetic"""
+
+    def test_new_bucket_starts_full(self):
+        tokens, decision = take(0.0, None, 100.0, Limit.per_minute(60, burst=5))
+        assert tokens == 4
+        assert decision.allowed
+        assert decision.limit == 5
+        assert decision.remaining == 4
+        assert decision.reset == pytest.approx(1.0)
+
+    def test_refills_at_rate_up_to_burst(self):
+        limit = Limit.per_minute(60, burst=5)
+        assert take(0.0, 100.0, 102.5, limit)[0] == pytest.approx(1.5)
+        assert take(0.0, 100.0, 1000.0, limit)[0] == 4
+
+    def test_refusal_reports_retry_after(self):
+        tokens, decision = take(0.25, 100.0, 100.0, Limit.per_minute(30, burst=5))
+        assert not decision.allowed
+        assert tokens == 0.25
+        assert decision.retry_after == pytest.approx(1.5)
+
+
+@pytest.mark.unit_tests
+class TestStores:
+    """Tests for the shared-state stores"""
+
+    @pytest.fixture(params=["memory", "shared"])
+    def store(self, request, tmp_path):
+        if request.param == "memory":
+            return MemoryRateStore()
+        return SharedRateStore(path=str(tmp_path / "ratelimit"))
+
+    def test_hit_drains_bucket(self, store):
+        limit = Limit.per_minute(1, burst=3)
+        decisions = [store.hit("ip:1.2.3.4", limit) for _ in range(4)]
+        assert [d.allowed for d in decisions] == [True, True, True, False]
+        assert store.hit("ip:5.6.7.8", limit).allowed
+
+    def test_incr_counts_within_window(self, store):
+        assert [store.incr("quota:1", ttl=60) for _ in range(3)] == [1, 2, 3]
+        assert store.incr("quota:1", ttl=-1) == 4  # An open window keeps its expiry
+        assert store.incr("quota:2", ttl=60) == 1
+
+    def test_shared_state_across_workers(self, tmp_path):
+        """Threads with their own store on one path stand in for worker processes"""
+        path = str(tmp_path / "ratelimit")
+        limit = Limit.per_minute(1, burst=50)
+        results = []
+
+        def worker():
+            store = SharedRateStore(path=path)
+            results.extend(store.hit("key:1", limit).allowed for _ in range(20))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 50
+
+    def test_prune_drops_expired_records(self, tmp_path):
+        store = SharedRateStore(path=str(tmp_path / "ratelimit"))
+        store.incr("quota:old", ttl=-1)
+        store.incr("quota:new", ttl=60)
+        store.prune()
+        assert store.incr("quota:new", ttl=60) == 2
+        assert len(list((tmp_path / "ratelimit").iterdir())) == 1
+
+
+@pytest.mark.unit_tests
+class TestRedisRateStore:
+    """Tests for the Redis store's use of the server-side script"""
+
+    def test_falls_back_to_eval(self):
+        client = MagicMock()
+        client.execute.side_effect = [RespError("NOSCRIPT No matching script"), [1, b"4.5"]]
+        decision = RedisRateStore(client=client).hit("ip:1.2.3.4", Limit.per_minute(60, burst=10))
+
+        assert decision.allowed
+        assert decision.remaining == 4
+        evalsha, eval_ = client.execute.call_args_list
+        assert evalsha.args[0] == "EVALSHA"
+        assert eval_.args[:2] == ("EVAL", RedisRateStore.BUCKET_SCRIPT)
+        assert eval_.args[3] == "neotix:ratelimit:bucket:ip:1.2.3.4"
+
+    def test_counter_created_with_expiry(self):
+        client = MagicMock()
+        client.execute.side_effect = ["OK", 3]
+        assert RedisRateStore(client=client).incr("quota:1", ttl=2) == 3
+        assert client.execute.call_args_list[0].args == (
+            "SET", "neotix:ratelimit:counter:quota:1", 0, "NX", "PX", 2000
+        )
+
+
+@pytest.mark.unit_tests
+class TestRateLimitedDecorator:
+    """Tests for the per-IP limit on views"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(Config, "RATE_LIMIT_IP_PER_MINUTE", 60)
+        monkeypatch.setattr(Config, "RATE_LIMIT_IP_BURST", 2)
+        previous = set_store(MemoryRateStore())
+        app = Flask(__name__)
+
+        @app.route("/market")
+        @rate_limited
+        def market():
+            return jsonify({"ok": True})
+
+        yield app.test_client()
+        set_store(previous)
+
+    def test_limits_by_ip(self, client):
+        first = client.get("/market")
+        assert first.status_code == 200
+        assert first.headers["RateLimit-Limit"] == "2"
+        assert first.headers["RateLimit-Remaining"] == "1"
+        assert first.headers["RateLimit-Policy"] == "2;w=2"
+        assert client.get("/market").status_code == 200
+
+        refused = client.get("/market")
+        assert refused.status_code == 429
+        assert refused.headers["Retry-After"] == "1"
+        assert refused.json["error"] == "Too many requests"
+        # Another address has its own bucket
+        assert client.get("/market", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+
+    def test_forwarded_for_only_from_trusted_proxies(self, client, monkeypatch):
+        spoofed = {"X-Forwarded-For": "1.1.1.1"}
+        for _ in range(2):
+            client.get("/market", headers=spoofed)
+        # Untrusted header is ignored: all three requests share the peer's bucket
+        assert client.get("/market", headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 429
+
+        monkeypatch.setattr(Config, "RATE_LIMIT_TRUSTED_PROXIES", 1)
+        assert client.get("/market", headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 200
+
+    def test_store_failure_admits_request(self, client):
+        broken = MagicMock()
+        broken.hit.side_effect = ConnectionError("store down")
+        set_store(broken)
+        response = client.get("/market")
+        assert response.status_code == 200
+        assert "RateLimit-Limit" not in response.headers
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(Config, "RATE_LIMIT_ENABLED", False)
+        assert all(client.get("/market").status_code == 200 for _ in range(5))
@@ -0,0 +1,94 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import event
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils.rental_expiry import expire_rentals
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.rental_instance import RentalInstance
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        cluster = Cluster(name="training", user_id=user.id)
+        db.session.add(cluster)
+        db.session.flush()
+        # expired, running on demand, fixed term still running, already completed
+        for status, end_time in [
+            ("active", NOW - timedelta(minutes=1)),
+            ("active", None),
+            ("active", NOW + timedelta(hours=1)),
+            ("completed", NOW - timedelta(days=1)),
+        ]:
+            rental = RentalGPU(cluster_id=cluster.id, gpu_listing_id=1, user_id=user.id,
+                               configuration={}, price=1.0)
+            rental.status = status
+            rental.start_time = NOW - timedelta(days=2)
+            rental.end_time = end_time
+            db.session.add(rental)
+    return add
+
+
+@pytest.fixture
+def writes(app):
+    """Collects INSERT/UPDATE/DELETE statements"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def collect(conn, cursor, statement, *args):
+        if statement.lstrip().split()[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", collect)
+    yield statements
+    event.remove(engine, "before_cursor_execute", collect)
+
+
+@pytest.mark.unit_tests
+class TestRentalExpiry:
+    """Tests for read-only status and the expiry sweeper"""
+
+    def test_current_status_is_derived(self, app):
+        with app.app_context():
+            statuses = [r.current_status(NOW) for r in RentalGPU.query.order_by(RentalGPU.id)]
+            assert statuses == ["completed", "active", "active", "completed"]
+            assert db.session.get(RentalGPU, 1).status == "active"
+
+    def test_serialization_does_not_write(self, app, writes):
+        with app.app_context():
+            cluster = db.session.get(Cluster, 1)
+            assert cluster.to_dict()["rental_history_summary"]["total"] == 4
+            assert db.session.get(RentalGPU, 1).to_dict()["status"] == "completed"
+        assert writes == []
+
+    def test_sweep_expires_in_one_update(self, app, writes):
+        with app.app_context():
+            assert expire_rentals(now=NOW) == 1
+            statuses = [r.status for r in RentalGPU.query.order_by(RentalGPU.id)]
+            assert statuses == ["completed", "active", "active", "completed"]
+            assert db.session.get(RentalGPU, 1).updated_at == NOW
+            assert expire_rentals(now=NOW) == 0
+        assert len(writes) == 2
+
+    def test_sweep_terminates_instances(self, app, ec2):
+        with app.app_context():
+            db.session.get(RentalGPU, 1).instance_id = "i-aaa"
+            db.session.get(RentalGPU, 3).instance_id = "i-ccc"
+            db.session.commit()
+
+            assert expire_rentals(aws=ec2, now=NOW) == 1
+            assert db.session.get(RentalInstance, "i-aaa").terminate_requested_at == NOW
+            assert db.session.get(RentalInstance, "i-ccc") is None
+        assert ec2.terminate_calls == [["i-aaa"]]
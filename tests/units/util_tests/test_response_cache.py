@@ -0,0 +1,113 @@
+import sys
+from pathlib import Path
+import pytest
+from unittest.mock import patch
+from flask import Flask, jsonify, request
+from werkzeug.datastructures import MultiDict
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.cache import invalidate_cache
+from utils.response_cache import CachePolicy, cache_response, normalize_query
+
+
+@pytest.fixture
+def catalog_version():
+    """Pin the catalog version; tests can bump it through the returned list"""
+    version = [1]
+    with patch('utils.response_cache.current_catalog_version', side_effect=lambda: version[0]):
+        yield version
+
+
+@pytest.fixture
+def app(catalog_version):
+    invalidate_cache()
+    app = Flask(__name__)
+    app.calls = 0
+
+    @app.route("/filtered")
+    @cache_response(CachePolicy(ttl=60, max_age=30))
+    def filtered():
+        app.calls += 1
+        return jsonify({"vendors": request.args.getlist("vendors[]"), "calls": app.calls})
+
+    @app.route("/broken")
+    @cache_response()
+    def broken():
+        app.calls += 1
+        return jsonify({"error": "boom"}), 500
+
+    yield app
+    invalidate_cache()
+
+
+@pytest.mark.unit_tests
+class TestNormalizeQuery:
+    """Tests for canonical query strings"""
+
+    def test_sorted_keys_and_list_values(self):
+        policy = CachePolicy()
+        a = MultiDict([("page", "2"), ("vendors[]", "NVIDIA"), ("vendors[]", "AMD")])
+        b = MultiDict([("vendors[]", "AMD"), ("vendors[]", "NVIDIA"), ("page", "2")])
+        assert normalize_query(a, policy) == normalize_query(b, policy)
+        assert normalize_query(a, policy) == "page=2&vendors%5B%5D=AMD&vendors%5B%5D=NVIDIA"
+
+    def test_blank_and_ignored_params_dropped(self):
+        policy = CachePolicy()
+        args = MultiDict([("search", ""), ("_", "1712345"), ("page", "1")])
+        assert normalize_query(args, policy) == "page=1"
+
+    def test_ordered_params_keep_order(self):
+        args = MultiDict([("sort", "price"), ("sort", "name")])
+        assert normalize_query(args, CachePolicy()) == "sort=price&sort=name"
+        assert normalize_query(args, CachePolicy(unordered_params=("sort",))) == "sort=name&sort=price"
+
+
+@pytest.mark.unit_tests
+class TestCacheResponse:
+    """Tests for the response caching decorator"""
+
+    def test_equivalent_queries_share_an_entry(self, app):
+        client = app.test_client()
+        first = client.get("/filtered?vendors[]=NVIDIA&vendors[]=AMD")
+        second = client.get("/filtered?vendors[]=AMD&vendors[]=NVIDIA&_=123")
+        assert first.status_code == second.status_code == 200
+        assert first.get_json() == second.get_json()
+        assert app.calls == 1
+        assert client.get("/filtered?vendors[]=AMD").get_json()["calls"] == 2
+
+    def test_http_caching_headers(self, app):
+        response = app.test_client().get("/filtered")
+        assert response.headers["Cache-Control"] == "public, max-age=30, must-revalidate"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert response.headers["ETag"]
+        assert response.headers["Content-Type"] == "application/json"
+
+    def test_if_none_match_returns_304(self, app):
+        client = app.test_client()
+        etag = client.get("/filtered").headers["ETag"]
+        response = client.get("/filtered", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == etag
+        assert client.get("/filtered", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_new_catalog_version_refreshes(self, app, catalog_version):
+        client = app.test_client()
+        client.get("/filtered")
+        catalog_version[0] = 2
+        assert client.get("/filtered").get_json()["calls"] == 2
+
+    def test_errors_not_cached(self, app):
+        client = app.test_client()
+        assert client.get("/broken").status_code == 500
+        assert client.get("/broken").status_code == 500
+        assert app.calls == 2
+        assert "ETag" not in client.get("/broken").headers
+
+    def test_stale_while_revalidate_header(self):
+        policy = CachePolicy(max_age=30, stale_ttl=600)
+        assert policy.cache_control() == "public, max-age=30, stale-while-revalidate=600"
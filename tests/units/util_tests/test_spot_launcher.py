@@ -0,0 +1,248 @@
+import base64
+import sys
+from pathlib import Path
+import pytest
+from botocore.stub import Stubber
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils import aws_clients, launch_resources, spot_launcher
+from utils.aws_utils import AWSManager
+from utils.spot_launcher import LaunchError, launch
+
+ZONES = ["us-east-1a", "us-west-2a"]
+AMIS = {"us-east-1": "ami-east", "us-west-2": "ami-west"}
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    """Stubbed clients for both regions, keyed by region"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIATEST")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    monkeypatch.setattr(spot_launcher.Config, "AWS_AMI_IDS", "us-east-1=ami-east,us-west-2=ami-west")
+    aws_clients.clear()
+    launch_resources.clear()
+    # The shared security groups are already known
+    monkeypatch.setitem(launch_resources._groups, "us-east-1", "sg-east")
+    monkeypatch.setitem(launch_resources._groups, "us-west-2", "sg-west")
+    stubbers = {region: Stubber(aws_clients.get_client("ec2", region)) for region in AMIS}
+    for stubber in stubbers.values():
+        stubber.activate()
+    yield stubbers
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+        stubber.deactivate()
+    aws_clients.clear()
+
+
+def submitted(ec2, region, request_id):
+    ec2[region].add_response(
+        "request_spot_instances",
+        {"SpotInstanceRequests": [{"SpotInstanceRequestId": request_id}]},
+    )
+
+
+def described(ec2, region, request_id, state="open", instance_id=None, code="pending-fulfillment"):
+    request = {"SpotInstanceRequestId": request_id, "State": state, "Status": {"Code": code}}
+    if instance_id:
+        request["InstanceId"] = instance_id
+    ec2[region].add_response(
+        "describe_spot_instance_requests",
+        {"SpotInstanceRequests": [request]},
+        {"SpotInstanceRequestIds": [request_id]},
+    )
+
+
+def cancelled(ec2, region, request_id):
+    ec2[region].add_response(
+        "cancel_spot_instance_requests", {}, {"SpotInstanceRequestIds": [request_id]}
+    )
+
+
+def tagged(ec2, region, instance_id):
+    ec2[region].add_response("create_tags", {}, {
+        "Resources": [instance_id],
+        "Tags": [{"Key": "neotix:managed", "Value": "true"}, {"Key": "neotix:rental-id", "Value": "7"}],
+    })
+
+
+def run(**kwargs):
+    aws, instance_id, zone, market = launch(
+        "g4dn.xlarge", tags={"neotix:rental-id": 7}, zones=ZONES, sleep=lambda s: None, **kwargs
+    )
+    return aws.region, instance_id, zone, market
+
+
+@pytest.mark.unit_tests
+class TestSpotLauncher:
+    """Tests for concurrent spot requests across zones"""
+
+    def test_first_fulfilled_wins(self, ec2):
+        ec2["us-east-1"].add_response(
+            "request_spot_instances",
+            {"SpotInstanceRequests": [{"SpotInstanceRequestId": "sir-east"}]},
+            {
+                "InstanceCount": 1,
+                "Type": "one-time",
+                "LaunchSpecification": {
+                    "ImageId": "ami-east",
+                    "InstanceType": "g4dn.xlarge",
+                    "Placement": {"AvailabilityZone": "us-east-1a"},
+                    "UserData": base64.b64encode(b"#cloud-config\n").decode(),
+                    "SecurityGroupIds": ["sg-east"],
+                },
+            },
+        )
+        submitted(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east", state="active", instance_id="i-east")
+        described(ec2, "us-west-2", "sir-west", code="capacity-not-available")
+        # The other request is cancelled, and had launched nothing
+        cancelled(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-west-2", "sir-west", state="cancelled", code="request-canceled-and-instance-running")
+        tagged(ec2, "us-east-1", "i-east")
+
+        assert run(user_data="#cloud-config\n") == ("us-east-1", "i-east", "us-east-1a", "spot")
+
+    def test_keeps_polling_until_deadline(self, ec2):
+        submitted(ec2, "us-east-1", "sir-east")
+        submitted(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-west-2", "sir-west", state="active", instance_id="i-west")
+        cancelled(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-east-1", "sir-east", state="cancelled")
+        tagged(ec2, "us-west-2", "i-west")
+
+        ticks = iter([0, 1, 2])
+        assert run(deadline=10, clock=lambda: next(ticks)) == ("us-west-2", "i-west", "us-west-2a", "spot")
+
+    def test_fulfilled_while_cancelling(self, ec2):
+        submitted(ec2, "us-east-1", "sir-east")
+        submitted(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-west-2", "sir-west")
+        cancelled(ec2, "us-east-1", "sir-east")
+        cancelled(ec2, "us-west-2", "sir-west")
+        # Both were fulfilled before the cancellations landed: keep one, terminate the other
+        described(ec2, "us-east-1", "sir-east", state="active", instance_id="i-east")
+        described(ec2, "us-west-2", "sir-west", state="active", instance_id="i-west")
+        ec2["us-west-2"].add_response("terminate_instances", {}, {"InstanceIds": ["i-west"]})
+        tagged(ec2, "us-east-1", "i-east")
+
+        assert run(deadline=0) == ("us-east-1", "i-east", "us-east-1a", "spot")
+
+    def test_on_demand_fallback(self, ec2):
+        submitted(ec2, "us-east-1", "sir-east")
+        ec2["us-west-2"].add_client_error("request_spot_instances", "MaxSpotInstanceCountExceeded")
+        described(ec2, "us-east-1", "sir-east", code="capacity-not-available")
+        cancelled(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-east-1", "sir-east", state="cancelled")
+        ec2["us-east-1"].add_client_error("run_instances", "InsufficientInstanceCapacity")
+        ec2["us-west-2"].add_response("run_instances", {"Instances": [{"InstanceId": "i-ondemand"}]}, {
+            "MinCount": 1,
+            "MaxCount": 1,
+            "SecurityGroupIds": ["sg-west"],
+            "TagSpecifications": [{"ResourceType": "instance", "Tags": [
+                {"Key": "neotix:managed", "Value": "true"}, {"Key": "neotix:rental-id", "Value": "7"},
+            ]}],
+            "ImageId": "ami-west",
+            "InstanceType": "g4dn.xlarge",
+            "Placement": {"AvailabilityZone": "us-west-2a"},
+        })
+
+        assert run(deadline=0) == ("us-west-2", "i-ondemand", "us-west-2a", "on-demand")
+
+    def test_no_capacity_anywhere(self, ec2):
+        submitted(ec2, "us-east-1", "sir-east")
+        submitted(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east", state="closed", code="bad-parameters")
+        described(ec2, "us-west-2", "sir-west", state="failed", code="price-too-low")
+
+        # Closed requests end the wait early, with nothing to cancel
+        with pytest.raises(LaunchError, match="us-east-1a \\(bad-parameters\\), us-west-2a \\(price-too-low\\)"):
+            run(deadline=3600, on_demand_fallback=False)
+
+    def test_client_token_per_zone(self, ec2, monkeypatch):
+        monkeypatch.setattr(spot_launcher.Config, "AWS_AMI_IDS", "us-east-1=ami-east")
+        ec2["us-east-1"].add_response(
+            "request_spot_instances",
+            {"SpotInstanceRequests": [{"SpotInstanceRequestId": "sir-east"}]},
+            {
+                "InstanceCount": 1,
+                "Type": "one-time",
+                "LaunchSpecification": {
+                    "ImageId": "ami-east",
+                    "InstanceType": "g4dn.xlarge",
+                    "Placement": {"AvailabilityZone": "us-east-1a"},
+                    "SecurityGroupIds": ["sg-east"],
+                },
+                "ClientToken": "neotix-rental-7-us-east-1a",
+            },
+        )
+        described(ec2, "us-east-1", "sir-east", state="active", instance_id="i-east")
+        tagged(ec2, "us-east-1", "i-east")
+
+        assert run(client_token="neotix-rental-7")[1] == "i-east"
+
+    def test_failure_part_way_cleans_up(self, ec2):
+        submitted(ec2, "us-east-1", "sir-east")
+        submitted(ec2, "us-west-2", "sir-west")
+        ec2["us-east-1"].add_client_error("describe_spot_instance_requests", "RequestLimitExceeded")
+        # Both requests are cancelled, and the one fulfilled meanwhile has its instance terminated
+        cancelled(ec2, "us-east-1", "sir-east")
+        cancelled(ec2, "us-west-2", "sir-west")
+        described(ec2, "us-east-1", "sir-east", state="cancelled")
+        described(ec2, "us-west-2", "sir-west", state="active", instance_id="i-west")
+        ec2["us-west-2"].add_response("terminate_instances", {}, {"InstanceIds": ["i-west"]})
+
+        with pytest.raises(spot_launcher.ClientError, match="RequestLimitExceeded"):
+            run()
+
+    def test_zones_without_ami_skipped(self, ec2, monkeypatch):
+        monkeypatch.setattr(spot_launcher.Config, "AWS_AMI_IDS", "us-east-1=ami-east")
+        submitted(ec2, "us-east-1", "sir-east")
+        described(ec2, "us-east-1", "sir-east", state="active", instance_id="i-east")
+        tagged(ec2, "us-east-1", "i-east")
+
+        assert run()[2] == "us-east-1a"
+
+
+@pytest.mark.unit_tests
+def test_launch_regions(monkeypatch):
+    monkeypatch.setattr(spot_launcher.Config, "AWS_REGION", "us-east-1")
+    monkeypatch.setattr(spot_launcher.Config, "AWS_LAUNCH_ZONES", "us-west-2b, us-east-1a,us-west-2a")
+    assert spot_launcher.launch_zones() == ["us-west-2b", "us-east-1a", "us-west-2a"]
+    assert spot_launcher.launch_regions() == ["us-east-1", "us-west-2"]
+
+
+@pytest.mark.unit_tests
+def test_instance_terminated_if_it_never_runs(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIATEST")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    aws_clients.clear()
+    terminated = []
+
+    class NeverRunning:
+        def wait_until_running(self, **kwargs):
+            raise Exception("Waiter InstanceRunning failed: Max attempts exceeded")
+
+    class FakeAWS:
+        region = "us-east-1"
+
+        class ec2_resource:
+            Instance = staticmethod(lambda instance_id: NeverRunning())
+
+        def terminate_instance(self, instance_id):
+            terminated.append(instance_id)
+
+    monkeypatch.setattr(spot_launcher, "launch", lambda *args, **kwargs: (FakeAWS(), "i-east", "us-east-1a", "spot"))
+    aws = AWSManager()
+    monkeypatch.setattr(aws, "get_instance_type", lambda gpu_config: "g4dn.xlarge")
+    with pytest.raises(Exception, match="Max attempts exceeded"):
+        aws.launch_gpu_instance({"gpu_name": "T4"})
+    aws_clients.clear()
+    assert terminated == ["i-east"]
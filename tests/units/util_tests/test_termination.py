@@ -0,0 +1,116 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.database import db
+from utils import billing, termination
+from models.user import User
+from models.cluster import Cluster
+from models.rental_gpu import RentalGPU
+from models.rental_instance import RentalInstance
+from models.transaction import Transaction
+from models.deployment_cost import DeploymentCost
+from models.gpu_listing import GPUListing, Host, GPUConfiguration
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def seed():
+    def add(user):
+        cluster = Cluster(name="training", user_id=user.id)
+        db.session.add(cluster)
+        db.session.flush()
+        for instance_id in ("i-aaa", "i-bbb"):
+            rental = RentalGPU(cluster_id=cluster.id, gpu_listing_id=1, user_id=user.id,
+                               configuration={}, price=1.0, instance_id=instance_id)
+            rental.status = "active"
+            rental.start_time = NOW - timedelta(hours=3)
+            db.session.add(rental)
+    return add
+
+
+@pytest.mark.unit_tests
+class TestTermination:
+    """Tests for recording, sending and confirming terminations"""
+
+    def test_request_records_intent_only(self, app, ec2):
+        ec2.instances["i-aaa"] = "running"
+        with app.app_context():
+            rental = db.session.get(RentalGPU, 1)
+            assert termination.request(rental, NOW) == "i-aaa"
+            db.session.commit()
+            row = db.session.get(RentalInstance, "i-aaa")
+            assert (row.state, row.terminate_requested_at, row.region) == ("running", NOW, "us-east-1")
+            assert ec2.terminate_calls == []
+
+            termination.send(["i-aaa"], aws=ec2)
+        assert ec2.terminate_calls == [["i-aaa"]]
+
+    def test_send_failure_is_retried_by_confirmation(self, app, ec2):
+        ec2.instances["i-aaa"] = "running"
+        ec2.terminate_error = "RequestLimitExceeded"
+        with app.app_context():
+            termination.request(db.session.get(RentalGPU, 1), NOW)
+            db.session.commit()
+            termination.send(["i-aaa"], aws=ec2)  # Logged, not raised
+
+            ec2.terminate_error = None
+            summary = termination.confirm_terminations(aws=ec2, now=NOW)
+            assert summary["resent"] == 1
+            assert db.session.get(RentalInstance, "i-aaa").state == "running"
+
+            summary = termination.confirm_terminations(aws=ec2, now=NOW)
+            assert (summary["resent"], summary["confirmed"]) == (0, 0)
+            assert db.session.get(RentalInstance, "i-aaa").state == "shutting-down"
+
+    def test_confirmation_finalizes(self, app, ec2):
+        ec2.instances["i-aaa"] = "terminated"  # i-bbb is no longer listed at all
+        with app.app_context():
+            for rental_id in (1, 2):
+                termination.request(db.session.get(RentalGPU, rental_id), NOW)
+            db.session.get(RentalGPU, 1).status = "completed"  # As the terminate route does
+            db.session.commit()
+
+            summary = termination.confirm_terminations(aws=ec2, now=NOW + timedelta(minutes=1))
+            assert summary == {"confirmed": 2, "resent": 0, "rentals_finalized": 1}
+            assert {row.state for row in RentalInstance.query} == {"terminated"}
+            assert db.session.get(RentalGPU, 2).status == "completed"
+            assert db.session.get(RentalGPU, 2).end_time == NOW + timedelta(minutes=1)
+
+            # Nothing left to check
+            assert termination.confirm_terminations(aws=ec2)["confirmed"] == 0
+
+    def test_finalized_rental_gets_final_charge(self, app, ec2):
+        ec2.instances["i-aaa"] = "terminated"
+        with app.app_context():
+            host = Host(name="aws")
+            config = GPUConfiguration("hash-t4", "T4", "NVIDIA", 1, 16, 4, 16, 100)
+            db.session.add_all([host, config])
+            db.session.flush()
+            db.session.add(GPUListing("g4dn.xlarge", config.id, 2.0, host.id))
+            db.session.get(User, 1).balance = 50.0
+            deposit = Transaction(user_id=1, amount=-2.26, status="completed",
+                                  description="GPU Rental Initial Deposit: T4 - On-demand usage")
+            db.session.add(deposit)
+            db.session.flush()
+            db.session.add(DeploymentCost(rental_gpu_id=1, transaction_id=deposit.id,
+                                          **billing.charge(2.0, 1).to_dict()))
+            # Metering has already charged for two of the three hours
+            db.session.get(RentalGPU, 1).accrued_amount = 2 * 2.26
+            termination.request(db.session.get(RentalGPU, 1), NOW)
+            db.session.commit()
+
+            termination.confirm_terminations(aws=ec2, now=NOW)
+            final = Transaction.query.filter(Transaction.description.like("GPU Rental Final Charge%")).one()
+            assert final.amount == pytest.approx(-2.26)
+            assert db.session.get(User, 1).balance == pytest.approx(50 - 2.26)
+            assert (db.session.get(RentalGPU, 1).status, db.session.get(RentalGPU, 1).end_time) == (
+                "completed", NOW
+            )
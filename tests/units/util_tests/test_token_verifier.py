@@ -0,0 +1,201 @@
+import sys
+import time
+import datetime
+from pathlib import Path
+import pytest
+from unittest.mock import MagicMock
+import jwt
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from firebase_admin import auth
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.token_verifier import TokenVerifier, PublicKeyCache
+
+PROJECT_ID = "neotix-test"
+
+
+def make_signing_key():
+    """RSA key and self-signed certificate, like the ones Google publishes"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope="module")
+def signing_keys():
+    return {"kid-1": make_signing_key(), "kid-2": make_signing_key()}
+
+
+@pytest.fixture
+def fetch(signing_keys):
+    """Stand-in for the Google certificate endpoint, serving kid-1 only"""
+    return MagicMock(return_value=({"kid-1": signing_keys["kid-1"][1]}, 3600))
+
+
+@pytest.fixture
+def user_record():
+    user = MagicMock()
+    user.disabled = False
+    user.tokens_valid_after_timestamp = 0
+    return user
+
+
+@pytest.fixture
+def verifier(fetch, user_record):
+    return TokenVerifier(
+        PROJECT_ID,
+        key_cache=PublicKeyCache(fetch=fetch),
+        revocation_check_interval=300,
+        lookup_user=MagicMock(return_value=user_record),
+    )
+
+
+@pytest.fixture
+def mint(signing_keys):
+    def mint(kid="kid-1", uid="user-1", lifetime=3600, issued_at=None, **overrides):
+        now = int(time.time()) if issued_at is None else issued_at
+        claims = {
+            "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+            "aud": PROJECT_ID,
+            "sub": uid,
+            "iat": now,
+            "auth_time": now,
+            "exp": now + lifetime,
+            "email": "test@example.com",
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, signing_keys[kid][0], algorithm="RS256", headers={"kid": kid})
+    return mint
+
+
+@pytest.mark.unit_tests
+class TestTokenVerifier:
+    """Tests for local Firebase ID token verification"""
+
+    def test_valid_token(self, verifier, mint):
+        claims = verifier.verify(mint())
+        assert claims["uid"] == "user-1"
+        assert claims["email"] == "test@example.com"
+
+    def test_claims_and_keys_cached(self, verifier, mint, fetch):
+        token = mint()
+        verifier.verify(token)
+        verifier.verify(token)
+        verifier.verify(mint(uid="user-2"))
+        fetch.assert_called_once()
+
+    def test_keys_refetched_after_max_age(self, verifier, mint, fetch, signing_keys):
+        fetch.return_value = ({"kid-1": signing_keys["kid-1"][1]}, 0)
+        verifier.verify(mint())
+        verifier.verify(mint(uid="user-2"))
+        assert fetch.call_count == 2
+
+    def test_expired_token(self, verifier, mint):
+        token = mint(issued_at=int(time.time()) - 7200, lifetime=3600)
+        with pytest.raises(auth.ExpiredIdTokenError):
+            verifier.verify(token)
+
+    def test_wrong_audience(self, verifier, mint):
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify(mint(aud="other-project"))
+
+    def test_wrong_issuer(self, verifier, mint):
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify(mint(iss="https://securetoken.google.com/other-project"))
+
+    def test_unknown_key(self, verifier, mint):
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify(mint(kid="kid-2"))
+
+    def test_forged_signature(self, verifier, mint, signing_keys):
+        # Signed with kid-2's key but claiming kid-1
+        forged = jwt.encode(
+            jwt.decode(mint(), options={"verify_signature": False}),
+            signing_keys["kid-2"][0], algorithm="RS256", headers={"kid": "kid-1"},
+        )
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify(forged)
+
+    def test_unsigned_token_rejected(self, verifier):
+        token = jwt.encode({"sub": "user-1"}, None, algorithm="none")
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify(token)
+
+    def test_garbage_token(self, verifier):
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify("not-a-jwt")
+
+    def test_revocation_checked_periodically(self, verifier, mint):
+        token = mint()
+        verifier.verify(token, check_revoked=True)
+        verifier.verify(token, check_revoked=True)
+        verifier.verify(mint(uid="user-2"), check_revoked=True)
+        assert verifier.lookup_user.call_count == 2  # Once per user, not per request
+
+    def test_revoked_token(self, verifier, mint, user_record):
+        issued_at = int(time.time()) - 60
+        user_record.tokens_valid_after_timestamp = (issued_at + 30) * 1000
+        with pytest.raises(auth.RevokedIdTokenError):
+            verifier.verify(mint(issued_at=issued_at), check_revoked=True)
+        # Without the revocation check the signature alone is still valid
+        assert verifier.verify(mint(issued_at=issued_at))["uid"] == "user-1"
+
+    def test_revocation_seen_after_interval(self, verifier, mint, user_record):
+        token = mint(issued_at=int(time.time()) - 10)
+        verifier.verify(token, check_revoked=True)
+        user_record.tokens_valid_after_timestamp = int(time.time()) * 1000
+        verifier.verify(token, check_revoked=True)  # Within the staleness window
+        verifier.revocation_check_interval = 0
+        with pytest.raises(auth.RevokedIdTokenError):
+            verifier.verify(token, check_revoked=True)
+
+    def test_forget_user_forces_recheck(self, verifier, mint, user_record):
+        token = mint(issued_at=int(time.time()) - 10)
+        verifier.verify(token, check_revoked=True)
+        user_record.disabled = True
+        verifier.forget_user("user-1")
+        with pytest.raises(auth.UserDisabledError):
+            verifier.verify(token, check_revoked=True)
+
+    def test_lookup_failure_uses_cached_state(self, verifier, mint):
+        token = mint()
+        verifier.verify(token, check_revoked=True)
+        verifier.revocation_check_interval = 0
+        verifier.lookup_user.side_effect = Exception("Firebase unreachable")
+        assert verifier.verify(token, check_revoked=True)["uid"] == "user-1"
+
+    def test_user_state_is_bounded(self, fetch, user_record, mint):
+        verifier = TokenVerifier(
+            PROJECT_ID,
+            key_cache=PublicKeyCache(fetch=fetch),
+            claims_cache_size=3,
+            lookup_user=MagicMock(return_value=user_record),
+        )
+        for i in range(10):
+            verifier.verify(mint(uid=f"user-{i}"), check_revoked=True)
+        assert len(verifier._user_state) == 3
+
+    def test_certificate_fetch_failure(self, mint):
+        verifier = TokenVerifier(
+            PROJECT_ID, key_cache=PublicKeyCache(fetch=MagicMock(side_effect=OSError("offline")))
+        )
+        with pytest.raises(auth.CertificateFetchError):
+            verifier.verify(mint())
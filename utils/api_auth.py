@@ -2,8 +2,14 @@ from functools import wraps
 from flask import request, jsonify
 from models.api_key import APIKey, APIKeyPermission
 from utils.database import db
+from utils.cache import LRUCache
+from utils.rate_limit import limit_api_key, with_rate_limit_headers
+from config import Config
+from sqlalchemy import bindparam, event, func, text, update
 from datetime import datetime, timezone
+import hashlib
 import secrets
+import threading
 import os
 import logging
 from dotenv import load_dotenv
@@ -15,10 +21,148 @@ logger = logging.getLogger("api_auth")
 # Import this here to avoid circular imports
 from models.user import User
 
+NOTIFY_CHANNEL = "api_keys"
+
 def generate_api_key():
     """Generate a new API key using secrets module"""
     return secrets.token_urlsafe(32)
 
+def hash_api_key(api_key):
+    """Keys are held and logged by their SHA-256, never in the clear"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class CachedAPIKey:
+    """The parts of an APIKey row needed to authorize and rate limit a request"""
+
+    __slots__ = ("id", "permission", "rate_limit_per_minute", "rate_limit_burst", "daily_quota")
+
+    def __init__(self, id, permission, rate_limit_per_minute=None, rate_limit_burst=None,
+                 daily_quota=None):
+        self.id = id
+        self.permission = permission
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.rate_limit_burst = rate_limit_burst
+        self.daily_quota = daily_quota
+
+
+# Active keys by hash, plus short-lived negative entries (None) for unknown keys
+_key_table = LRUCache(max_entries=Config.API_KEY_CACHE_SIZE)
+
+
+def lookup_api_key(api_key):
+    """Returns the CachedAPIKey for an active key, or None. Only misses touch the database."""
+    key_hash = hash_api_key(api_key)
+    found, entry = _key_table.get(key_hash)
+    if found:
+        return entry
+
+    key_record = APIKey.query.filter_by(key=api_key, is_active=True).first()
+    if key_record:
+        entry = CachedAPIKey(
+            key_record.id,
+            key_record.permission,
+            key_record.rate_limit_per_minute,
+            key_record.rate_limit_burst,
+            key_record.daily_quota,
+        )
+        _key_table.set(key_hash, entry, Config.API_KEY_CACHE_TTL)
+    else:
+        _key_table.set(key_hash, None, Config.API_KEY_NEGATIVE_TTL)
+    return entry
+
+
+def invalidate_api_key(key_hash=None):
+    """Forget one key (by hash) or, without an argument, the whole table."""
+    if key_hash is None:
+        _key_table.clear()
+    else:
+        _key_table.delete(key_hash)
+
+
+class UsageBuffer:
+    """
+    Per-key request counts and last-use times accumulated in memory and
+    written in one batched UPDATE by flush(), instead of a commit per request.
+    """
+
+    def __init__(self):
+        self._counts = {}  # key id -> (requests, last used at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def record(self, key_id, when=None):
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            count, _ = self._counts.get(key_id, (0, None))
+            self._counts[key_id] = (count + 1, when)
+
+    def flush(self):
+        """Write buffered usage; returns the number of keys updated."""
+        with self._lock:
+            pending, self._counts = self._counts, {}
+        if not pending:
+            return 0
+
+        table = APIKey.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("key_id"))
+            .values(
+                usage_count=func.coalesce(table.c.usage_count, 0) + bindparam("requests"),
+                last_used_at=bindparam("used_at"),
+            )
+        )
+        try:
+            db.session.execute(statement, [
+                {"key_id": key_id, "requests": count, "used_at": used_at}
+                for key_id, (count, used_at) in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._restore(pending)
+            raise
+        return len(pending)
+
+    def _restore(self, pending):
+        """Put unwritten usage back so the next flush retries it."""
+        with self._lock:
+            for key_id, (count, used_at) in pending.items():
+                current_count, current_used_at = self._counts.get(key_id, (0, used_at))
+                self._counts[key_id] = (current_count + count, max(used_at, current_used_at))
+
+
+usage_buffer = UsageBuffer()
+
+
+def flush_api_key_usage():
+    flushed = usage_buffer.flush()
+    if flushed:
+        logger.debug(f"Flushed usage for {flushed} API keys")
+    return flushed
+
+
+@event.listens_for(APIKey, "after_update")
+@event.listens_for(APIKey, "after_delete")
+def _api_key_written(mapper, connection, target):
+    # Deactivated or changed keys drop out of every worker's table
+    key_hash = hash_api_key(target.key)
+    invalidate_api_key(key_hash)
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_notify(:channel, :key_hash)"),
+            {"channel": NOTIFY_CHANNEL, "key_hash": key_hash},
+        )
+
+
+def register(listener):
+    listener.subscribe(NOTIFY_CHANNEL, invalidate_api_key)
+    listener.on_connect(invalidate_api_key)
+
+
 def check_api_key(required_permission=None):
     """
     Decorator factory that creates a decorator to check API key with specific permission level.
@@ -28,7 +172,6 @@ def check_api_key(required_permission=None):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             api_key = request.headers.get('X-API-Key')
-            logger.debug(f"Auth header X-API-Key: {api_key}")
             
             if not api_key:
                 logger.warning("No API key provided")
@@ -39,19 +182,14 @@ def check_api_key(required_permission=None):
                 
             # Check if it's the master key from .env
             master_key = os.getenv('MASTER_API_KEY')
-            if master_key and api_key == master_key:
+            if master_key and secrets.compare_digest(api_key, master_key):
                 logger.debug("Master API key matched")
                 # Master key has all permissions
                 return f(*args, **kwargs)
-            
-            logger.debug(api_key)
                 
-            # Check if key exists in database
-            key_record = APIKey.query.filter_by(key=api_key, is_active=True).first()
-            if key_record:
-                logger.debug(f"Found APIKey record id={key_record.id} permission={key_record.permission}")
+            key_record = lookup_api_key(api_key)
             if not key_record:
-                logger.warning(f"Invalid API key: {api_key}")
+                logger.warning(f"Invalid API key: sha256={hash_api_key(api_key)[:12]}")
                 return jsonify({
                     'error': 'Invalid API key',
                     'message': 'The provided API key is invalid or has been deactivated'
@@ -64,14 +202,15 @@ def check_api_key(required_permission=None):
                     'error': 'Insufficient permissions',
                     'message': f'This endpoint requires {required_permission.value} permission'
                 }), 403
-            logger.debug(f"Permission OK for API key {api_key}")
             
-            # Update last used timestamp
-            key_record.last_used_at = datetime.now(timezone.utc)
-            db.session.commit()
-            logger.debug(f"Updated last_used_at for API key {api_key}")
+            denied = limit_api_key(key_record)
+            if denied is not None:
+                return denied
+            
+            # Counted in memory; written by the periodic usage flush
+            usage_buffer.record(key_record.id)
             
-            return f(*args, **kwargs)
+            return with_rate_limit_headers(f(*args, **kwargs))
         return decorated_function
     return decorator
 
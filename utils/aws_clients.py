@@ -0,0 +1,102 @@
+"""
+Process-wide registry of boto3 clients.
+
+Creating a boto3 client or resource loads service models and opens new TLS
+connections, which costs tens of milliseconds each time. Clients are
+thread-safe, so one per (service, region, credentials) is shared by every
+thread in the process. Resources are not thread-safe, so they are cached
+per thread instead. All of them share one botocore Config with a larger
+connection pool and adaptive retries, which back off when AWS throttles.
+"""
+import hashlib
+import os
+import threading
+
+import boto3
+from botocore.config import Config as BotoConfig
+
+from config import Config
+
+_clients = {}
+_lock = threading.Lock()
+_local = threading.local()
+_session = None
+
+
+def client_config():
+    return BotoConfig(
+        max_pool_connections=Config.AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=Config.AWS_CONNECT_TIMEOUT,
+        read_timeout=Config.AWS_READ_TIMEOUT,
+        retries={"mode": "adaptive", "total_max_attempts": Config.AWS_MAX_ATTEMPTS},
+    )
+
+
+def _credentials():
+    return os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY")
+
+
+def _key(service, region, credentials):
+    # Keyed by a digest so secrets aren't kept around as dict keys
+    digest = hashlib.sha256("\0".join(c or "" for c in credentials).encode()).hexdigest()
+    return service, region, digest
+
+
+def _get_session():
+    # boto3 sessions aren't safe to create clients from concurrently; callers hold _lock
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def get_client(service, region=None):
+    """The shared client for service in region, created on first use."""
+    region = region or Config.AWS_REGION
+    access_key, secret_key = credentials = _credentials()
+    key = _key(service, region, credentials)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _get_session().client(
+                    service,
+                    region_name=region,
+                    aws_access_key_id=access_key,
+                    aws_secret_access_key=secret_key,
+                    config=client_config(),
+                )
+                _clients[key] = client
+    return client
+
+
+def get_resource(service, region=None):
+    """This thread's resource for service in region, created on first use."""
+    region = region or Config.AWS_REGION
+    access_key, secret_key = credentials = _credentials()
+    key = _key(service, region, credentials)
+    resources = getattr(_local, "resources", None)
+    if resources is None:
+        resources = _local.resources = {}
+    resource = resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _get_session().resource(
+                service,
+                region_name=region,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                config=client_config(),
+            )
+        resources[key] = resource
+    return resource
+
+
+def clear():
+    """Drop every cached client and this thread's resources (e.g. after rotating credentials)."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+    _local.resources = {}
@@ -1,68 +1,30 @@
-import boto3
-import os
-import time
 from botocore.exceptions import ClientError
 from typing import Dict, Tuple, Optional
-from botocore.exceptions import WaiterError
+from config import Config
+from utils import aws_clients
 
 class AWSManager:
-    # AWS GPU instance type mapping
-    GPU_INSTANCE_MAPPING = {
-        'T4': 'g4dn.xlarge',     # 1x T4 GPU
-        'A100': 'p4d.24xlarge',  # 8x A100 GPUs
-        'A10G': 'g5.2xlarge',    # 1x A10G GPU
-        'V100': 'p3.2xlarge',    # 1x V100 GPU
-        'K80': 'p2.xlarge',      # 1x K80 GPU
-    }
+    # Every instance we launch carries these tags so it can be found in one describe call
+    MANAGED_TAG = 'neotix:managed'
+    RENTAL_TAG = 'neotix:rental-id'
 
-    def __init__(self):
-        """Initialize AWS manager with credentials from environment."""
-        self.ec2_client = boto3.client(
-            "ec2",
-            region_name='us-east-1',  # Explicitly set region
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
-        self.ec2_resource = boto3.resource(
-            "ec2",
-            region_name='us-east-1',  # Explicitly set region
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+    def __init__(self, region=None):
+        """Initialize AWS manager; clients come from the shared registry, so this is cheap."""
+        self.region = region
+        self.ec2_client = aws_clients.get_client("ec2", region)
+
+    @property
+    def ec2_resource(self):
+        # Resources aren't thread-safe; the registry keeps one per thread
+        return aws_clients.get_resource("ec2", self.region)
 
     def ensure_security_group_exists(self) -> str:
         """
-        Create a new security group with SSH access.
-        Returns the security group name.
+        Return the id of the shared SSH security group for this region.
+        It is created once and cached (see utils/launch_resources.py).
         """
-        group_name = f"neotix-gpu-{int(time.time())}"  # Unique name
-        try:
-            # Create a new security group
-            response = self.ec2_client.create_security_group(
-                GroupName=group_name,
-                Description='Security group for Neotix GPU instances with SSH access'
-            )
-            security_group_id = response['GroupId']
-            
-            # Add SSH access
-            self.ec2_client.authorize_security_group_ingress(
-                GroupId=security_group_id,
-                IpPermissions=[
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 22,
-                        'ToPort': 22,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    }
-                ]
-            )
-            
-            print(f"Created security group: {group_name}")
-            return group_name
-            
-        except Exception as e:
-            print(f"Error creating security group: {str(e)}")
-            raise
+        from utils import launch_resources
+        return launch_resources.get_security_group(self)
 
     def create_key_pair(self, key_name: str) -> Dict:
         """Create an EC2 key pair and return the private key."""
@@ -88,37 +50,12 @@ class AWSManager:
 
     def get_instance_type(self, gpu_config: Dict) -> Optional[str]:
         """
-        Determine the appropriate AWS instance type based on GPU configuration.
+        Cheapest EC2 instance type providing the GPU configuration
+        (see utils/instance_types.py), or None.
         """
-        print("Determining instance type for GPU config:", gpu_config)
-        gpu_name = gpu_config.get('gpu_name', '').replace('NVIDIA ', '').strip()  # Remove 'NVIDIA ' prefix and whitespace
-        gpu_count = gpu_config.get('gpu_count', 1)
-        
-        print(f"Cleaned GPU name: '{gpu_name}'")
-        # Direct mapping if available
-        for gpu_type, instance_type in self.GPU_INSTANCE_MAPPING.items():
-            print(f"Checking if '{gpu_type.lower()}' matches '{gpu_name.lower()}'")
-            if gpu_type.lower() == gpu_name.lower():  # Changed to exact match
-                print(f"Found matching GPU type: {gpu_type} -> {instance_type}")
-                # For multiple GPUs, use larger instance types
-                if gpu_count > 1:
-                    if 'xlarge' in instance_type:
-                        base = instance_type.split('.')[0]
-                        size = int(instance_type.split('.')[1].replace('xlarge', ''))
-                        return f"{base}.{size * gpu_count}xlarge"
-                return instance_type
-        
-        # Fallback to default based on memory requirements
-        gpu_memory = gpu_config.get('gpu_memory', 0)
-        print(f"No direct match found, using memory-based fallback. GPU Memory: {gpu_memory}GB")
-        if gpu_memory >= 80:  # A100 level
-            return 'p4d.24xlarge'
-        elif gpu_memory >= 32:  # V100 level
-            return 'p3.2xlarge'
-        elif gpu_memory >= 16:  # T4/A10G level
-            return 'g4dn.xlarge'
-        else:
-            return 'g4dn.xlarge'  # Smallest GPU instance
+        from utils import instance_types
+        instance_type = instance_types.for_configuration(gpu_config)
+        return instance_type.name if instance_type else None
 
     def get_running_instances(self) -> list:
         """Get all running instances."""
@@ -143,107 +80,56 @@ class AWSManager:
     def launch_gpu_instance(
         self,
         gpu_config: Dict,
-        key_name: str,
+        key_name: str = None,
         ami_id: str = None,
-        subnet_id: str = None
+        subnet_id: str = None,
+        tags: Dict = None,
+        ssh_public_key: str = None,
+        client_token: str = None
     ) -> Tuple[str, Dict]:
         """
-        Launch an EC2 Spot instance with the specified GPU configuration.
+        Launch an EC2 instance with the specified GPU configuration: spot in
+        the first configured zone with capacity, else on-demand
+        (see utils/spot_launcher.py).
         Args:
             gpu_config: Dictionary containing GPU configuration
-            key_name: Name of the SSH key pair
-            ami_id: Optional AMI ID
+            key_name: Optional name of an EC2 key pair
+            ami_id: Optional AMI ID for the default region
             subnet_id: Optional subnet ID
+            tags: Optional tags for the instance, added to the managed tag
+            ssh_public_key: Optional OpenSSH public key installed by cloud-init
+            client_token: Optional idempotency token; launching again with the
+                same token returns the instance launched the first time
         Returns:
             Tuple of (instance_id, instance_details)
         """
-        if not ami_id:
-            ami_id = 'ami-0c7217cdde317cfec'  # Ubuntu 22.04 LTS with NVIDIA drivers
+        from utils import spot_launcher
+        from utils.launch_resources import cloud_config
 
         instance_type = self.get_instance_type(gpu_config)
         if not instance_type:
-            raise ValueError(f"Could not determine instance type for GPU configuration: {gpu_config}")
+            raise ValueError(
+                f"No EC2 instance type provides {gpu_config.get('gpu_count') or 1}x "
+                f"{gpu_config.get('gpu_name')} with the requested specs"
+            )
 
+        aws = instance_id = None
         try:
-            # Create a new security group with SSH access
-            security_group = self.ensure_security_group_exists()
-            
-            # Request Spot Instance
-            print(f"Requesting spot instance of type {instance_type}")
-            try:
-                spot_request = self.ec2_client.request_spot_instances(
-                    InstanceCount=1,
-                    LaunchSpecification={
-                        'ImageId': ami_id,
-                        'InstanceType': instance_type,
-                        'KeyName': key_name,
-                        'SecurityGroups': [security_group],
-                        'Placement': {
-                            'AvailabilityZone': 'us-east-1a'
-                        }
-                    },
-                    Type='one-time'
-                )
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'MaxSpotInstanceCountExceeded':
-                    error_msg = (
-                        "You have reached your spot instance limit. Please:\n"
-                        "1. Check AWS Console -> EC2 -> Limits -> Running Spot Instances\n"
-                        "2. Request a limit increase or terminate existing instances\n"
-                        "3. Try again in a few minutes"
-                    )
-                    raise Exception(error_msg)
-                raise e
-
-            # Get the Spot Instance request ID
-            spot_request_id = spot_request['SpotInstanceRequests'][0]['SpotInstanceRequestId']
-            print(f"Spot request ID: {spot_request_id}")
-
-            # Wait for the spot request to be fulfilled
-            print("Waiting for spot request to be fulfilled...")
-            waiter = self.ec2_client.get_waiter('spot_instance_request_fulfilled')
-            try:
-                waiter.wait(
-                    SpotInstanceRequestIds=[spot_request_id],
-                    WaiterConfig={
-                        'Delay': 5,
-                        'MaxAttempts': 48  # Wait up to 4 minutes
-                    }
-                )
-            except WaiterError:
-                # Check spot request status
-                spot_request_info = self.ec2_client.describe_spot_instance_requests(
-                    SpotInstanceRequestIds=[spot_request_id]
-                )
-                status = spot_request_info['SpotInstanceRequests'][0].get('Status', {})
-                status_code = status.get('Code', 'unknown')
-                status_message = status.get('Message', 'No message available')
-                
-                # Cancel the spot request since it failed
-                self.ec2_client.cancel_spot_instance_requests(
-                    SpotInstanceRequestIds=[spot_request_id]
-                )
-                
-                if status_code == 'capacity-not-available':
-                    error_msg = (
-                        "No spot capacity available. You can:\n"
-                        "1. Try a different availability zone\n"
-                        "2. Wait a few minutes and try again\n"
-                        "3. Request an on-demand instance instead"
-                    )
-                    raise Exception(error_msg)
-                raise Exception(f"Spot request failed: {status_message}")
-
-            # Get the instance ID
-            spot_request_info = self.ec2_client.describe_spot_instance_requests(
-                SpotInstanceRequestIds=[spot_request_id]
+            # Spot requests in every configured zone at once; first fulfilled wins
+            print(f"Requesting instance of type {instance_type}")
+            aws, instance_id, zone, market = spot_launcher.launch(
+                instance_type,
+                key_name=key_name,
+                user_data=cloud_config(ssh_public_key) if ssh_public_key else None,
+                ami_id=ami_id,
+                tags=tags,
+                client_token=client_token,
             )
-            instance_id = spot_request_info['SpotInstanceRequests'][0]['InstanceId']
-            print(f"Spot instance ID: {instance_id}")
+            print(f"Launched {market} instance {instance_id} in {zone}")
 
             # Wait for the instance to be running with increased timeout
             print("Waiting for instance to be running...")
-            instance = self.ec2_resource.Instance(instance_id)
+            instance = aws.ec2_resource.Instance(instance_id)
             instance.wait_until_running(
                 Filters=[{
                     'Name': 'instance-state-name',
@@ -261,24 +147,98 @@ class AWSManager:
                 'instance_type': instance_type,
                 'instance_ip': instance.public_ip_address,
                 'instance_dns': instance.public_dns_name,
+                'region': aws.region or Config.AWS_REGION,
+                'availability_zone': zone,
+                'market': market,
                 'gpu_configuration': gpu_config
             }
 
         except Exception as e:
             print(f"Error launching EC2 instance: {str(e)}")
+            # An instance that never came up, or can't be described, is of no use to anyone
+            if instance_id:
+                try:
+                    aws.terminate_instance(instance_id)
+                except Exception as terminate_error:
+                    print(f"Error terminating EC2 instance {instance_id}: {str(terminate_error)}")
             # Clean up key pair if creation fails
-            self.delete_key_pair(key_name)
+            if key_name:
+                self.delete_key_pair(key_name)
             raise
 
+    def call_with_security_group(self, call):
+        """
+        call(security_group_ids) with the shared SSH group, looked up again
+        and retried once if the cached group has been deleted.
+        """
+        from utils import launch_resources
+        for attempt in range(2):
+            try:
+                return call([self.ensure_security_group_exists()])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidGroup.NotFound' or attempt:
+                    raise
+                launch_resources.forget_security_group(self.region)
+
+    def instance_tags(self, tags: Dict = None) -> list:
+        """The managed tag plus any extra tags, in EC2's Key/Value form."""
+        all_tags = {self.MANAGED_TAG: 'true', **(tags or {})}
+        return [{'Key': key, 'Value': str(value)} for key, value in all_tags.items()]
+
+    def tag_instance(self, instance_id: str, tags: Dict = None) -> None:
+        """Mark an instance as managed by Neotix (plus any extra tags)."""
+        self.ec2_client.create_tags(Resources=[instance_id], Tags=self.instance_tags(tags))
+
+    def describe_managed_instances(self):
+        """Yield every Neotix-tagged instance, paging through DescribeInstances."""
+        paginator = self.ec2_client.get_paginator('describe_instances')
+        pages = paginator.paginate(
+            Filters=[{'Name': f'tag:{self.MANAGED_TAG}', 'Values': ['true']}],
+            PaginationConfig={'PageSize': 1000}
+        )
+        for page in pages:
+            for reservation in page['Reservations']:
+                yield from reservation['Instances']
+
     def terminate_instance(self, instance_id: str) -> None:
-        """Terminate an EC2 instance."""
+        """
+        Ask EC2 to terminate an instance without waiting for it to stop;
+        utils/termination.py confirms it later.
+        """
         try:
-            instance = self.ec2_resource.Instance(instance_id)
-            instance.terminate()
-            instance.wait_until_terminated()
+            self.terminate_instances([instance_id])
         except ClientError as e:
             raise Exception(f"Failed to terminate EC2 instance: {str(e)}")
 
+    def terminate_instances(self, instance_ids: list) -> None:
+        """Send TerminateInstances; instances that no longer exist are ignored."""
+        try:
+            self.ec2_client.terminate_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                raise
+            # One unknown id fails the whole call; send the rest one by one
+            for instance_id in instance_ids if len(instance_ids) > 1 else []:
+                self.terminate_instances([instance_id])
+
+    def instance_states(self, instance_ids: list) -> Dict[str, str]:
+        """
+        Current state of each instance that EC2 still lists, in one paginated
+        call per 200 ids. Unlike InstanceIds, an instance-id filter doesn't
+        fail on unknown ids.
+        """
+        states = {}
+        paginator = self.ec2_client.get_paginator('describe_instances')
+        for start in range(0, len(instance_ids), 200):
+            pages = paginator.paginate(
+                Filters=[{'Name': 'instance-id', 'Values': instance_ids[start:start + 200]}]
+            )
+            for page in pages:
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        states[instance['InstanceId']] = instance['State']['Name']
+        return states
+
     def terminate_all_instances(self) -> None:
         """Terminate all running instances."""
         try:
@@ -0,0 +1,92 @@
+"""
+Periodic background tasks run by each worker.
+
+Tasks are registered with a name, an interval and a function, then started
+from app.start_background, which serving workers call once the app is loaded
+(gunicorn_config.py). Each runs in its own daemon thread inside an app
+context; exceptions are logged and the task carries on at the next interval.
+Registering and starting are idempotent: a name keeps its one running thread
+if they are called again.
+"""
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, func, run_on_exit=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_on_exit = run_on_exit
+        self.app = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    return self.func()
+            return self.func()
+        except Exception:
+            logger.exception(f"Background task {self.name} failed")
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self.app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"task-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.run_on_exit and self.app is not None:
+            self.run_once()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+_tasks = {}
+_atexit_registered = False
+
+
+def register_task(name, interval, func, run_on_exit=False):
+    """
+    Register a periodic task; returns it. Registering a name again updates
+    the existing task, which keeps running if it was started.
+    """
+    task = _tasks.get(name)
+    if task is None:
+        task = _tasks[name] = PeriodicTask(name, interval, func, run_on_exit=run_on_exit)
+    else:
+        task.interval = interval
+        task.func = func
+        task.run_on_exit = run_on_exit
+    return task
+
+
+def get_task(name):
+    return _tasks.get(name)
+
+
+def start_tasks(app):
+    """Start every registered task in this worker."""
+    global _atexit_registered
+    for task in _tasks.values():
+        task.start(app)
+    if not _atexit_registered:
+        atexit.register(stop_tasks)
+        _atexit_registered = True
+
+
+def stop_tasks(timeout=5):
+    for task in _tasks.values():
+        task.stop(timeout)
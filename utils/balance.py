@@ -0,0 +1,73 @@
+"""
+Atomic changes to user balances.
+
+Balances used to be updated as `user.balance -= amount` on a loaded row,
+which loses one of two concurrent updates and lets two concurrent deploys
+both pass the balance check. These helpers apply the change in a single
+UPDATE ... SET balance = balance + :amount, optionally guarded by a
+minimum in the same statement, and copy the new balance onto the loaded
+user without marking it modified. adjust_many() does the same for many
+users in one executemany UPDATE, for the metering tick.
+"""
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models.user import User
+from utils import identity
+from utils.database import db
+
+
+def adjust(user, amount, minimum=None):
+    """
+    Add amount (negative for a charge) to user's balance in the current
+    transaction. With minimum set, the change is only made if the balance
+    stays at or above it. Returns the new balance, or None if it wasn't made.
+    """
+    current = func.coalesce(User.balance, 0.0)
+    statement = update(User).where(User.id == user.id)
+    if minimum is not None:
+        statement = statement.where(current + amount >= minimum)
+    row = db.session.execute(
+        statement.values(balance=current + amount)
+        .returning(User.balance)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+    set_committed_value(user, "balance", row[0])
+    identity.user_written(user.firebase_uid)
+    return row[0]
+
+
+def charge(user, amount):
+    """Take amount from user's balance if it covers it; returns the new balance or None."""
+    return adjust(user, -amount, minimum=0.0)
+
+
+def credit(user, amount):
+    """Add amount to user's balance; returns the new balance."""
+    return adjust(user, amount)
+
+
+def adjust_many(amounts):
+    """
+    Add amounts (a map of user id to amount, negative for a charge) to
+    users' balances in the current transaction, without a minimum.
+    Returns a map of user id to new balance.
+    """
+    if not amounts:
+        return {}
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == bindparam("user_id"))
+        .values(balance=func.coalesce(users.c.balance, 0.0) + bindparam("amount")),
+        [{"user_id": user_id, "amount": amount} for user_id, amount in amounts.items()],
+    )
+    balances = {}
+    for user_id, firebase_uid, new_balance in db.session.query(
+        User.id, User.firebase_uid, User.balance
+    ).filter(User.id.in_(list(amounts))):
+        identity.user_written(firebase_uid)
+        balances[user_id] = new_balance
+    return balances
@@ -0,0 +1,69 @@
+"""
+GPU rental pricing: hourly usage plus tax and the platform fee.
+
+charge() prices something the user is billed for (the deposit, the final
+charge) in Decimal, so the amounts match what the transactions record.
+running_costs() prices many running rentals at once with numpy, for the
+metering tick (utils/metering.py); accrued_costs() adds what it has not
+accrued yet to what it has, for status pages that show what each rental
+has cost so far.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+
+TAX_RATE = Decimal("0.08")  # 8% tax
+PLATFORM_FEE_RATE = Decimal("0.05")  # 5% platform fee
+# Total cost per dollar of base cost
+_MULTIPLIER = float(1 + TAX_RATE + PLATFORM_FEE_RATE)
+
+
+class Charge(namedtuple("Charge", [
+    "base_cost", "tax_rate", "tax_amount", "platform_fee_rate", "platform_fee_amount", "total_cost",
+])):
+    """A priced charge; every field is a Decimal."""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        """The fields as floats, as stored on DeploymentCost and returned by the API"""
+        return {field: float(value) for field, value in self._asdict().items()}
+
+
+def charge(hourly_rate, hours):
+    """Price hours of usage at hourly_rate (dollars), with tax and platform fee."""
+    base_cost = Decimal(str(hourly_rate)) * Decimal(str(hours))
+    tax_amount = base_cost * TAX_RATE
+    platform_fee_amount = base_cost * PLATFORM_FEE_RATE
+    return Charge(
+        base_cost=base_cost,
+        tax_rate=TAX_RATE,
+        tax_amount=tax_amount,
+        platform_fee_amount=platform_fee_amount,
+        platform_fee_rate=PLATFORM_FEE_RATE,
+        total_cost=base_cost + tax_amount + platform_fee_amount,
+    )
+
+
+def running_costs(hourly_rates, start_times, now):
+    """
+    Running seconds and cost so far (with tax and platform fee) of rentals
+    started at start_times, as two float arrays. A missing rate costs nothing.
+    """
+    if not len(start_times):
+        return np.zeros(0), np.zeros(0)
+    rates = np.array([rate or 0.0 for rate in hourly_rates], dtype=float)
+    seconds = np.array([(now - start).total_seconds() for start in start_times], dtype=float)
+    return seconds, rates * (seconds / 3600) * _MULTIPLIER
+
+
+def accrued_costs(accrued_amounts, hourly_rates, accrued_until, now):
+    """
+    Cost so far of running rentals, as a float array: what metering accrued
+    up to accrued_until (their start times if never accrued) plus the rest.
+    """
+    _, unaccrued = running_costs(hourly_rates, accrued_until, now)
+    if not len(unaccrued):
+        return unaccrued
+    return np.array([amount or 0.0 for amount in accrued_amounts], dtype=float) + unaccrued
@@ -1,39 +1,455 @@
+import logging
+import pickle
+import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+from contextlib import nullcontext
 from functools import wraps
 
-# Simple in-memory cache dictionary
-_cache = {}
+from flask import copy_current_request_context, current_app, has_app_context, has_request_context
+
+from config import Config
+from utils.cache_backends import SharedMemoryBackend, RedisBackend
+from utils.catalog_version import current_catalog_version
+
+logger = logging.getLogger(__name__)
 
 # Default cache expiration time in seconds
 DEFAULT_EXPIRATION = 60
 
+
+def estimate_size(value):
+    """Approximate the memory held by a cached value, in bytes."""
+    if isinstance(value, _Stamped):
+        return estimate_size(value.value)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    # Flask/werkzeug responses: count the body rather than the object graph
+    if hasattr(value, "get_data") and not getattr(value, "direct_passthrough", False):
+        try:
+            return len(value.get_data())
+        except Exception:
+            pass
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class _Flight:
+    """A computation in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def run(self, key, compute):
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and an entry/byte budget.
+    Concurrent misses for one key are collapsed into a single computation.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, record=False)[0]
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key, record=True):
+        """Return (found, value) and mark the entry as recently used."""
+        with self._lock:
+            return self._get_locked(key, time.time(), record)
+
+    def set(self, key, value, ttl=DEFAULT_EXPIRATION):
+        with self._lock:
+            self._set_locked(key, value, ttl, time.time())
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self.current_bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get_or_compute(self, key, compute, ttl=DEFAULT_EXPIRATION):
+        """Return the cached value for key, computing it at most once across threads on a miss."""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        def compute_and_store():
+            # A previous leader may have filled the entry while we were queued
+            found, value = self.get(key, record=False)
+            if found:
+                return value
+            value = compute()
+            self.set(key, value, ttl)
+            return value
+
+        return self._flights.run(key, compute_and_store)
+
+    def lock(self, key, timeout=None):
+        """In-process single-flight already serialises computations; nothing to lock."""
+        return nullcontext()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "inflight": len(self._flights),
+            }
+
+    def _get_locked(self, key, now, record):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, size = entry
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                if record:
+                    self.hits += 1
+                return True, value
+            # Expired: evict now instead of leaving it to occupy the budget
+            del self._entries[key]
+            self.current_bytes -= size
+            self.expirations += 1
+        if record:
+            self.misses += 1
+        return False, None
+
+    def _set_locked(self, key, value, ttl, now):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else; don't cache it at all
+
+        old = self._entries.pop(key, None)
+        if old:
+            self.current_bytes -= old[2]
+        self._entries[key] = (value, now + ttl, size)
+        self.current_bytes += size
+
+        if len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            self._purge_expired_locked(now)
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def _purge_expired_locked(self, now):
+        expired = [k for k, (_, expires_at, _) in self._entries.items() if expires_at <= now]
+        for k in expired:
+            self.current_bytes -= self._entries.pop(k)[2]
+        self.expirations += len(expired)
+
+
+# Process-local LRU; also the backend unless CACHE_BACKEND selects a shared one
+_cache = LRUCache(
+    max_entries=Config.CACHE_MAX_ENTRIES,
+    max_bytes=Config.CACHE_MAX_BYTES,
+)
+
+_backend = None
+_backend_lock = threading.Lock()
+_flights = SingleFlight()
+
+
+def create_backend(name, **options):
+    """Build a cache backend by name: memory, shared (one host) or redis (many hosts)."""
+    if name == "memory":
+        return _cache
+    if name == "shared":
+        return SharedMemoryBackend(
+            path=options.get("path", Config.CACHE_SHM_PATH),
+            max_entries=options.get("max_entries", Config.CACHE_MAX_ENTRIES),
+            max_bytes=options.get("max_bytes", Config.CACHE_MAX_BYTES),
+        )
+    if name == "redis":
+        return RedisBackend(url=options.get("url", Config.CACHE_REDIS_URL))
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+def get_backend():
+    """The configured backend, created on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(Config.CACHE_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the backend (e.g. from app setup or tests). Returns the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
 def cache_key(func, args, kwargs):
-    """Generate a cache key based on function name and arguments."""
-    key = f"{func.__name__}:{args}:{kwargs}"
-    return key
+    """Generate a cache key based on the qualified function name and arguments."""
+    kwargs = dict(sorted(kwargs.items()))
+    return f"{func.__module__}.{func.__qualname__}:{args!r}:{kwargs!r}"
+
+
+class _Stamped:
+    """A value stored with the time it stops being fresh; kept afterwards for stale reads."""
+
+    __slots__ = ("value", "fresh_until")
+
+    def __init__(self, value, fresh_until):
+        self.value = value
+        self.fresh_until = fresh_until
+
+    def __getstate__(self):
+        return (self.value, self.fresh_until)
+
+    def __setstate__(self, state):
+        self.value, self.fresh_until = state
+
+
+_refresher = None
+_refreshing = {}  # key -> Future of the background refresh
+_refreshing_lock = threading.Lock()
+
+
+def _get_refresher():
+    global _refresher
+    if _refresher is None:
+        _refresher = ThreadPoolExecutor(
+            max_workers=Config.CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh"
+        )
+    return _refresher
+
+
+def _bind_context(fn):
+    """Run fn in a copy of the caller's Flask request/app context, if any."""
+    if has_request_context():
+        return copy_current_request_context(fn)
+    if has_app_context():
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                return fn()
+        return run
+    return fn
+
+
+def _store(backend, key, value, expiration, stale_ttl, refresh_ahead, alias):
+    if not (stale_ttl or refresh_ahead):
+        backend.set(key, value, expiration)
+        return
+    backend.set(key, _Stamped(value, time.time() + expiration), expiration + stale_ttl)
+    if alias:
+        # Lets lookups under a new key (e.g. after a catalog version bump)
+        # serve this entry while their own value is computed
+        backend.set(alias, key, expiration + stale_ttl)
+
 
-def memory_cache(expiration=DEFAULT_EXPIRATION):
-    """Decorator to cache function results in memory."""
+def _schedule_refresh(key, compute, expiration, cacheable, stale_ttl, refresh_ahead, alias):
+    """Recompute key in the background, at most once at a time per process."""
+    def refresh():
+        backend = get_backend()
+        try:
+            with backend.lock(key):
+                # Another worker may have refreshed it already
+                found, entry = backend.get(key, record=False)
+                if (found and isinstance(entry, _Stamped)
+                        and time.time() < entry.fresh_until - refresh_ahead):
+                    return
+                value = compute()
+                if cacheable is None or cacheable(value):
+                    _store(backend, key, value, expiration, stale_ttl, refresh_ahead, alias)
+        except Exception:
+            logger.exception(f"Background refresh of cache key {key} failed")
+        finally:
+            with _refreshing_lock:
+                _refreshing.pop(key, None)
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        try:
+            _refreshing[key] = _get_refresher().submit(_bind_context(refresh))
+        except RuntimeError:
+            pass  # Interpreter is shutting down
+
+
+def wait_for_refreshes(timeout=None):
+    """Block until scheduled background refreshes have finished."""
+    with _refreshing_lock:
+        pending = list(_refreshing.values())
+    futures_wait(pending, timeout=timeout)
+
+
+def get_or_compute(key, compute, expiration=DEFAULT_EXPIRATION, cacheable=None,
+                   stale_ttl=0, refresh_ahead=0, alias=None):
+    """
+    Return the cached value for key from the configured backend. On a miss only
+    one thread per process, and one process per backend lock, runs compute.
+    If given, cacheable(value) decides whether a computed value is stored.
+
+    stale_ttl keeps serving an expired value for that many more seconds while
+    it is recomputed in the background; refresh_ahead starts that background
+    recompute the given number of seconds before the value expires. With
+    either set, alias names a key that points at the latest entry stored, and
+    a miss on key serves that entry (stale) while key is computed.
+    """
+    backend = get_backend()
+    found, value = backend.get(key)
+    refresh_args = (key, compute, expiration, cacheable, stale_ttl, refresh_ahead, alias)
+
+    if found:
+        if not isinstance(value, _Stamped):
+            return value
+        if time.time() >= value.fresh_until - refresh_ahead:
+            _schedule_refresh(*refresh_args)
+        return value.value
+
+    if alias and (stale_ttl or refresh_ahead):
+        found, latest_key = backend.get(alias, record=False)
+        if found and latest_key != key:
+            found, entry = backend.get(latest_key, record=False)
+            if found and isinstance(entry, _Stamped):
+                _schedule_refresh(*refresh_args)
+                return entry.value
+
+    def compute_and_store():
+        with backend.lock(key):
+            # Another thread or worker may have filled it while we waited
+            found, value = backend.get(key, record=False)
+            if found:
+                return value.value if isinstance(value, _Stamped) else value
+            value = compute()
+            if cacheable is None or cacheable(value):
+                _store(backend, key, value, expiration, stale_ttl, refresh_ahead, alias)
+            return value
+
+    return _flights.run(key, compute_and_store)
+
+
+def successful_result(value):
+    """
+    Default cacheable predicate for memory_cache: anything but a Flask
+    response object or a (body, status) tuple with a non-2xx status, so an
+    error returned by a view is not served again until the entry expires.
+    """
+    if isinstance(value, tuple):
+        status = value[1] if len(value) > 1 else 200
+        return isinstance(status, int) and 200 <= status < 300 and successful_result(value[0])
+    return not hasattr(value, "status_code")
+
+
+def memory_cache(expiration=DEFAULT_EXPIRATION, versioned=False, stale_ttl=0, refresh_ahead=0,
+                 cacheable=successful_result):
+    """
+    Decorator to cache function results in the configured cache backend.
+    With versioned=True the key includes the current catalog version, so a
+    new ingest switches every worker to fresh results regardless of TTL.
+    stale_ttl and refresh_ahead enable stale-while-revalidate and background
+    refresh before expiry (see get_or_compute). Only results for which
+    cacheable(result) is true are stored; pass cacheable=None to store all.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             key = cache_key(func, args, kwargs)
-            current_time = time.time()
-
-            # Check if the key is in the cache and not expired
-            if key in _cache:
-                result, timestamp = _cache[key]
-                if current_time - timestamp < expiration:
-                    return result
-
-            # Call the function and cache the result
-            result = func(*args, **kwargs)
-            _cache[key] = (result, current_time)
-            return result
+            alias = None
+            if versioned:
+                if stale_ttl:
+                    alias = f"latest:{key}"
+                key = f"v{current_catalog_version()}:{key}"
+            return get_or_compute(
+                key,
+                lambda: func(*args, **kwargs),
+                expiration,
+                cacheable=cacheable,
+                stale_ttl=stale_ttl,
+                refresh_ahead=refresh_ahead,
+                alias=alias,
+            )
 
         return wrapper
     return decorator
 
+
 def invalidate_cache():
     """Clear the entire cache."""
-    _cache.clear()
+    get_backend().clear()
+
+
+def cache_stats():
+    """Hit/miss/eviction counters and current size of the cache."""
+    return get_backend().stats()
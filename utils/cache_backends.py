@@ -0,0 +1,373 @@
+"""
+Cross-process backends for utils/cache.
+
+memory_cache talks to a backend through a small duck-typed interface:
+get(key) -> (found, value), set(key, value, ttl), delete(key), clear(),
+keys(), stats() and lock(key) for single-flight across processes.
+The in-process LRUCache in utils/cache.py implements the same interface.
+"""
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import queue
+import socket
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class SharedMemoryBackend:
+    """
+    Cache shared by every worker on one host. Each entry is a file on a
+    RAM-backed filesystem (/dev/shm) that readers mmap; writers replace
+    files atomically, so reads never see a partial entry. Single-flight
+    locks use a fixed set of lock files that keys hash onto, so versioned
+    keys don't leave a lock file behind each.
+    """
+
+    # expires_at (float seconds), key length
+    HEADER = struct.Struct("!dI")
+
+    def __init__(self, path=None, max_entries=1024, max_bytes=256 * 1024 * 1024,
+                 prune_interval=64, lock_stripes=64):
+        if path is None:
+            base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(base, "neotix-cache")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.lock_stripes = lock_stripes
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sets_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _file_for(self, key):
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key, record=True):
+        found, value = self._read(self._file_for(key), key)
+        if record:
+            with self._lock:
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found, value
+
+    def _read(self, filename, key=None):
+        try:
+            with open(filename, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                expires_at, key_length = self.HEADER.unpack_from(mm, 0)
+                offset = self.HEADER.size
+                stored_key = mm[offset:offset + key_length].decode()
+                if expires_at <= time.time() or (key is not None and stored_key != key):
+                    if expires_at <= time.time():
+                        self._unlink(filename)
+                    return False, None
+                value = pickle.loads(mm[offset + key_length:])
+        except (FileNotFoundError, ValueError, struct.error, EOFError, pickle.UnpicklingError):
+            # Missing, empty or torn file
+            return False, None
+        # Refresh the access time so pruning approximates LRU
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return True, value
+
+    def set(self, key, value, ttl):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        encoded_key = key.encode()
+        if len(payload) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.HEADER.pack(time.time() + ttl, len(encoded_key)))
+                f.write(encoded_key)
+                f.write(payload)
+            os.replace(tmp, self._file_for(key))
+        except BaseException:
+            self._unlink(tmp)
+            raise
+
+        with self._lock:
+            self._sets_since_prune += 1
+            prune = self._sets_since_prune >= self.prune_interval
+            if prune:
+                self._sets_since_prune = 0
+        if prune:
+            self.prune()
+
+    def delete(self, key):
+        self._unlink(self._file_for(key))
+
+    def clear(self):
+        for filename in self._entry_files():
+            self._unlink(filename)
+
+    def keys(self):
+        keys = []
+        for filename in self._entry_files():
+            try:
+                with open(filename, "rb") as f:
+                    header = f.read(self.HEADER.size)
+                    expires_at, key_length = self.HEADER.unpack(header)
+                    if expires_at > time.time():
+                        keys.append(f.read(key_length).decode())
+            except (OSError, struct.error):
+                continue
+        return keys
+
+    def prune(self):
+        """Drop expired entries, then least recently used ones until within budget."""
+        now = time.time()
+        live = []
+        for filename in self._entry_files():
+            try:
+                with open(filename, "rb") as f:
+                    expires_at, _ = self.HEADER.unpack(f.read(self.HEADER.size))
+                    st = os.fstat(f.fileno())
+            except (OSError, struct.error):
+                continue
+            if expires_at <= now:
+                self._unlink(filename)
+            else:
+                live.append((st.st_mtime, st.st_size, filename))
+
+        live.sort()
+        total = sum(size for _, size, _ in live)
+        while live and (len(live) > self.max_entries or total > self.max_bytes):
+            _, size, filename = live.pop(0)
+            self._unlink(filename)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    @contextmanager
+    def lock(self, key, timeout=30):
+        """Exclusive lock for key across all processes on this host, like RedisBackend.lock."""
+        stripe = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % self.lock_stripes
+        lock_path = os.path.join(self.path, f".lock-{stripe}")
+        with open(lock_path, "a") as f:
+            deadline = time.time() + timeout
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except OSError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                    if time.time() > deadline:
+                        break  # Lock holder is stuck; compute anyway rather than fail the request
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def stats(self):
+        files = list(self._entry_files())
+        total = 0
+        for filename in files:
+            try:
+                total += os.path.getsize(filename)
+            except OSError:
+                pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "shared",
+                "entries": len(files),
+                "bytes": total,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _entry_files(self):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.startswith(".") and not name.endswith(".lock"):
+                yield os.path.join(self.path, name)
+
+    @staticmethod
+    def _unlink(filename):
+        try:
+            os.unlink(filename)
+        except FileNotFoundError:
+            pass
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class RespClient:
+    """Minimal RESP2 client with a small connection pool, enough for caching."""
+
+    def __init__(self, url="redis://localhost:6379/0", timeout=2.0, pool_size=8):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        if self.password:
+            self._roundtrip(conn, ("AUTH", self.password))
+        if self.db:
+            self._roundtrip(conn, ("SELECT", self.db))
+        return conn
+
+    def execute(self, *args):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            reply = self._roundtrip(conn, args)
+        except (OSError, EOFError):
+            conn[0].close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn[0].close()
+        return reply
+
+    def _roundtrip(self, conn, args):
+        sock, reader = conn
+        sock.sendall(self.encode(args))
+        return self.read_reply(reader)
+
+    @staticmethod
+    def encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, (bytes, bytearray)):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    @classmethod
+    def read_reply(cls, reader):
+        line = reader.readline()
+        if not line:
+            raise EOFError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [cls.read_reply(reader) for _ in range(length)]
+        raise RespError(f"Unexpected reply type: {line!r}")
+
+
+class RedisBackend:
+    """Cache shared by every worker on every machine through a Redis-protocol server."""
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="neotix:cache:", client=None):
+        self.client = client or RespClient(url)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, record=True):
+        data = self.client.execute("GET", self.prefix + key)
+        found = data is not None
+        if record:
+            with self._lock:
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return (True, pickle.loads(data)) if found else (False, None)
+
+    def set(self, key, value, ttl):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.client.execute("SET", self.prefix + key, payload, "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.client.execute("DEL", self.prefix + key)
+
+    def keys(self):
+        keys = []
+        cursor = b"0"
+        while True:
+            cursor, batch = self.client.execute(
+                "SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500
+            )
+            keys.extend(k.decode()[len(self.prefix):] for k in batch)
+            if cursor in (b"0", "0"):
+                return [k for k in keys if not k.startswith("lock:")]
+
+    def clear(self):
+        for key in self.keys():
+            self.delete(key)
+
+    @contextmanager
+    def lock(self, key, timeout=30):
+        """Best-effort distributed lock (SET NX PX) so one worker computes a key."""
+        lock_key = self.prefix + "lock:" + key
+        token = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        while not self.client.execute("SET", lock_key, token, "NX", "PX", int(timeout * 1000)):
+            if time.time() > deadline:
+                break  # Lock holder is stuck; compute anyway rather than fail the request
+            time.sleep(0.02)
+        try:
+            yield
+        finally:
+            if self.client.execute("GET", lock_key) == token.encode():
+                self.client.execute("DEL", lock_key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,100 @@
+"""
+The GPU catalog version this worker serves.
+
+Every ingest run adds a CatalogVersion row and sends NOTIFY catalog_version
+in the same transaction. Workers learn about it through the LISTEN thread
+(utils/pg_listener.py) and versioned cache keys switch to fresh data at once;
+entries for older versions simply age out of the cache. Without a listener
+(e.g. a non-PostgreSQL database) the version is polled instead.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import func, text
+
+from config import Config
+from models.catalog import CatalogVersion
+from utils.database import db
+from utils.pg_listener import get_listener
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "catalog_version"
+
+_version = None
+_refreshed_at = 0.0
+_lock = threading.Lock()
+
+
+def load_catalog_version():
+    """Latest catalog version in the database, 0 before the first ingest."""
+    return db.session.query(func.max(CatalogVersion.id)).scalar() or 0
+
+
+def set_catalog_version(version):
+    """Adopt version if it is newer than ours. Returns True if it changed."""
+    global _version, _refreshed_at
+    version = int(version)
+    with _lock:
+        _refreshed_at = time.monotonic()
+        if _version is None or version > _version:
+            _version = version
+            return True
+    return False
+
+
+def reset_catalog_version():
+    """Forget the known version so the next lookup reloads it."""
+    global _version, _refreshed_at
+    with _lock:
+        _version = None
+        _refreshed_at = 0.0
+
+
+def current_catalog_version():
+    """
+    The catalog version to key caches by. While the listener is connected this
+    is a memory read; otherwise the database is polled at most every
+    CATALOG_VERSION_POLL_INTERVAL seconds.
+    """
+    listener = get_listener()
+    live = listener is not None and listener.connected.is_set()
+    stale = time.monotonic() - _refreshed_at > Config.CATALOG_VERSION_POLL_INTERVAL
+    if _version is None or (stale and not live):
+        try:
+            set_catalog_version(load_catalog_version())
+        except Exception as e:
+            logger.warning(f"Could not load catalog version: {str(e)}")
+    return _version or 0
+
+
+def notify_catalog_version(session, version):
+    """
+    Queue NOTIFY for a new version on session. PostgreSQL delivers it only
+    when the transaction commits, so workers never see an uncommitted version.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    session.execute(
+        text("SELECT pg_notify(:channel, :version)"),
+        {"channel": CHANNEL, "version": str(version)},
+    )
+
+
+def handle_notification(payload):
+    try:
+        if set_catalog_version(payload):
+            logger.info(f"Catalog version is now {payload}")
+    except ValueError:
+        logger.warning(f"Ignoring malformed catalog version notification: {payload!r}")
+
+
+def register(app, listener):
+    """Subscribe to version bumps and resync after (re)connecting."""
+    def resync():
+        with app.app_context():
+            set_catalog_version(load_catalog_version())
+
+    listener.subscribe(CHANNEL, handle_notification)
+    listener.on_connect(resync, name=f"{__name__}.resync")
@@ -2,7 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 import os
 import logging
 from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 
 db = SQLAlchemy()
 logger = logging.getLogger(__name__)
@@ -27,3 +27,16 @@ def init_db(app):
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
+
+
+def try_advisory_lock(key):
+    """
+    True if the current transaction now holds the advisory lock for key, which
+    is released at commit or rollback. Always true off PostgreSQL.
+    """
+    bind = db.session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return True
+    return bool(db.session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": key}
+    ).scalar())
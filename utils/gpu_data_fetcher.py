@@ -14,7 +14,10 @@ sys.path.insert(0, gpuhunt_path)
 
 import gpuhunt
 from models.gpu_listing import GPUListing, GPUPricePoint, GPUPriceHistory, Host, GPUConfiguration
+from models.catalog import CatalogVersion, MarketStatsSnapshot
 from utils.database import db
+from utils.market_stats import MarketStatsAccumulator
+from utils.catalog_version import notify_catalog_version, set_catalog_version
 
 def hash_gpu_configuration(offer):
     """
@@ -24,6 +27,30 @@ def hash_gpu_configuration(offer):
     config_str = f"{offer.gpu_name}:{offer.gpu_vendor}:{offer.gpu_count}:{offer.gpu_memory}:{offer.cpu}:{offer.memory}:{offer.disk_size}"
     return hashlib.sha256(config_str.encode()).hexdigest()
 
+def record_market_snapshot(market_stats):
+    """
+    Adds a new catalog version and its pre-aggregated market statistics to the session
+    """
+    summary = market_stats.summary()
+    catalog_version = CatalogVersion(
+        offer_count=market_stats.total_listings,
+        provider_count=market_stats.provider_count
+    )
+    db.session.add(catalog_version)
+    db.session.flush()
+
+    snapshot = MarketStatsSnapshot(
+        catalog_version_id=catalog_version.id,
+        total_gpus=summary["total_gpus"],
+        total_listings=summary["total_listings"],
+        avg_price=summary["price"]["avg_price"],
+        median_price=summary["price"]["median_price"],
+        stats=summary
+    )
+    db.session.add(snapshot)
+    logger.info(f"Recorded market snapshot for catalog version {catalog_version.id}")
+    return catalog_version
+
 def fetch_gpu_data():
     """
     Fetches GPU data from all providers using gpuhunt and updates the database
@@ -42,6 +69,7 @@ def fetch_gpu_data():
     current_provider = None
     processed_gpus = 0
     active_providers = set()
+    market_stats = MarketStatsAccumulator()
     
     for offer in offers:
         # Skip offers without GPUs
@@ -130,6 +158,7 @@ def fetch_gpu_data():
             spot=offer.spot
         )
         db.session.add(history)
+        market_stats.add_offer(offer)
         
         # Increment processed GPUs counter and log progress
         processed_gpus += 1
@@ -141,12 +170,21 @@ def fetch_gpu_data():
     # Log completion with provider summary
     logger.info(f"GPU data fetch completed. Total GPUs processed: {processed_gpus}")
     logger.info(f"Active providers in database: {', '.join(active_providers)}")
+
+    # Bump the catalog version and store the market snapshot for it; workers
+    # are notified when (and only if) the transaction commits
+    catalog_version = None
+    if processed_gpus:
+        catalog_version = record_market_snapshot(market_stats)
+        notify_catalog_version(db.session, catalog_version.id)
     
     # Commit all changes
     try:
         logger.info("Attempting to commit all changes to database...")
         db.session.commit()
         logger.info("Successfully committed all GPU data to database")
+        if catalog_version is not None and catalog_version.id is not None:
+            set_catalog_version(catalog_version.id)
         logger.info("Database URI: %s", db.engine.url)
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,155 @@
+"""
+Idempotency-Key support for endpoints that charge or credit a balance.
+
+A client may send an Idempotency-Key header with a request. The first
+request with a given key claims it by inserting an idempotency_keys row (the
+unique constraint decides between concurrent requests), runs, and stores its
+response on the row. A retry with the same key gets the stored response back
+without running the endpoint again. A retry sent while the first request is
+still running gets 409, and reusing a key for a different request gets 422.
+
+Server errors (5xx) are not stored: the key is released so the client can
+retry. Keys are kept for IDEMPOTENCY_KEY_TTL seconds; purge_expired() deletes
+older ones.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import jsonify, make_response, request
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models.idempotency_key import IdempotencyKey
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(b"\0" + request.path.encode() + b"\0")
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _find(user_id, key, now):
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if record is not None and record.created_at < now - timedelta(seconds=Config.IDEMPOTENCY_KEY_TTL):
+        # Expired; the key may be used afresh
+        db.session.delete(record)
+        db.session.commit()
+        return None
+    return record
+
+
+def _claim(user_id, key, fingerprint, now):
+    """Insert the key; returns (record, True) if this request claimed it, else the existing record."""
+    record = _find(user_id, key, now)
+    if record is not None:
+        return record, False
+    record = IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now)
+    db.session.add(record)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request with the same key claimed it first
+        db.session.rollback()
+        return IdempotencyKey.query.filter_by(user_id=user_id, key=key).first(), False
+    return record, True
+
+
+def _replay(record):
+    response = jsonify(record.response_body)
+    response.status_code = record.status_code
+    if record.location:
+        response.headers["Location"] = record.location
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _store(record_id, response):
+    record = db.session.get(IdempotencyKey, record_id)
+    if record is None:
+        return
+    if response.status_code >= 500:
+        db.session.delete(record)
+    else:
+        record.status_code = response.status_code
+        record.response_body = response.get_json(silent=True)
+        record.location = response.headers.get("Location")
+        record.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _release(record_id):
+    record = db.session.get(IdempotencyKey, record_id)
+    if record is not None:
+        db.session.delete(record)
+        db.session.commit()
+
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header on an authenticated endpoint. Apply it
+    under the auth decorator, so the user is known.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        from middleware.auth import get_current_user
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        fingerprint = _fingerprint()
+        record, claimed = _claim(user.id, key, fingerprint, datetime.utcnow())
+        if record is None:
+            # Claimed and released between our insert and lookup; let the client retry
+            return jsonify({"error": "Request with this Idempotency-Key is in progress"}), 409
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+            if not record.is_complete:
+                response = jsonify({"error": "Request with this Idempotency-Key is in progress"})
+                response.headers["Retry-After"] = "1"
+                return response, 409
+            return _replay(record)
+
+        record_id = record.id
+        try:
+            result = f(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            _release(record_id)
+            raise
+        response = make_response(result)
+        _store(record_id, response)
+        return response
+
+    return decorated_function
+
+
+def purge_expired(now=None):
+    """Delete keys older than IDEMPOTENCY_KEY_TTL; returns how many."""
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.created_at < now - timedelta(seconds=Config.IDEMPOTENCY_KEY_TTL))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.info(f"Purged {result.rowcount} idempotency keys")
+    return result.rowcount
@@ -0,0 +1,113 @@
+"""
+Cross-request cache of users by firebase_uid.
+
+Authenticated routes resolve the signed-in user on every request. The row
+is cached here as a pickled snapshot for IDENTITY_CACHE_TTL seconds and
+merged into the request's session without a query (merge(load=False)).
+
+Any flush that updates or deletes a user drops its entry locally and sends
+NOTIFY user_identity in the same transaction, so other workers drop theirs
+when it commits. Bulk UPDATE statements bypass the ORM events and must call
+user_written() themselves.
+
+Cached values can be a few milliseconds stale across workers, so code doing
+read-modify-write on a user (e.g. balance arithmetic) should load it with
+fresh=True.
+"""
+import logging
+import pickle
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from config import Config
+from models.user import User
+from utils.cache import LRUCache
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "user_identity"
+
+_users = LRUCache(max_entries=Config.IDENTITY_CACHE_SIZE, max_bytes=64 * 1024 * 1024)
+
+
+def get_user(firebase_uid, load, fresh=False):
+    """
+    The user for firebase_uid, attached to the current session. load() runs
+    the actual query on a miss (or when fresh=True); None is never cached.
+    """
+    if not fresh:
+        found, snapshot = _users.get(firebase_uid)
+        if found:
+            return db.session.merge(pickle.loads(snapshot), load=False)
+
+    user = load()
+    remember(firebase_uid, user)
+    return user
+
+
+def remember(firebase_uid, user):
+    # Only mapped, persistent rows can be replayed with merge(load=False)
+    state = inspect(user, raiseerr=False)
+    if state is None or not state.persistent or state.modified:
+        return
+    try:
+        _users.set(firebase_uid, pickle.dumps(user), Config.IDENTITY_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not cache user {firebase_uid}: {str(e)}")
+
+
+def invalidate_user(firebase_uid):
+    _users.delete(firebase_uid)
+
+
+def user_written(firebase_uid):
+    """
+    Invalidate a user changed by a bulk UPDATE in the current transaction,
+    here and (on commit) in other workers, as the ORM events do for flushes.
+    """
+    invalidate_user(firebase_uid)
+    _notify(db.session.connection(), firebase_uid)
+    db.session.info.setdefault("identity_written", set()).add(firebase_uid)
+
+
+def clear():
+    _users.clear()
+
+
+def _notify(connection, firebase_uid):
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_notify(:channel, :uid)"), {"channel": CHANNEL, "uid": firebase_uid}
+        )
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_written(mapper, connection, target):
+    uid = target.firebase_uid
+    invalidate_user(uid)
+    _notify(connection, uid)
+    # Drop it again after commit, in case a concurrent request re-cached the
+    # old row between this flush and the commit
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("identity_written", set()).add(uid)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for uid in session.info.pop("identity_written", ()):
+        invalidate_user(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("identity_written", None)
+
+
+def register(listener):
+    """Drop entries written by other workers; start from scratch after reconnecting."""
+    listener.subscribe(CHANNEL, invalidate_user)
+    listener.on_connect(clear)
@@ -0,0 +1,144 @@
+"""
+Periodic reconciliation of EC2 instance state.
+
+Every INSTANCE_RECONCILE_INTERVAL seconds one worker describes all
+Neotix-tagged instances (one paginated DescribeInstances call per launch
+region, however many rentals there are) and stores their state, IP and DNS
+in rental_instances. Active rentals whose instance has been terminated
+outside the app (spot interruption, console) get their final charge and are
+marked completed (utils/settlement.py), as if terminated through the app.
+
+Request paths such as RentalGPU.get_ssh_key and the cluster status routes
+read the cached rows instead of calling AWS themselves.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+
+from config import Config
+from models.rental_gpu import RentalGPU
+from models.rental_instance import RentalInstance
+from utils import settlement
+from utils.database import db, try_advisory_lock
+
+logger = logging.getLogger(__name__)
+
+# Key for pg_try_advisory_xact_lock so only one worker reconciles at a time
+ADVISORY_LOCK_KEY = 0x4E54_0001
+
+# DescribeInstances is eventually consistent: a just-launched instance can be
+# missing from it for a little while, so only rows unseen for longer count as gone
+VANISHED_AFTER = timedelta(minutes=2)
+
+
+def _naive_utc(value):
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _rental_id(described):
+    from utils.aws_utils import AWSManager
+    for tag in described.get("Tags", []):
+        if tag["Key"] == AWSManager.RENTAL_TAG:
+            try:
+                return int(tag["Value"])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def record_instance(instance_id, rental_gpu_id=None, state="running", instance_type=None,
+                    public_ip=None, public_dns=None, launch_time=None, region=None, now=None):
+    """Insert or update the cached row for one instance (in the current session)."""
+    now = now or datetime.utcnow()
+    row = db.session.get(RentalInstance, instance_id)
+    if row is None:
+        row = RentalInstance(instance_id=instance_id)
+        db.session.add(row)
+    row.rental_gpu_id = rental_gpu_id if rental_gpu_id is not None else row.rental_gpu_id
+    row.region = region or row.region or Config.AWS_REGION
+    row.state = state
+    row.instance_type = instance_type or row.instance_type
+    row.public_ip = public_ip
+    row.public_dns = public_dns or None
+    row.launch_time = _naive_utc(launch_time) or row.launch_time
+    row.last_seen_at = now
+    return row
+
+
+def reconcile(aws=None, now=None):
+    """
+    Refresh rental_instances from EC2 and end rentals whose instance is gone.
+    Describes the given AWSManager's region, or every launch region by default.
+    Returns a summary, or None if another worker is already reconciling.
+    """
+    if not try_advisory_lock(ADVISORY_LOCK_KEY):
+        db.session.rollback()
+        return None
+
+    from utils.aws_utils import AWSManager
+    from utils.spot_launcher import launch_regions
+    managers = [aws] if aws else [AWSManager(region) for region in launch_regions()]
+    now = now or datetime.utcnow()
+
+    described = {}
+    regions = {}
+    for manager in managers:
+        region = getattr(manager, "region", None) or Config.AWS_REGION
+        for instance in manager.describe_managed_instances():
+            described[instance["InstanceId"]] = instance
+            regions[instance["InstanceId"]] = region
+    scanned = {getattr(manager, "region", None) or Config.AWS_REGION for manager in managers}
+
+    # Rows for everything described, plus live rows that may have disappeared
+    rows = {
+        row.instance_id: row
+        for row in RentalInstance.query.filter(
+            or_(
+                RentalInstance.instance_id.in_(list(described)),
+                RentalInstance.state.notin_(RentalInstance.GONE_STATES),
+            )
+        )
+    }
+
+    for instance_id, instance in described.items():
+        # Rows loaded above come from the identity map without another query
+        rows[instance_id] = record_instance(
+            instance_id,
+            rental_gpu_id=_rental_id(instance),
+            state=instance["State"]["Name"],
+            instance_type=instance.get("InstanceType"),
+            public_ip=instance.get("PublicIpAddress"),
+            public_dns=instance.get("PublicDnsName"),
+            launch_time=instance.get("LaunchTime"),
+            region=regions[instance_id],
+            now=now,
+        )
+
+    # EC2 stops listing instances a while after they terminate
+    vanished = 0
+    for instance_id, row in rows.items():
+        if (instance_id not in described and row.state not in RentalInstance.GONE_STATES
+                and (row.region or Config.AWS_REGION) in scanned
+                and row.last_seen_at < now - VANISHED_AFTER):
+            row.state = "terminated"
+            vanished += 1
+
+    gone_rentals = [
+        row.rental_gpu_id for row in rows.values()
+        if row.rental_gpu_id and row.state in RentalInstance.GONE_STATES
+    ]
+    ended = 0
+    if gone_rentals:
+        # Locked like the terminate route's, so metering can't charge them meanwhile
+        for rental in RentalGPU.query.filter(
+            RentalGPU.id.in_(gone_rentals), RentalGPU.status == "active"
+        ).with_for_update().populate_existing():
+            logger.warning(f"Instance for rental {rental.id} is gone; settling and completing the rental")
+            settlement.settle(rental, now)
+            ended += 1
+
+    db.session.commit()
+    return {"instances": len(described), "vanished": vanished, "rentals_ended": ended}
@@ -0,0 +1,129 @@
+"""
+EC2 GPU instance types and the resolver that picks one for a GPU configuration.
+
+The table lists real instance types as the gpuhunt AWS catalog describes
+them: GPU model, GPU count, GPU memory (GB per GPU), vCPUs and RAM (GB).
+Prices are us-east-1 on-demand list prices, used only to rank candidates.
+Only x86_64 types are listed, because the launch AMI is x86_64.
+
+INDEX is built once at import. It maps (canonical model, GPU count) to the
+matching types, cheapest first. For most configurations resolve() is a
+single dict lookup.
+"""
+from collections import namedtuple
+
+InstanceType = namedtuple(
+    "InstanceType", ["name", "gpu_name", "gpu_count", "gpu_memory", "cpu", "memory", "price"]
+)
+
+INSTANCE_TYPES = (
+    # NVIDIA T4
+    InstanceType("g4dn.xlarge", "T4", 1, 16, 4, 16, 0.526),
+    InstanceType("g4dn.2xlarge", "T4", 1, 16, 8, 32, 0.752),
+    InstanceType("g4dn.4xlarge", "T4", 1, 16, 16, 64, 1.204),
+    InstanceType("g4dn.8xlarge", "T4", 1, 16, 32, 128, 2.176),
+    InstanceType("g4dn.16xlarge", "T4", 1, 16, 64, 256, 4.352),
+    InstanceType("g4dn.12xlarge", "T4", 4, 16, 48, 192, 3.912),
+    InstanceType("g4dn.metal", "T4", 8, 16, 96, 384, 7.824),
+    # NVIDIA A10G
+    InstanceType("g5.xlarge", "A10G", 1, 24, 4, 16, 1.006),
+    InstanceType("g5.2xlarge", "A10G", 1, 24, 8, 32, 1.212),
+    InstanceType("g5.4xlarge", "A10G", 1, 24, 16, 64, 1.624),
+    InstanceType("g5.8xlarge", "A10G", 1, 24, 32, 128, 2.448),
+    InstanceType("g5.16xlarge", "A10G", 1, 24, 64, 256, 4.096),
+    InstanceType("g5.12xlarge", "A10G", 4, 24, 48, 192, 5.672),
+    InstanceType("g5.24xlarge", "A10G", 4, 24, 96, 384, 8.144),
+    InstanceType("g5.48xlarge", "A10G", 8, 24, 192, 768, 16.288),
+    # NVIDIA L4
+    InstanceType("g6.xlarge", "L4", 1, 24, 4, 16, 0.8048),
+    InstanceType("g6.2xlarge", "L4", 1, 24, 8, 32, 0.9776),
+    InstanceType("g6.4xlarge", "L4", 1, 24, 16, 64, 1.3232),
+    InstanceType("g6.8xlarge", "L4", 1, 24, 32, 128, 2.0144),
+    InstanceType("g6.16xlarge", "L4", 1, 24, 64, 256, 3.3968),
+    InstanceType("g6.12xlarge", "L4", 4, 24, 48, 192, 4.6016),
+    InstanceType("g6.24xlarge", "L4", 4, 24, 96, 384, 6.6752),
+    InstanceType("g6.48xlarge", "L4", 8, 24, 192, 768, 13.3504),
+    # NVIDIA L40S
+    InstanceType("g6e.xlarge", "L40S", 1, 48, 4, 32, 1.861),
+    InstanceType("g6e.2xlarge", "L40S", 1, 48, 8, 64, 2.242),
+    InstanceType("g6e.4xlarge", "L40S", 1, 48, 16, 128, 3.004),
+    InstanceType("g6e.8xlarge", "L40S", 1, 48, 32, 256, 4.529),
+    InstanceType("g6e.16xlarge", "L40S", 1, 48, 64, 512, 7.578),
+    InstanceType("g6e.12xlarge", "L40S", 4, 48, 48, 384, 10.493),
+    InstanceType("g6e.24xlarge", "L40S", 4, 48, 96, 768, 15.066),
+    InstanceType("g6e.48xlarge", "L40S", 8, 48, 192, 1536, 30.131),
+    # NVIDIA K80
+    InstanceType("p2.xlarge", "K80", 1, 12, 4, 61, 0.9),
+    InstanceType("p2.8xlarge", "K80", 8, 12, 32, 488, 7.2),
+    InstanceType("p2.16xlarge", "K80", 16, 12, 64, 732, 14.4),
+    # NVIDIA V100
+    InstanceType("p3.2xlarge", "V100", 1, 16, 8, 61, 3.06),
+    InstanceType("p3.8xlarge", "V100", 4, 16, 32, 244, 12.24),
+    InstanceType("p3.16xlarge", "V100", 8, 16, 64, 488, 24.48),
+    InstanceType("p3dn.24xlarge", "V100", 8, 32, 96, 768, 31.212),
+    # NVIDIA A100
+    InstanceType("p4d.24xlarge", "A100", 8, 40, 96, 1152, 32.7726),
+    InstanceType("p4de.24xlarge", "A100", 8, 80, 96, 1152, 40.9657),
+    # NVIDIA H100
+    InstanceType("p5.48xlarge", "H100", 8, 80, 192, 2048, 98.32),
+)
+
+
+def canonical_gpu_name(gpu_name):
+    """Catalog spelling of a GPU model, e.g. "NVIDIA a10g" -> "A10G"."""
+    name = (gpu_name or "").strip().upper()
+    if name.startswith("NVIDIA "):
+        name = name[len("NVIDIA "):].strip()
+    return name.replace(" ", "").replace("-", "")
+
+
+def _group(instance_types, key):
+    groups = {}
+    for instance_type in instance_types:
+        groups.setdefault(key(instance_type), []).append(instance_type)
+    return {k: tuple(types) for k, types in groups.items()}
+
+
+BY_PRICE = tuple(sorted(INSTANCE_TYPES, key=lambda t: t.price))
+INDEX = _group(BY_PRICE, lambda t: (canonical_gpu_name(t.gpu_name), t.gpu_count))
+BY_MODEL = _group(BY_PRICE, lambda t: canonical_gpu_name(t.gpu_name))
+
+
+def _fits(instance_type, gpu_memory, cpu, memory):
+    return (
+        instance_type.gpu_memory >= (gpu_memory or 0)
+        and instance_type.cpu >= (cpu or 0)
+        and instance_type.memory >= (memory or 0)
+    )
+
+
+def resolve(gpu_name, gpu_count=1, gpu_memory=None, cpu=None, memory=None):
+    """
+    The cheapest instance type with gpu_count of gpu_name and at least the
+    given GPU memory, vCPUs and RAM, or None.
+
+    Without an exact match this falls back to the cheapest type with more of
+    the same GPU. A model AWS doesn't offer at all (the listing came from
+    another provider) resolves to None: other hardware at the listing's
+    price is not what the user is paying for.
+    """
+    model = canonical_gpu_name(gpu_name)
+    gpu_count = int(gpu_count or 1)
+    for instance_type in INDEX.get((model, gpu_count), ()):
+        if _fits(instance_type, gpu_memory, cpu, memory):
+            return instance_type
+    for instance_type in BY_MODEL.get(model, ()):
+        if instance_type.gpu_count >= gpu_count and _fits(instance_type, gpu_memory, cpu, memory):
+            return instance_type
+    return None
+
+
+def for_configuration(gpu_config):
+    """resolve() for a rental's GPU configuration dict."""
+    return resolve(
+        gpu_config.get("gpu_name"),
+        gpu_count=gpu_config.get("gpu_count") or 1,
+        gpu_memory=gpu_config.get("gpu_memory"),
+        cpu=gpu_config.get("cpu"),
+        memory=gpu_config.get("memory"),
+    )
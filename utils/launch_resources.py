@@ -0,0 +1,178 @@
+"""
+Security groups and SSH keys for instance launches.
+
+Launches used to create a new security group, its ingress rule and a new
+EC2 key pair every time: three serial control-plane calls before the spot
+request, plus a steady leak toward the account's group and key pair limits.
+
+Now every launch in a region shares one tagged security group, looked up
+(or created) once per process and cached. SSH keys are generated locally
+for each rental and installed by cloud-init from the instance's user data,
+so a launch makes no key pair calls at all. A background task deletes the
+per-launch groups and key pairs the old scheme left behind.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from config import Config
+from utils.database import db, try_advisory_lock
+
+logger = logging.getLogger(__name__)
+
+SECURITY_GROUP_NAME = "neotix-gpu-ssh"
+SECURITY_GROUP_DESCRIPTION = "Security group for Neotix GPU instances with SSH access"
+SSH_INGRESS = [{
+    "IpProtocol": "tcp",
+    "FromPort": 22,
+    "ToPort": 22,
+    "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+}]
+
+# Names used by the old per-launch scheme
+LEGACY_GROUP_PREFIX = "neotix-gpu-"
+LEGACY_KEY_PREFIX = "neotix-"
+# A key pair this young may belong to a launch still in flight
+ORPHAN_MIN_AGE = timedelta(hours=1)
+
+# Key for pg_try_advisory_xact_lock so only one worker cleans up at a time
+ADVISORY_LOCK_KEY = 0x4E54_0002
+
+_groups = {}  # region -> security group id
+_lock = threading.Lock()
+
+
+def _error_code(error):
+    return error.response.get("Error", {}).get("Code")
+
+
+def _find_group(aws):
+    response = aws.ec2_client.describe_security_groups(Filters=[
+        {"Name": "group-name", "Values": [SECURITY_GROUP_NAME]},
+        {"Name": f"tag:{aws.MANAGED_TAG}", "Values": ["true"]},
+    ])
+    groups = response["SecurityGroups"]
+    return groups[0]["GroupId"] if groups else None
+
+
+def _create_group(aws):
+    try:
+        response = aws.ec2_client.create_security_group(
+            GroupName=SECURITY_GROUP_NAME,
+            Description=SECURITY_GROUP_DESCRIPTION,
+            TagSpecifications=[{
+                "ResourceType": "security-group",
+                "Tags": [{"Key": aws.MANAGED_TAG, "Value": "true"}],
+            }],
+        )
+    except ClientError as e:
+        # Another process created it first
+        if _error_code(e) == "InvalidGroup.Duplicate":
+            return _find_group(aws)
+        raise
+    group_id = response["GroupId"]
+    aws.ec2_client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=SSH_INGRESS)
+    logger.info(f"Created security group {SECURITY_GROUP_NAME} ({group_id})")
+    return group_id
+
+
+def get_security_group(aws):
+    """Id of the shared SSH security group in aws's region, created on first use."""
+    region = aws.region or Config.AWS_REGION
+    group_id = _groups.get(region)
+    if group_id is None:
+        with _lock:
+            group_id = _groups.get(region)
+            if group_id is None:
+                group_id = _find_group(aws) or _create_group(aws)
+                _groups[region] = group_id
+    return group_id
+
+
+def forget_security_group(region=None):
+    """Drop a cached group id, e.g. after a launch reports it no longer exists."""
+    with _lock:
+        _groups.pop(region or Config.AWS_REGION, None)
+
+
+def generate_ssh_key():
+    """A new (private_key, public_key) pair in OpenSSH format."""
+    key = ed25519.Ed25519PrivateKey.generate()
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.OpenSSH,
+        serialization.NoEncryption(),
+    ).decode()
+    public_key = key.public_key().public_bytes(
+        serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH
+    ).decode()
+    return private_key, public_key
+
+
+def cloud_config(public_key):
+    """Cloud-init user data that authorizes public_key for the AMI's default user."""
+    return f"#cloud-config\nssh_authorized_keys:\n  - {public_key}\n"
+
+
+def _delete_legacy_groups(aws):
+    deleted = 0
+    response = aws.ec2_client.describe_security_groups(
+        Filters=[{"Name": "group-name", "Values": [f"{LEGACY_GROUP_PREFIX}*"]}]
+    )
+    for group in response["SecurityGroups"]:
+        if group["GroupName"] == SECURITY_GROUP_NAME:
+            continue
+        try:
+            aws.ec2_client.delete_security_group(GroupId=group["GroupId"])
+            deleted += 1
+        except ClientError as e:
+            # Still attached to an instance; try again next time
+            if _error_code(e) != "DependencyViolation":
+                logger.warning(f"Could not delete security group {group['GroupId']}: {e}")
+    return deleted
+
+
+def _delete_legacy_key_pairs(aws, now):
+    deleted = 0
+    response = aws.ec2_client.describe_key_pairs(
+        Filters=[{"Name": "key-name", "Values": [f"{LEGACY_KEY_PREFIX}*"]}]
+    )
+    for key_pair in response["KeyPairs"]:
+        # The public key is already on the instance; EC2 only needs it at launch
+        created = key_pair.get("CreateTime")
+        if created is not None and created > now - ORPHAN_MIN_AGE:
+            continue
+        aws.delete_key_pair(key_pair["KeyName"])
+        deleted += 1
+    return deleted
+
+
+def cleanup_orphans(aws=None, now=None):
+    """
+    Delete security groups and key pairs left by per-launch provisioning.
+    Returns a summary, or None if another worker is already cleaning up.
+    """
+    if not try_advisory_lock(ADVISORY_LOCK_KEY):
+        db.session.rollback()
+        return None
+    try:
+        from utils.aws_utils import AWSManager
+        aws = aws or AWSManager()
+        now = now or datetime.now(timezone.utc)
+        return {
+            "security_groups": _delete_legacy_groups(aws),
+            "key_pairs": _delete_legacy_key_pairs(aws, now),
+        }
+    finally:
+        # Ends the transaction, releasing the lock
+        db.session.rollback()
+
+
+def clear():
+    """Forget every cached security group id."""
+    with _lock:
+        _groups.clear()
@@ -0,0 +1,114 @@
+import math
+from collections import defaultdict
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list (fraction in [0, 1])."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return float(sorted_values[lower])
+    weight = position - lower
+    return float(sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight)
+
+
+def price_summary(prices):
+    """Count and avg/median/p10/p90 of a list of prices."""
+    values = sorted(prices)
+    if not values:
+        return {"count": 0, "avg_price": None, "median_price": None,
+                "p10_price": None, "p90_price": None}
+    return {
+        "count": len(values),
+        "avg_price": round(sum(values) / len(values), 4),
+        "median_price": round(percentile(values, 0.5), 4),
+        "p10_price": round(percentile(values, 0.1), 4),
+        "p90_price": round(percentile(values, 0.9), 4),
+    }
+
+
+def spot_discount(spot_prices, on_demand_prices):
+    """Median spot price as a discount off the median on-demand price, or None."""
+    if not spot_prices or not on_demand_prices:
+        return None
+    spot_median = percentile(sorted(spot_prices), 0.5)
+    on_demand_median = percentile(sorted(on_demand_prices), 0.5)
+    if not on_demand_median:
+        return None
+    return round(1 - spot_median / on_demand_median, 4)
+
+
+class MarketStatsAccumulator:
+    """Collects offers during an ingest run and summarises them once at the end."""
+
+    def __init__(self):
+        self.total_gpus = 0
+        self.total_listings = 0
+        self._prices = []
+        self._spot_prices = []
+        self._on_demand_prices = []
+        self._by_vendor = defaultdict(list)
+        self._by_provider = defaultdict(list)
+        self._by_model = defaultdict(lambda: {"spot": [], "on_demand": [], "gpus": 0})
+
+    def add(self, provider, vendor, gpu_name, gpu_count, price, spot):
+        if price is None:
+            return
+        self.total_listings += 1
+        self.total_gpus += gpu_count or 0
+        self._prices.append(price)
+        (self._spot_prices if spot else self._on_demand_prices).append(price)
+        if vendor:
+            self._by_vendor[vendor].append(price)
+        if provider:
+            self._by_provider[provider].append(price)
+        if gpu_name:
+            model = self._by_model[gpu_name]
+            model["spot" if spot else "on_demand"].append(price)
+            model["gpus"] += gpu_count or 0
+
+    def add_offer(self, offer):
+        """Add a gpuhunt offer"""
+        self.add(
+            provider=offer.provider,
+            vendor=offer.gpu_vendor.value if offer.gpu_vendor else None,
+            gpu_name=offer.gpu_name,
+            gpu_count=offer.gpu_count,
+            price=offer.price,
+            spot=offer.spot,
+        )
+
+    @property
+    def provider_count(self):
+        return len(self._by_provider)
+
+    def summary(self):
+        overall = price_summary(self._prices)
+        models = []
+        for name, prices in sorted(self._by_model.items()):
+            entry = price_summary(prices["spot"] + prices["on_demand"])
+            entry.update({
+                "model": name,
+                "gpus": prices["gpus"],
+                "spot_discount": spot_discount(prices["spot"], prices["on_demand"]),
+            })
+            models.append(entry)
+
+        return {
+            "total_gpus": self.total_gpus,
+            "total_listings": self.total_listings,
+            "price": overall,
+            "spot_discount": spot_discount(self._spot_prices, self._on_demand_prices),
+            "vendor_statistics": [
+                {"vendor": vendor, **price_summary(prices)}
+                for vendor, prices in sorted(self._by_vendor.items())
+            ],
+            "provider_statistics": [
+                {"provider": provider, **price_summary(prices)}
+                for provider, prices in sorted(self._by_provider.items())
+            ],
+            "model_statistics": models,
+        }
@@ -0,0 +1,230 @@
+"""
+Usage metering: charging running rentals as they run.
+
+Every METERING_INTERVAL seconds one worker (an advisory lock keeps the
+others out) prices every active rental from where it was last accrued to
+now, with one query to read them, one bulk INSERT into usage_accruals and
+one bulk UPDATE of the rentals' accrued totals. A rental's deposit covers
+its first accruals; beyond that, what it accrues is charged to its user's
+balance, for all users in one executemany UPDATE (utils/balance.py). The
+charges go into one completed debit transaction per user and UTC day,
+created by the day's first charge and added to by the rest, so the ledger
+adds up to the balance and the spending rollup can be rebuilt from it,
+without a ledger row per tick. Termination then only charges the part of
+the final cost that the deposit and the accruals have not already paid
+(utils/settlement.py).
+
+After charging, users whose spending this month crossed a budget threshold
+get a budget_alerts row, once per threshold and month, and the rentals of
+users whose balance has run out are stopped: marked completed with their
+instances queued for termination (utils/termination.py).
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time
+
+from sqlalchemy import func, insert, update
+
+from config import Config
+from models.cluster import Cluster
+from models.deployment_cost import DeploymentCost
+from models.gpu_listing import GPUListing
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from models.usage_accrual import BudgetAlert, UsageAccrual
+from models.user_spend_daily import UserSpendDaily
+from utils import balance, billing, spend_rollup, termination
+from utils.database import db, try_advisory_lock
+
+logger = logging.getLogger(__name__)
+
+# Key for pg_try_advisory_xact_lock so only one worker accrues at a time
+ADVISORY_LOCK_KEY = 0x4E54_0004
+
+# Transaction description prefix, and so spending rollup category, of accrued charges
+CATEGORY = "GPU Rental Usage"
+
+
+def paid(accrued_amount, deposit):
+    """What a rental has paid so far: its deposit, or its accrued usage once that is more"""
+    return max(accrued_amount or 0.0, deposit or 0.0)
+
+
+def _active_rentals(now):
+    """Active rentals with their price and deposit, locked against termination"""
+    rows = db.session.query(
+        RentalGPU.id,
+        RentalGPU.user_id,
+        RentalGPU.start_time,
+        RentalGPU.accrued_until,
+        RentalGPU.accrued_amount,
+        GPUListing.current_price,
+        Transaction.amount.label("deposit"),
+    ).join(
+        GPUListing, RentalGPU.gpu_listing_id == GPUListing.id
+    ).outerjoin(
+        DeploymentCost, DeploymentCost.rental_gpu_id == RentalGPU.id
+    ).outerjoin(
+        Transaction, DeploymentCost.transaction_id == Transaction.id
+    ).filter(
+        Cluster._active_filter(now),
+        RentalGPU.start_time.isnot(None),
+        RentalGPU.start_time < now,
+    ).order_by(RentalGPU.id).with_for_update(of=RentalGPU, skip_locked=True)
+
+    # A rental with several deployment cost rows appears once per row; keep the first
+    unique = {}
+    for row in rows:
+        unique.setdefault(row.id, row)
+    return list(unique.values())
+
+
+def accrue(aws=None, now=None):
+    """
+    Accrue and charge the usage of every active rental up to now. Returns a
+    summary, or None if another worker is already accruing.
+    """
+    if not try_advisory_lock(ADVISORY_LOCK_KEY):
+        db.session.rollback()
+        return None
+
+    now = now or datetime.utcnow()
+    rows = _active_rentals(now)
+    periods = [row.accrued_until or row.start_time for row in rows]
+    seconds, amounts = billing.running_costs([row.current_price for row in rows], periods, now)
+
+    accruals = []
+    totals = []
+    charges = defaultdict(float)
+    for row, period_start, period_seconds, amount in zip(rows, periods, seconds, amounts):
+        if period_seconds <= 0:
+            continue
+        amount = float(amount)
+        accrued = (row.accrued_amount or 0.0) + amount
+        deposit = abs(row.deposit) if row.deposit is not None else 0.0
+        charged = paid(accrued, deposit) - paid(row.accrued_amount, deposit)
+        accruals.append({
+            "rental_gpu_id": row.id,
+            "user_id": row.user_id,
+            "period_start": period_start,
+            "period_end": now,
+            "seconds": float(period_seconds),
+            "hourly_rate": float(row.current_price or 0.0),
+            "amount": amount,
+            "charged": charged,
+            "created_at": now,
+        })
+        totals.append({"id": row.id, "accrued_until": now, "accrued_amount": accrued})
+        if charged > 0:
+            charges[row.user_id] += charged
+
+    if accruals:
+        db.session.execute(insert(UsageAccrual), accruals)
+        db.session.execute(update(RentalGPU), totals)
+
+    balances = balance.adjust_many({user_id: -amount for user_id, amount in charges.items()})
+    _post_charges(charges, now)
+
+    alerts = _budget_alerts(list(charges), now)
+    unfunded = [user_id for user_id, new_balance in balances.items() if (new_balance or 0.0) <= 0]
+    stopped, instance_ids = _stop_rentals(unfunded, now) if unfunded else (0, [])
+    db.session.commit()
+
+    if instance_ids:
+        termination.send(instance_ids, aws=aws)
+    summary = {
+        "rentals": len(accruals),
+        "charged": sum(charges.values()),
+        "users_charged": len(charges),
+        "budget_alerts": alerts,
+        "rentals_stopped": stopped,
+    }
+    if accruals:
+        logger.info(f"Metering: {summary}")
+    return summary
+
+
+def _post_charges(charges, now):
+    """Add each user's charge to their usage transaction for the day, creating it if needed."""
+    if not charges:
+        return
+    description = f"{CATEGORY}: {now:%Y-%m-%d}"
+    day_start = datetime.combine(now.date(), time.min)
+    posted = {
+        transaction.user_id: transaction
+        for transaction in Transaction.query.filter(
+            Transaction.user_id.in_(list(charges)),
+            Transaction.created_at >= day_start,
+            Transaction.description == description,
+            Transaction.status == "completed",
+        )
+    }
+    connection = db.session.connection()
+    for user_id, amount in charges.items():
+        transaction = posted.get(user_id)
+        if transaction is None:
+            # Added rather than bulk inserted, so the spending rollup's insert hook records it
+            db.session.add(Transaction(
+                user_id=user_id,
+                amount=-amount,
+                status="completed",
+                description=description,
+                created_at=now,
+            ))
+        else:
+            # The rollup only hooks status changes; the day's row already counts this transaction
+            transaction.amount = Transaction.amount - amount
+            spend_rollup.add(connection, user_id, now.date(), CATEGORY, amount, count=0)
+    db.session.flush()
+
+
+def _budget_alerts(user_ids, now):
+    """Record newly crossed budget thresholds for user_ids; returns how many."""
+    if not user_ids or Config.MONTHLY_BUDGET <= 0:
+        return 0
+    month = now.date().replace(day=1)
+    spent = dict(
+        db.session.query(UserSpendDaily.user_id, func.sum(UserSpendDaily.amount))
+        .filter(UserSpendDaily.user_id.in_(user_ids), UserSpendDaily.day >= month)
+        .group_by(UserSpendDaily.user_id)
+    )
+    recorded = set(
+        db.session.query(BudgetAlert.user_id, BudgetAlert.threshold)
+        .filter(BudgetAlert.user_id.in_(user_ids), BudgetAlert.month == month)
+    )
+    alerts = []
+    for user_id in user_ids:
+        user_spent = spent.get(user_id) or 0.0
+        percentage = user_spent / Config.MONTHLY_BUDGET * 100
+        for threshold in Config.BUDGET_ALERT_THRESHOLDS:
+            if percentage >= threshold and (user_id, threshold) not in recorded:
+                alerts.append(BudgetAlert(
+                    user_id=user_id,
+                    month=month,
+                    threshold=threshold,
+                    spent=user_spent,
+                    triggered_at=now,
+                ))
+                logger.info(f"User {user_id} has used {threshold}% of their monthly budget")
+    db.session.add_all(alerts)
+    return len(alerts)
+
+
+def _stop_rentals(user_ids, now):
+    """
+    Stop the active rentals of users with no balance left, in the session.
+    Their usage has been charged up to now, so there is no final charge.
+    Rentals locked elsewhere (being terminated) are skipped, as they are
+    when accruing. Returns how many were stopped and the instance ids to
+    terminate.
+    """
+    rentals = RentalGPU.query.filter(
+        RentalGPU.user_id.in_(user_ids), Cluster._active_filter(now)
+    ).with_for_update(skip_locked=True).populate_existing().all()
+    instance_ids = []
+    for rental in rentals:
+        instance_ids.append(termination.request(rental, now))
+        rental.status = "completed"
+        rental.end_time = now
+        logger.warning(f"Stopping rental {rental.id}: user {rental.user_id} is out of funds")
+    return len(rentals), [instance_id for instance_id in instance_ids if instance_id]
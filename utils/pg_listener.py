@@ -0,0 +1,135 @@
+"""
+Background LISTEN/NOTIFY subscriber.
+
+Each worker process runs one listener thread with its own autocommit
+connection. Modules subscribe a handler to a channel; the handler is called
+with the notification payload. Subscribing the same handler (or name) again
+replaces it, so registering again doesn't multiply calls. Handlers
+registered for the reconnect hook are called after every (re)connect, since
+notifications sent while we were disconnected are lost and state must be
+resynchronised from the database.
+"""
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationListener:
+    def __init__(self, dsn, poll_timeout=5.0, max_backoff=30.0):
+        self.dsn = dsn
+        self.poll_timeout = poll_timeout
+        self.max_backoff = max_backoff
+        self._handlers = defaultdict(dict)
+        self._connect_hooks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = threading.Event()
+
+    def subscribe(self, channel, handler, name=None):
+        """
+        Call handler(payload) for each NOTIFY on channel. It replaces a handler
+        subscribed to channel under the same name (default: the handler itself).
+        """
+        self._handlers[channel][name or handler] = handler
+
+    def on_connect(self, hook, name=None):
+        """Call hook() after each successful (re)connect; replaces a hook of the same name."""
+        self._connect_hooks[name or hook] = hook
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pg-notification-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def dispatch(self, channel, payload):
+        for handler in list(self._handlers.get(channel, {}).values()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception(f"Notification handler for {channel} failed")
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                self.connected.clear()
+                logger.warning(f"Notification listener disconnected: {e}; retrying in {backoff:.0f}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                for channel in self._handlers:
+                    cursor.execute(f'LISTEN "{channel}"')
+            self.connected.set()
+            for hook in list(self._connect_hooks.values()):
+                try:
+                    hook()
+                except Exception:
+                    logger.exception("Notification listener connect hook failed")
+
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    self.dispatch(notification.channel, notification.payload)
+        finally:
+            self.connected.clear()
+            conn.close()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def libpq_dsn(database_uri):
+    """Turn a SQLAlchemy URL (possibly postgresql+psycopg2://) into a libpq DSN."""
+    url = make_url(database_uri).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+def get_listener(database_uri=None):
+    """The process-wide listener, created on first use for a PostgreSQL database."""
+    global _listener
+    with _listener_lock:
+        if _listener is None and database_uri:
+            if make_url(database_uri).get_backend_name() != "postgresql":
+                return None
+            _listener = NotificationListener(libpq_dsn(database_uri))
+        return _listener
+
+
+def start_listener(app):
+    """Start this worker's listener; subscriptions must be registered first."""
+    listener = get_listener(app.config.get("SQLALCHEMY_DATABASE_URI"))
+    if listener is None:
+        app.logger.info("Database does not support LISTEN/NOTIFY; notifications disabled")
+        return None
+    listener.start()
+    return listener
@@ -0,0 +1,333 @@
+"""
+Background provisioning of rental instances.
+
+Deploying used to launch the EC2 instance inside the HTTP request, which
+can wait several minutes for spot fulfilment and boot and outlives the
+gunicorn timeout. Now the deploy route charges the user, creates the rental
+in "provisioning" state and a ProvisioningJob in one transaction, and
+returns 202 straight away; clients poll the job for its status.
+
+Jobs are run by a pool of worker threads (in each web worker, or in a
+dedicated `flask provisioning-worker` process). Workers claim jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can share the
+queue without taking the same job. New jobs send NOTIFY provisioning_jobs
+so idle workers pick them up at once instead of at their next poll.
+
+A job that fails marks its rental failed and refunds the charge. A job
+whose worker died (claimed longer ago than PROVISIONING_JOB_TIMEOUT) is
+taken over by another worker, up to PROVISIONING_MAX_ATTEMPTS claims. The
+launch is idempotent per rental (an EC2 client token), so taking over a job
+whose worker died mid-launch picks up the instance it started.
+
+A multi-node deployment queues one job per node. The worker that claims
+the first of them also claims the rest of the group's queued jobs and
+launches them all at once, so the deployment takes as long as its slowest
+node however few workers there are.
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, or_, text
+
+from config import Config
+from models.provisioning_job import ProvisioningJob
+from models.rental_gpu import RentalGPU
+from models.transaction import Transaction
+from models.user import User
+from utils import balance
+from utils.database import db
+from utils.instance_reconciler import record_instance
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "provisioning_jobs"
+
+
+def enqueue(rental, transaction=None):
+    """Add a job for rental to the session; it is queued when the caller commits."""
+    job = ProvisioningJob(
+        rental_gpu_id=rental.id,
+        cluster_id=rental.cluster_id,
+        user_id=rental.user_id,
+        transaction_id=transaction.id if transaction is not None else None,
+        status=ProvisioningJob.QUEUED,
+        step="queued",
+        attempts=0,
+    )
+    db.session.add(job)
+    return job
+
+
+@event.listens_for(ProvisioningJob, "after_insert")
+def _job_queued(mapper, connection, target):
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_notify(:channel, :job_id)"),
+            {"channel": CHANNEL, "job_id": str(target.id)},
+        )
+
+
+def claim_next(worker_id, now=None):
+    """Lock and mark running the oldest runnable job; None when the queue is empty."""
+    now = now or datetime.utcnow()
+    stale_before = now - timedelta(seconds=Config.PROVISIONING_JOB_TIMEOUT)
+    job = (
+        ProvisioningJob.query.filter(
+            or_(
+                ProvisioningJob.status == ProvisioningJob.QUEUED,
+                and_(
+                    ProvisioningJob.status == ProvisioningJob.RUNNING,
+                    ProvisioningJob.locked_at < stale_before,
+                ),
+            )
+        )
+        .order_by(ProvisioningJob.created_at, ProvisioningJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.session.rollback()
+        return None
+
+    if job.status == ProvisioningJob.RUNNING:
+        logger.warning(f"Taking over provisioning job {job.id} from {job.locked_by}")
+    job.attempts += 1
+    if job.attempts > Config.PROVISIONING_MAX_ATTEMPTS:
+        fail(job, "Provisioning was interrupted too many times")
+        return claim_next(worker_id, now)
+
+    _mark_claimed(job, worker_id, now)
+    db.session.commit()
+    return job
+
+
+def _mark_claimed(job, worker_id, now):
+    job.status = ProvisioningJob.RUNNING
+    job.step = "launching"
+    job.locked_by = worker_id
+    job.locked_at = now
+    job.started_at = job.started_at or now
+
+
+def claim_group(job, worker_id, now=None):
+    """
+    job plus the queued jobs for the other nodes of its node group, all
+    claimed by worker_id. Just [job] for a single-node deployment.
+    """
+    node_group_id = job.rental_gpu.node_group_id if job.rental_gpu else None
+    if node_group_id is None:
+        return [job]
+    now = now or datetime.utcnow()
+    siblings = (
+        ProvisioningJob.query.join(RentalGPU, RentalGPU.id == ProvisioningJob.rental_gpu_id)
+        .filter(
+            RentalGPU.node_group_id == node_group_id,
+            ProvisioningJob.status == ProvisioningJob.QUEUED,
+            ProvisioningJob.id != job.id,
+        )
+        .order_by(ProvisioningJob.id)
+        .with_for_update(of=ProvisioningJob, skip_locked=True)
+        .all()
+    )
+    for sibling in siblings:
+        sibling.attempts += 1
+        _mark_claimed(sibling, worker_id, now)
+    db.session.commit()
+    return [job] + siblings
+
+
+def launch_instance(rental):
+    """Bring up the EC2 instance for rental; returns its details."""
+    return rental.deploy_aws_instance()
+
+
+def run(job, launch=launch_instance):
+    """Drive one claimed job to completion. Returns True if the instance came up."""
+    rental = job.rental_gpu
+    # Stored first, so a launch taken over after this worker dies installs the same key
+    rental.ensure_ssh_key()
+    db.session.flush()
+    # The launch can take minutes: hold no transaction or connection open for it.
+    # The rental stays loaded, detached, for the launch to read, and is merged
+    # back afterwards.
+    db.session.expunge(rental)
+    db.session.commit()
+    try:
+        details = launch(rental)
+    except Exception as e:
+        logger.warning(f"Provisioning job {job.id} failed: {str(e)}")
+        db.session.rollback()
+        fail(job, str(e))
+        return False
+
+    rental = db.session.merge(rental)
+    now = datetime.utcnow()
+    rental.status = "active"
+    rental.start_time = now
+    rental.instance_id = details.get("instance_id")
+    rental.instance_details = details
+    if rental.instance_id:
+        # Seed the instance cache so status and SSH lookups work before the next reconcile
+        record_instance(
+            rental.instance_id,
+            rental_gpu_id=rental.id,
+            state="running",
+            instance_type=details.get("instance_type"),
+            public_ip=details.get("instance_ip"),
+            public_dns=details.get("instance_dns"),
+            region=details.get("region"),
+            now=now,
+        )
+    job.status = ProvisioningJob.SUCCEEDED
+    job.step = "running"
+    job.result = details
+    job.finished_at = now
+    job.locked_by = None
+    db.session.commit()
+    return True
+
+
+def fail(job, error):
+    """Mark the job and its rental failed and refund what was charged at enqueue time."""
+    now = datetime.utcnow()
+    rental = job.rental_gpu
+    if rental is not None:
+        rental.status = "failed"
+        rental.end_time = now
+
+    if job.transaction_id and job.status != ProvisioningJob.FAILED:
+        charge = db.session.get(Transaction, job.transaction_id)
+        user = db.session.get(User, job.user_id)
+        if charge is not None and user is not None and charge.amount < 0:
+            refund = -charge.amount
+            db.session.add(Transaction(
+                user_id=job.user_id,
+                amount=refund,
+                status="completed",
+                description=f"Refund: GPU provisioning failed (job {job.id})",
+            ))
+            balance.credit(user, refund)
+
+    job.status = ProvisioningJob.FAILED
+    job.step = "failed"
+    job.error = error
+    job.finished_at = now
+    job.locked_by = None
+    db.session.commit()
+
+
+def _run_by_id(app, job_id, launch):
+    # Each thread works in its own app context, and so its own session
+    with app.app_context():
+        try:
+            return run(db.session.get(ProvisioningJob, job_id), launch)
+        except Exception:
+            logger.exception(f"Provisioning job {job_id} failed")
+            db.session.rollback()
+            return False
+
+
+def run_all(jobs, launch=launch_instance):
+    """Run claimed jobs concurrently, one thread each; returns once the slowest is done."""
+    if len(jobs) == 1:
+        return [run(jobs[0], launch)]
+    app = current_app._get_current_object()
+    job_ids = [job.id for job in jobs]
+    # The threads load the jobs themselves; don't hold this session's transaction open
+    db.session.commit()
+    with ThreadPoolExecutor(max_workers=len(job_ids), thread_name_prefix="provisioning-node") as executor:
+        return list(executor.map(lambda job_id: _run_by_id(app, job_id, launch), job_ids))
+
+
+def process_next(worker_id, launch=launch_instance):
+    """Claim and run one job, or every node of one deployment. Returns False when there was nothing to do."""
+    job = claim_next(worker_id)
+    if job is None:
+        return False
+    run_all(claim_group(job, worker_id), launch)
+    return True
+
+
+class ProvisioningPool:
+    """Worker threads that run provisioning jobs inside the app context."""
+
+    def __init__(self, app, workers=2, poll_interval=5.0, launch=launch_instance):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.launch = launch
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._run, args=(f"{self._prefix}:{n}",), name=f"provisioning-{n}", daemon=True
+            )
+            for n in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def wake(self, payload=None):
+        """Have idle workers look at the queue now."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    worked = process_next(worker_id, self.launch)
+                except Exception:
+                    logger.exception(f"Provisioning worker {worker_id} failed")
+                    db.session.rollback()
+                    worked = False
+            if not worked:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+_pool = None
+
+
+def start_pool(app, workers=None):
+    global _pool
+    if _pool is None:
+        _pool = ProvisioningPool(
+            app,
+            workers=workers or Config.PROVISIONING_WORKERS,
+            poll_interval=Config.PROVISIONING_POLL_INTERVAL,
+        )
+    _pool.start()
+    return _pool
+
+
+def get_pool():
+    return _pool
+
+
+def _wake_pool(payload=None):
+    if _pool is not None:
+        _pool.wake(payload)
+
+
+def register(listener):
+    """Wake the workers when a job is queued anywhere; re-check the queue after reconnecting."""
+    listener.subscribe(CHANNEL, _wake_pool)
+    listener.on_connect(_wake_pool)
@@ -0,0 +1,453 @@
+"""
+Token-bucket rate limits and daily quotas for the market API.
+
+Every client IP, and every API key, gets a bucket holding up to `burst`
+tokens that refills at `per_minute / 60` tokens a second; each request takes
+one. Keys also have a daily request quota that resets at midnight UTC. Limits
+for a key come from its APIKey row, falling back to the RATE_LIMIT_* and
+API_KEY_DAILY_QUOTA settings.
+
+Bucket state lives in a store shared by all workers, chosen by
+RATE_LIMIT_BACKEND: "shared" (files on /dev/shm updated under flock, one
+host), "redis" (an atomic script, any number of hosts) or "memory" (this
+process only; tests and single-worker setups). If the store is unreachable
+requests are let through rather than failed.
+
+Responses carry RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset
+headers; refused requests get a 429 with Retry-After.
+
+Usage:
+
+    @bp.route('/v1/market/overview')
+    @cross_origin()
+    @rate_limited
+    def get_market_overview():
+        ...
+
+check_api_key applies the per-key limits itself, so keyed routes put
+@rate_limited above @require_api_key.
+"""
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+from config import Config
+from utils.cache_backends import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Limit:
+    # Tokens added per second
+    rate: float
+    # Bucket size: the most requests that can be made back to back
+    burst: int
+
+    @classmethod
+    def per_minute(cls, requests, burst=None):
+        return cls(rate=requests / 60.0, burst=burst or requests)
+
+    def policy(self):
+        """RateLimit-Policy value: the burst within the seconds it takes to refill."""
+        return f"{self.burst};w={math.ceil(self.burst / self.rate)}"
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the bucket (or quota) is full again
+    reset: float
+    # Seconds until a refused request would be admitted
+    retry_after: float = 0.0
+    policy: str = ""
+
+
+def take(tokens, updated_at, now, limit, cost=1):
+    """
+    Refill a bucket that held `tokens` at `updated_at`, then try to take
+    `cost` from it. Returns (tokens left, Decision). A bucket with no
+    state (updated_at None) starts full.
+    """
+    if updated_at is None:
+        tokens = float(limit.burst)
+    else:
+        tokens = min(float(limit.burst), tokens + max(0.0, now - updated_at) * limit.rate)
+    allowed = tokens >= cost
+    if allowed:
+        tokens -= cost
+    return tokens, _decision(allowed, tokens, limit, cost)
+
+
+def _decision(allowed, tokens, limit, cost=1):
+    return Decision(
+        allowed=allowed,
+        limit=limit.burst,
+        remaining=int(tokens),
+        reset=(limit.burst - tokens) / limit.rate,
+        retry_after=0.0 if allowed else (cost - tokens) / limit.rate,
+        policy=limit.policy(),
+    )
+
+
+def _idle_ttl(limit):
+    """Seconds after which an untouched bucket is full again and its state can go."""
+    return limit.burst / limit.rate + 1
+
+
+class MemoryRateStore:
+    """Buckets and counters in this process only."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {}  # key -> (tokens, updated_at, expires_at)
+        self._counters = {}  # key -> (count, expires_at)
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, cost=1):
+        now = time.time()
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None or state[2] <= now:
+                state = (0.0, None, 0)
+            tokens, decision = take(state[0], state[1], now, limit, cost)
+            self._buckets[key] = (tokens, now, now + _idle_ttl(limit))
+            if len(self._buckets) > self.max_entries:
+                self._prune(now)
+        return decision
+
+    def incr(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            count, expires_at = self._counters.get(key, (0, 0))
+            if expires_at <= now:
+                count, expires_at = 0, now + ttl
+            self._counters[key] = (count + 1, expires_at)
+            return count + 1
+
+    def _prune(self, now):
+        for table, expiry in ((self._buckets, 2), (self._counters, 1)):
+            for key in [k for k, state in table.items() if state[expiry] <= now]:
+                del table[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._counters.clear()
+
+
+class SharedRateStore:
+    """
+    Buckets and counters shared by every worker on one host: one small file
+    per key on /dev/shm, read and rewritten while holding an flock on it.
+    """
+
+    # value (tokens or count), updated_at, expires_at
+    RECORD = struct.Struct("!ddd")
+
+    def __init__(self, path=None, prune_interval=1024):
+        if path is None:
+            base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(base, "neotix-ratelimit")
+        self.path = path
+        self.prune_interval = prune_interval
+        os.makedirs(self.path, exist_ok=True)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _file_for(self, key):
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest())
+
+    @contextmanager
+    def _locked(self, key):
+        fd = os.open(self._file_for(key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def _load(self, fd, now):
+        data = os.pread(fd, self.RECORD.size, 0)
+        if len(data) < self.RECORD.size:
+            return None
+        record = self.RECORD.unpack(data)
+        return None if record[2] <= now else record
+
+    def _save(self, fd, value, updated_at, expires_at):
+        os.pwrite(fd, self.RECORD.pack(value, updated_at, expires_at), 0)
+        self._count_write()
+
+    def hit(self, key, limit, cost=1):
+        now = time.time()
+        with self._locked("bucket:" + key) as fd:
+            state = self._load(fd, now)
+            tokens, decision = take(*(state[:2] if state else (0.0, None)), now, limit, cost)
+            self._save(fd, tokens, now, now + _idle_ttl(limit))
+        return decision
+
+    def incr(self, key, ttl):
+        now = time.time()
+        with self._locked("counter:" + key) as fd:
+            state = self._load(fd, now)
+            if state is None:
+                count, expires_at = 1, now + ttl
+            else:
+                count, expires_at = int(state[0]) + 1, state[2]
+            self._save(fd, count, now, expires_at)
+        return count
+
+    def _count_write(self):
+        with self._lock:
+            self._writes += 1
+            prune = self._writes >= self.prune_interval
+            if prune:
+                self._writes = 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Remove expired records. A racing writer can lose at most one request's worth."""
+        now = time.time()
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            try:
+                with open(filename, "rb") as f:
+                    _, _, expires_at = self.RECORD.unpack(f.read(self.RECORD.size))
+                if expires_at <= now:
+                    os.unlink(filename)
+            except (OSError, struct.error):
+                continue
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+
+class RedisRateStore:
+    """Buckets and counters shared across hosts through a Redis-protocol server."""
+
+    # Refill and take in one step, on the server's clock
+    BUCKET_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = burst
+else
+    tokens = math.min(burst, tokens + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="neotix:ratelimit:", client=None):
+        self.client = client or RespClient(url)
+        self.prefix = prefix
+        self._sha = hashlib.sha1(self.BUCKET_SCRIPT.encode()).hexdigest()
+
+    def hit(self, key, limit, cost=1):
+        args = (1, self.prefix + "bucket:" + key, repr(float(limit.burst)), repr(limit.rate), cost)
+        try:
+            allowed, tokens = self.client.execute("EVALSHA", self._sha, *args)
+        except RespError as e:
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            allowed, tokens = self.client.execute("EVAL", self.BUCKET_SCRIPT, *args)
+        return _decision(bool(allowed), float(tokens), limit, cost)
+
+    def incr(self, key, ttl):
+        counter = self.prefix + "counter:" + key
+        # Create with its expiry first so the counter can never outlive its window
+        self.client.execute("SET", counter, 0, "NX", "PX", max(1, int(ttl * 1000)))
+        return self.client.execute("INCR", counter)
+
+    def clear(self):
+        cursor = b"0"
+        while True:
+            cursor, batch = self.client.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500)
+            if batch:
+                self.client.execute("DEL", *batch)
+            if cursor in (b"0", "0"):
+                return
+
+
+def create_store(name, **options):
+    if name == "memory":
+        return MemoryRateStore(**options)
+    if name == "shared":
+        return SharedRateStore(path=options.pop("path", Config.RATE_LIMIT_SHM_PATH), **options)
+    if name == "redis":
+        return RedisRateStore(url=options.pop("url", Config.RATE_LIMIT_REDIS_URL), **options)
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(Config.RATE_LIMIT_BACKEND)
+    return _store
+
+
+def set_store(store):
+    """Replace the store (e.g. in tests). Returns the previous one."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+def _hit(key, limit):
+    try:
+        return get_store().hit(key, limit)
+    except Exception as e:
+        logger.warning(f"Rate limit store unavailable, admitting request: {e}")
+        return None
+
+
+def client_ip():
+    """The client's address, trusting X-Forwarded-For only from RATE_LIMIT_TRUSTED_PROXIES hops."""
+    hops = Config.RATE_LIMIT_TRUSTED_PROXIES
+    forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+    if hops and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.remote_addr or "unknown"
+
+
+def _seconds_until_midnight_utc(now=None):
+    now = now or datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+def _remember(decision):
+    """Keep the most restrictive decision of this request for the response headers."""
+    current = g.get("rate_limit")
+    if current is None or (not decision.allowed) or (
+        current.allowed and decision.remaining / decision.limit < current.remaining / current.limit
+    ):
+        g.rate_limit = decision
+
+
+def rate_limit_headers(decision):
+    headers = {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(max(0, decision.remaining)),
+        "RateLimit-Reset": str(math.ceil(decision.reset)),
+        "RateLimit-Policy": decision.policy,
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(decision.retry_after)))
+    return headers
+
+
+def too_many_requests(decision, message):
+    response = jsonify({"error": "Too many requests", "message": message})
+    response.status_code = 429
+    response.headers.update(rate_limit_headers(decision))
+    return response
+
+
+def with_rate_limit_headers(result):
+    """Make a response from a view's return value and add this request's RateLimit-* headers."""
+    response = current_app.make_response(result)
+    decision = g.get("rate_limit")
+    if decision is not None and Config.RATE_LIMIT_ENABLED:
+        for name, value in rate_limit_headers(decision).items():
+            response.headers.setdefault(name, value)
+    return response
+
+
+def limit_ip():
+    """Take a token from the caller's IP bucket; returns a 429 response or None."""
+    if not Config.RATE_LIMIT_ENABLED:
+        return None
+    limit = Limit.per_minute(Config.RATE_LIMIT_IP_PER_MINUTE, Config.RATE_LIMIT_IP_BURST)
+    decision = _hit(f"ip:{client_ip()}", limit)
+    if decision is None:
+        return None
+    _remember(decision)
+    if not decision.allowed:
+        return too_many_requests(decision, "Rate limit exceeded for this address; retry later")
+    return None
+
+
+def limit_api_key(key):
+    """Take a token from a key's bucket and count it against its daily quota."""
+    if not Config.RATE_LIMIT_ENABLED:
+        return None
+    limit = Limit.per_minute(
+        key.rate_limit_per_minute or Config.RATE_LIMIT_KEY_PER_MINUTE,
+        key.rate_limit_burst or Config.RATE_LIMIT_KEY_BURST,
+    )
+    decision = _hit(f"key:{key.id}", limit)
+    if decision is None:
+        return None
+    _remember(decision)
+    if not decision.allowed:
+        return too_many_requests(decision, "Rate limit exceeded for this API key; retry later")
+
+    quota = key.daily_quota if key.daily_quota is not None else Config.API_KEY_DAILY_QUOTA
+    if not quota:
+        return None
+    now = datetime.now(timezone.utc)
+    until_midnight = _seconds_until_midnight_utc(now)
+    try:
+        used = get_store().incr(f"quota:{key.id}:{now.date().isoformat()}", until_midnight + 60)
+    except Exception as e:
+        logger.warning(f"Rate limit store unavailable, skipping quota check: {e}")
+        return None
+    if used > quota:
+        exhausted = Decision(
+            allowed=False, limit=quota, remaining=0, reset=until_midnight,
+            retry_after=until_midnight, policy=f"{quota};w=86400",
+        )
+        g.rate_limit = exhausted
+        return too_many_requests(exhausted, "Daily quota exceeded for this API key")
+    return None
+
+
+def rate_limited(view):
+    """Apply the per-IP limit to a view and add RateLimit-* headers to its responses."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        denied = limit_ip()
+        if denied is not None:
+            return denied
+        return with_rate_limit_headers(view(*args, **kwargs))
+
+    return wrapper
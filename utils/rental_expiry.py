@@ -0,0 +1,47 @@
+"""
+Periodic expiry of rentals past their end time.
+
+Serialization derives the status with RentalGPU.current_status() and never
+writes; every RENTAL_EXPIRY_INTERVAL seconds this sweeper stores it for all
+expired rentals in one UPDATE. The UPDATE returns the rentals it completed,
+whose instances are queued for termination in the same transaction and sent
+TerminateInstances after it commits (utils/termination.py). A rental only
+matches while it is active, so it is safe for every worker to run it.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import update
+
+from models.rental_gpu import RentalGPU
+from utils import termination
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def expire_rentals(aws=None, now=None):
+    """
+    Mark active rentals whose end time has passed as completed and terminate
+    their instances; returns how many.
+    """
+    now = now or datetime.utcnow()
+    expired = db.session.scalars(
+        update(RentalGPU)
+        .where(
+            RentalGPU.status == "active",
+            RentalGPU.end_time.isnot(None),
+            RentalGPU.end_time < now,
+        )
+        .values(status="completed", updated_at=now)
+        .returning(RentalGPU)
+        .execution_options(synchronize_session=False)
+    ).all()
+    instance_ids = [termination.request(rental, now) for rental in expired]
+    db.session.commit()
+    instance_ids = [instance_id for instance_id in instance_ids if instance_id]
+    if instance_ids:
+        termination.send(instance_ids, aws=aws)
+    if expired:
+        logger.info(f"Expired {len(expired)} rentals")
+    return len(expired)
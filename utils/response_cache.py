@@ -0,0 +1,162 @@
+"""
+HTTP response caching for public GET endpoints.
+
+memory_cache keys on Python arguments, which for a Flask view don't include
+the query string. cache_response keys on the request path plus a normalized
+query string instead, stores the finished response (status, headers, body)
+in the configured cache backend and handles the HTTP side: ETag,
+Cache-Control, Vary and 304 answers to If-None-Match.
+
+Usage:
+
+    CATALOG_POLICY = CachePolicy(ttl=Config.CATALOG_CACHE_TTL, max_age=60)
+
+    @bp.route("/filtered")
+    @cache_response(CATALOG_POLICY)
+    def get_filtered_gpus():
+        ...
+"""
+import hashlib
+from dataclasses import dataclass
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, request
+
+from utils.cache import get_or_compute
+from utils.catalog_version import current_catalog_version
+
+# Headers that describe the body and are safe to replay from the cache
+STORED_HEADERS = ("Content-Type", "Content-Language", "Content-Disposition")
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How one route's responses are cached"""
+
+    # Seconds a response is kept server side
+    ttl: int = 60
+    # Seconds clients and shared caches may reuse a response without revalidating
+    max_age: int = 0
+    # Whether shared caches (CDNs, proxies) may store the response
+    public: bool = True
+    # Key by catalog version so a new ingest switches to fresh responses at once
+    versioned: bool = True
+    # Seconds an expired (or previous-version) response is still served while
+    # it is recomputed in the background
+    stale_ttl: int = 0
+    # Seconds before expiry at which a requested entry is recomputed in the background
+    refresh_ahead: int = 0
+    # Request headers the response depends on
+    vary: tuple = ("Accept-Encoding",)
+    # Query parameters that never change the response (e.g. cache busters)
+    ignore_params: tuple = ("_",)
+    # Multi-valued parameters whose order doesn't matter; "name[]" params always qualify
+    unordered_params: tuple = ()
+
+    def cache_control(self):
+        visibility = "public" if self.public else "private"
+        if self.stale_ttl:
+            return f"{visibility}, max-age={self.max_age}, stale-while-revalidate={self.stale_ttl}"
+        return f"{visibility}, max-age={self.max_age}, must-revalidate"
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: list
+    body: bytes
+    etag: str
+
+
+def normalize_query(args, policy):
+    """
+    Canonical query string: keys sorted, blank values and ignored parameters
+    dropped, and values of unordered list parameters sorted.
+    """
+    items = []
+    for key in sorted(args.keys()):
+        if key in policy.ignore_params:
+            continue
+        values = [value for value in args.getlist(key) if value.strip() != ""]
+        if key.endswith("[]") or key in policy.unordered_params:
+            values = sorted(values)
+        items.extend((key, value) for value in values)
+    return urlencode(items)
+
+
+def response_cache_key(policy):
+    """Returns (key, alias); alias tracks the latest version's entry for stale reads."""
+    key = f"response:{request.path}?{normalize_query(request.args, policy)}"
+    alias = None
+    if policy.versioned:
+        if policy.stale_ttl:
+            alias = f"latest:{key}"
+        key = f"v{current_catalog_version()}:{key}"
+    return key, alias
+
+
+def _capture(view, args, kwargs):
+    """Run the view and reduce its response to something the backend can store."""
+    response = current_app.make_response(view(*args, **kwargs))
+    if response.direct_passthrough or response.is_streamed:
+        # Can't be stored; hand the live response back uncached
+        return response
+    body = response.get_data()
+    return CachedResponse(
+        status=response.status_code,
+        headers=[(name, value) for name, value in response.headers if name in STORED_HEADERS],
+        body=body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+    )
+
+
+def _is_cacheable(captured):
+    return isinstance(captured, CachedResponse) and captured.status == 200
+
+
+def _apply_http_caching(response, etag, policy):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = policy.cache_control()
+    for header in policy.vary:
+        response.vary.add(header)
+    return response
+
+
+def cache_response(policy=None):
+    """Cache a GET view's response according to policy."""
+    policy = policy or CachePolicy()
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+
+            key, alias = response_cache_key(policy)
+            captured = get_or_compute(
+                key,
+                lambda: _capture(view, args, kwargs),
+                policy.ttl,
+                cacheable=_is_cacheable,
+                stale_ttl=policy.stale_ttl,
+                refresh_ahead=policy.refresh_ahead,
+                alias=alias,
+            )
+            if not isinstance(captured, CachedResponse):
+                return captured
+            if captured.status != 200:
+                return current_app.response_class(
+                    captured.body, status=captured.status, headers=captured.headers
+                )
+
+            if request.if_none_match.contains(captured.etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(
+                    captured.body, status=captured.status, headers=captured.headers
+                )
+            return _apply_http_caching(response, captured.etag, policy)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+"""
+Final billing of ended rentals.
+
+A rental's deposit and whatever metering has charged since (utils/metering.py)
+pay for its usage so far. When it ends, final_charge() bills the rest of its
+cost, rounded up to whole hours, as a completed transaction. The terminate
+route bills through it, and settle() does the same for rentals that end in
+the background, such as an instance that disappeared, before marking them
+completed. Callers lock the rentals first (FOR UPDATE), since the metering
+tick skips locked rentals rather than charging them twice.
+"""
+import logging
+
+from models.deployment_cost import DeploymentCost
+from models.transaction import Transaction
+from utils import balance, billing, metering
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def final_charge(rental, user, now):
+    """
+    Charge the balance of a terminated rental beyond its deposit (in the
+    session). Returns its usage; raises LookupError if its records are missing.
+    """
+    # All deployments are now on-demand (no fixed duration)
+    start_time = rental.start_time
+
+    # Calculate the duration in hours (rounded up to the nearest hour)
+    duration = now - start_time
+    hours_used = max(1, (duration.total_seconds() + 3599) // 3600)  # Round up to nearest hour
+
+    # Get the GPU to calculate costs
+    gpu = rental.gpu_listing
+    if not gpu:
+        raise LookupError("GPU listing not found")
+
+    # Calculate final costs
+    final = billing.charge(gpu.current_price, hours_used)
+    total_cost = float(final.total_cost)
+
+    # Retrieve the initial deposit transaction
+    # Find the DeploymentCost record for this rental
+    deployment_cost = DeploymentCost.query.filter_by(rental_gpu_id=rental.id).first()
+    if not deployment_cost:
+        raise LookupError("Deployment cost record not found")
+
+    # Get the initial transaction amount
+    initial_transaction = db.session.get(Transaction, deployment_cost.transaction_id)
+    if not initial_transaction:
+        raise LookupError("Initial transaction record not found")
+
+    initial_amount = abs(initial_transaction.amount)  # Convert to positive amount
+
+    # Calculate the remaining amount to charge, less what metering already charged
+    already_paid = metering.paid(rental.accrued_amount, initial_amount)
+    remaining_amount = total_cost - already_paid
+
+    if remaining_amount > 0:
+        # Create a transaction for the remaining amount
+        transaction = Transaction(
+            user_id=user.id,
+            amount=-remaining_amount,  # Negative amount for a debit
+            status="completed",
+            description=f"GPU Rental Final Charge: {gpu.configuration.gpu_name} - {hours_used} hours used"
+        )
+        db.session.add(transaction)
+        db.session.flush()  # This assigns the ID without committing
+
+        # Update the user's balance
+        balance.adjust(user, -remaining_amount)
+
+        # Update the deployment cost record with the final values
+        deployment_cost.base_cost = float(final.base_cost)
+        deployment_cost.tax_amount = float(final.tax_amount)
+        deployment_cost.platform_fee_amount = float(final.platform_fee_amount)
+        deployment_cost.total_cost = total_cost
+
+    return {
+        "rental_gpu_id": rental.id,
+        "node_index": rental.node_index,
+        "hours_used": int(hours_used),
+        "start_time": start_time.isoformat(),
+        "end_time": now.isoformat(),
+        "total_cost": total_cost,
+        "initial_charge": initial_amount,
+        "accrued_charge": already_paid - initial_amount,
+        "final_charge": max(0, remaining_amount)
+    }
+
+
+def settle(rental, ended_at):
+    """
+    Make the final charge for an active rental that ended at ended_at and
+    mark it completed (in the session). Returns its usage, or None if it
+    could not be billed; it is completed either way.
+    """
+    usage = None
+    if rental.start_time is not None:
+        try:
+            usage = final_charge(rental, rental.user, ended_at)
+        except LookupError as e:
+            logger.warning(f"Rental {rental.id} completed without a final charge: {str(e)}")
+    rental.status = "completed"
+    rental.end_time = ended_at
+    return usage
@@ -0,0 +1,151 @@
+"""
+Per-user daily spending rollup (user_spend_daily).
+
+Every completed debit (a transaction with a negative amount) is added to
+its user's row for that UTC day and category in the same flush that writes
+the transaction, with an upsert, so the rollup commits or rolls back with
+it. That happens when a transaction is inserted as completed or later
+updated to completed.
+
+backfill() rebuilds the rollup from transactions, for first deployment or
+after fixing transactions by hand (`flask backfill-spend-rollup`).
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, inspect, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models.transaction import Transaction
+from models.user_spend_daily import UserSpendDaily
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = "completed"
+UNCATEGORIZED = "Other"
+
+_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def category_of(description):
+    """Category of a transaction description: the part before its first colon."""
+    if not description:
+        return UNCATEGORIZED
+    category = description.split(":")[0] if ":" in description else description
+    return category.strip()[:255] or UNCATEGORIZED
+
+
+def _is_spend(transaction):
+    return transaction.status == COMPLETED and (transaction.amount or 0) < 0
+
+
+def add(connection, user_id, day, category, amount, count=1):
+    """Add amount (positive dollars) and count to a rollup row, creating it if needed."""
+    values = {
+        "user_id": user_id,
+        "day": day,
+        "category": category,
+        "amount": amount,
+        "transaction_count": count,
+    }
+    insert = _INSERTS.get(connection.dialect.name)
+    if insert is not None:
+        statement = insert(UserSpendDaily).values(**values)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=["user_id", "day", "category"],
+            set_={
+                "amount": UserSpendDaily.amount + statement.excluded.amount,
+                "transaction_count": UserSpendDaily.transaction_count + statement.excluded.transaction_count,
+            },
+        ))
+        return
+    # No upsert: update, then insert if there was nothing to update
+    result = connection.execute(
+        update(UserSpendDaily)
+        .where(
+            UserSpendDaily.user_id == user_id,
+            UserSpendDaily.day == day,
+            UserSpendDaily.category == category,
+        )
+        .values(
+            amount=UserSpendDaily.amount + amount,
+            transaction_count=UserSpendDaily.transaction_count + count,
+        )
+    )
+    if not result.rowcount:
+        connection.execute(UserSpendDaily.__table__.insert().values(**values))
+
+
+def _record(connection, transaction):
+    created_at = transaction.created_at or datetime.utcnow()
+    add(
+        connection,
+        transaction.user_id,
+        created_at.date(),
+        category_of(transaction.description),
+        -transaction.amount,
+    )
+
+
+@event.listens_for(Transaction, "after_insert")
+def _transaction_inserted(mapper, connection, target):
+    if _is_spend(target):
+        _record(connection, target)
+
+
+@event.listens_for(Transaction, "after_update")
+def _transaction_updated(mapper, connection, target):
+    status = inspect(target).attrs.status.history
+    if status.has_changes() and COMPLETED not in status.deleted and _is_spend(target):
+        _record(connection, target)
+
+
+def backfill(user_id=None):
+    """
+    Rebuild the rollup from completed debits, for one user or everyone.
+    Returns the number of rollup rows written.
+    """
+    day = func.date(Transaction.created_at)
+    query = db.session.query(
+        Transaction.user_id,
+        day,
+        Transaction.description,
+        func.sum(-Transaction.amount),
+        func.count(Transaction.id),
+    ).filter(
+        Transaction.status == COMPLETED,
+        Transaction.amount < 0,
+        Transaction.created_at.isnot(None),
+    ).group_by(Transaction.user_id, day, Transaction.description)
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+
+    # Descriptions vary (e.g. hours used), so several may share a category
+    rows = {}
+    for row_user_id, row_day, description, amount, count in query:
+        if isinstance(row_day, str):
+            row_day = datetime.strptime(row_day, "%Y-%m-%d").date()
+        key = (row_user_id, row_day, category_of(description))
+        total, total_count = rows.get(key, (0.0, 0))
+        rows[key] = (total + float(amount), total_count + count)
+
+    clear = delete(UserSpendDaily)
+    if user_id is not None:
+        clear = clear.where(UserSpendDaily.user_id == user_id)
+    db.session.execute(clear.execution_options(synchronize_session=False))
+    if rows:
+        db.session.execute(UserSpendDaily.__table__.insert(), [
+            {
+                "user_id": key[0],
+                "day": key[1],
+                "category": key[2],
+                "amount": amount,
+                "transaction_count": count,
+            }
+            for key, (amount, count) in rows.items()
+        ])
+    db.session.commit()
+    logger.info(f"Rebuilt {len(rows)} spending rollup rows")
+    return len(rows)
@@ -0,0 +1,316 @@
+"""
+Launching an instance wherever capacity turns up first.
+
+A spot request in a single zone can sit unfulfilled for minutes when that
+capacity pool is dry. Instead, a request is submitted concurrently in every
+zone of AWS_LAUNCH_ZONES, which may span regions. Open requests are polled
+with one batched describe per region. The first one fulfilled wins; the rest
+are cancelled, and any instance a losing request launched in the meantime is
+terminated. If nothing is fulfilled within SPOT_FULFILMENT_DEADLINE seconds,
+an on-demand instance is launched instead, trying the zones in order. If
+anything fails part-way (a throttled describe, a failed tag), every request
+still open is cancelled and every instance they launched is terminated before
+the error is raised, so a failed launch leaves nothing running.
+
+Given a client token, every request carries an idempotency token derived
+from it and the zone. Launching again with the same token (a job taken over
+after its worker died mid-launch) gets the earlier requests and instances
+back instead of launching more.
+"""
+import base64
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Spot requests in these states, or with these status codes, will never be fulfilled
+CLOSED_STATES = ("cancelled", "closed", "failed")
+FAILED_STATUS_CODES = (
+    "bad-parameters",
+    "constraint-not-fulfillable",
+    "price-too-low",
+    "schedule-expired",
+    "system-error",
+)
+# On-demand launch errors after which the next zone is worth trying
+CAPACITY_ERRORS = (
+    "InsufficientInstanceCapacity",
+    "InstanceLimitExceeded",
+    "Unsupported",
+    "VcpuLimitExceeded",
+)
+
+
+class LaunchError(Exception):
+    """No zone had capacity for the instance."""
+
+
+def launch_zones():
+    return [zone.strip() for zone in Config.AWS_LAUNCH_ZONES.split(",") if zone.strip()]
+
+
+def region_of(zone):
+    """Region of an availability zone, e.g. us-east-1a -> us-east-1."""
+    return zone[:-1]
+
+
+def ami_ids():
+    """Configured AMI for each region."""
+    pairs = (pair.split("=", 1) for pair in Config.AWS_AMI_IDS.split(",") if "=" in pair)
+    return {region.strip(): ami.strip() for region, ami in pairs}
+
+
+def launch_regions():
+    """Every region instances may run in, the default region first."""
+    regions = [Config.AWS_REGION]
+    for zone in launch_zones():
+        if region_of(zone) not in regions:
+            regions.append(region_of(zone))
+    return regions
+
+
+class Placement:
+    """One zone being tried, with the manager for its region"""
+
+    def __init__(self, zone, aws, ami_id):
+        self.zone = zone
+        self.aws = aws
+        self.ami_id = ami_id
+        self.request_id = None
+        self.instance_id = None
+        self.closed = False
+        self.error = None
+
+    def idempotency(self, client_token):
+        """ClientToken argument for this zone's request, if launching with a client token"""
+        return {"ClientToken": f"{client_token}-{self.zone}"} if client_token else {}
+
+    def specification(self, instance_type, key_name=None):
+        specification = {
+            "ImageId": self.ami_id,
+            "InstanceType": instance_type,
+            "Placement": {"AvailabilityZone": self.zone},
+        }
+        if key_name:
+            specification["KeyName"] = key_name
+        return specification
+
+
+def _placements(zones, ami_id=None):
+    from utils.aws_utils import AWSManager
+    amis = ami_ids()
+    if ami_id:
+        amis[Config.AWS_REGION] = ami_id
+    managers = {}
+    placements = []
+    for zone in zones:
+        region = region_of(zone)
+        if region not in amis:
+            logger.warning(f"No AMI configured for {region}; not launching in {zone}")
+            continue
+        if region not in managers:
+            managers[region] = AWSManager(region)
+        placements.append(Placement(zone, managers[region], amis[region]))
+    return placements
+
+
+def _by_region(placements):
+    regions = {}
+    for placement in placements:
+        regions.setdefault(placement.aws.region, []).append(placement)
+    return regions.values()
+
+
+def _error_code(error):
+    return error.response.get("Error", {}).get("Code")
+
+
+def _request_spot(placement, instance_type, key_name, user_data, client_token=None):
+    specification = placement.specification(instance_type, key_name)
+    if user_data:
+        # Unlike RunInstances, RequestSpotInstances takes user data already encoded
+        specification["UserData"] = base64.b64encode(user_data.encode()).decode()
+    try:
+        response = placement.aws.call_with_security_group(
+            lambda group_ids: placement.aws.ec2_client.request_spot_instances(
+                InstanceCount=1,
+                Type="one-time",
+                LaunchSpecification={**specification, "SecurityGroupIds": group_ids},
+                **placement.idempotency(client_token),
+            )
+        )
+    except ClientError as e:
+        logger.info(f"Spot request in {placement.zone} failed: {e}")
+        placement.error = _error_code(e)
+        return
+    placement.request_id = response["SpotInstanceRequests"][0]["SpotInstanceRequestId"]
+
+
+def _describe(placements):
+    """Refresh each placement from its spot request, one describe call per region."""
+    for placements_in_region in _by_region(placements):
+        aws = placements_in_region[0].aws
+        try:
+            response = aws.ec2_client.describe_spot_instance_requests(
+                SpotInstanceRequestIds=[p.request_id for p in placements_in_region]
+            )
+        except ClientError as e:
+            # Just-created requests can take a moment to become visible
+            if _error_code(e) == "InvalidSpotInstanceRequestID.NotFound":
+                continue
+            raise
+        requests = {r["SpotInstanceRequestId"]: r for r in response["SpotInstanceRequests"]}
+        for placement in placements_in_region:
+            request = requests.get(placement.request_id)
+            if request is None:
+                continue
+            status = request.get("Status", {})
+            if request.get("InstanceId"):
+                placement.instance_id = request["InstanceId"]
+            elif request["State"] in CLOSED_STATES or status.get("Code") in FAILED_STATUS_CODES:
+                placement.closed = True
+                placement.error = status.get("Code", request["State"])
+
+
+def _cancel(placements):
+    """Cancel open spot requests; returns those that launched an instance first."""
+    if not placements:
+        return []
+    for placements_in_region in _by_region(placements):
+        placements_in_region[0].aws.ec2_client.cancel_spot_instance_requests(
+            SpotInstanceRequestIds=[p.request_id for p in placements_in_region]
+        )
+    # A request can be fulfilled between the last poll and its cancellation
+    _describe(placements)
+    return [p for p in placements if p.instance_id]
+
+
+def _terminate(placements):
+    for placements_in_region in _by_region(placements):
+        instance_ids = [p.instance_id for p in placements_in_region]
+        logger.info(f"Terminating surplus spot instances {instance_ids}")
+        placements_in_region[0].aws.ec2_client.terminate_instances(InstanceIds=instance_ids)
+
+
+def _abandon(placements):
+    """
+    Clean up after a launch that failed part-way: cancel every spot request
+    still open and terminate every instance launched for one, as far as AWS
+    allows. Errors are logged so the original one is what the caller sees.
+    """
+    try:
+        _cancel([p for p in placements if p.request_id and not p.closed])
+    except Exception as e:
+        logger.warning(f"Cancelling spot requests after a failed launch failed: {str(e)}")
+    launched = [p for p in placements if p.instance_id]
+    try:
+        if launched:
+            _terminate(launched)
+    except Exception as e:
+        logger.warning(f"Terminating instances after a failed launch failed: {str(e)}")
+
+
+def _launch_on_demand(placements, instance_type, key_name, user_data, tags, client_token=None):
+    for placement in placements:
+        specification = placement.specification(instance_type, key_name)
+        if user_data:
+            specification["UserData"] = user_data
+        try:
+            response = placement.aws.call_with_security_group(
+                lambda group_ids: placement.aws.ec2_client.run_instances(
+                    MinCount=1,
+                    MaxCount=1,
+                    SecurityGroupIds=group_ids,
+                    TagSpecifications=[{
+                        "ResourceType": "instance",
+                        "Tags": placement.aws.instance_tags(tags),
+                    }],
+                    **specification,
+                    **placement.idempotency(client_token),
+                )
+            )
+        except ClientError as e:
+            if _error_code(e) not in CAPACITY_ERRORS:
+                raise
+            logger.info(f"On-demand launch in {placement.zone} failed: {e}")
+            placement.error = _error_code(e)
+            continue
+        placement.instance_id = response["Instances"][0]["InstanceId"]
+        return placement
+    return None
+
+
+def _failure(instance_type, placements):
+    tried = ", ".join(f"{p.zone} ({p.error or 'not fulfilled'})" for p in placements)
+    return LaunchError(
+        f"No capacity available for {instance_type} in any zone: {tried}. "
+        "Please try again in a few minutes."
+    )
+
+
+def launch(instance_type, key_name=None, user_data=None, ami_id=None, tags=None, zones=None,
+           client_token=None, deadline=None, poll_interval=None, on_demand_fallback=None,
+           clock=time.monotonic, sleep=time.sleep):
+    """
+    Launch one tagged instance in whichever zone has capacity first.
+    Returns (aws, instance_id, zone, market), where aws is the AWSManager for
+    the instance's region and market is "spot" or "on-demand". Launching
+    again with the same client_token returns the same instance.
+    """
+    deadline = Config.SPOT_FULFILMENT_DEADLINE if deadline is None else deadline
+    poll_interval = Config.SPOT_POLL_INTERVAL if poll_interval is None else poll_interval
+    if on_demand_fallback is None:
+        on_demand_fallback = Config.ON_DEMAND_FALLBACK
+
+    placements = _placements(zones or launch_zones(), ami_id)
+    if not placements:
+        raise LaunchError("No launch zone has an AMI configured")
+
+    winner = None
+    settled = False
+    try:
+        with ThreadPoolExecutor(max_workers=len(placements)) as pool:
+            list(pool.map(lambda p: _request_spot(p, instance_type, key_name, user_data, client_token),
+                          placements))
+
+        started = clock()
+        pending = [p for p in placements if p.request_id]
+        while pending:
+            _describe(pending)
+            fulfilled = [p for p in pending if p.instance_id]
+            if fulfilled:
+                winner = fulfilled[0]
+                break
+            pending = [p for p in pending if not p.closed]
+            if not pending or clock() - started >= deadline:
+                break
+            sleep(poll_interval)
+
+        late = _cancel([
+            p for p in placements if p.request_id and not p.closed and p is not winner
+        ])
+        if winner is None and late:
+            winner, late = late[0], late[1:]
+        if late:
+            _terminate(late)
+        if winner is not None:
+            winner.aws.tag_instance(winner.instance_id, tags)
+        settled = True
+    finally:
+        if not settled:
+            _abandon(placements)
+    if winner is not None:
+        return winner.aws, winner.instance_id, winner.zone, "spot"
+
+    if not on_demand_fallback:
+        raise _failure(instance_type, placements)
+    logger.info(f"No spot capacity for {instance_type} within {deadline}s; launching on-demand")
+    placement = _launch_on_demand(placements, instance_type, key_name, user_data, tags, client_token)
+    if placement is None:
+        raise _failure(instance_type, placements)
+    return placement.aws, placement.instance_id, placement.zone, "on-demand"
@@ -0,0 +1,128 @@
+"""
+Instance termination outside the request path.
+
+Terminating a rental records the intent on its rental_instances row
+(terminate_requested_at) in the same transaction as the final billing.
+Once that commits, TerminateInstances is sent without waiting for the
+instance to stop. Every TERMINATION_CONFIRM_INTERVAL seconds one worker
+checks every requested termination with one DescribeInstances call per
+region. It marks terminated instances, settles rentals that are still
+active (their final charge, utils/settlement.py), and re-sends TerminateInstances for any instance still running,
+for example if the first call failed or the process died before sending it.
+"""
+import logging
+from datetime import datetime
+
+from config import Config
+from models.rental_gpu import RentalGPU
+from models.rental_instance import RentalInstance
+from utils import settlement
+from utils.database import db, try_advisory_lock
+
+logger = logging.getLogger(__name__)
+
+# Key for pg_try_advisory_xact_lock so only one worker confirms at a time
+ADVISORY_LOCK_KEY = 0x4E54_0003
+
+
+def instance_id_of(rental):
+    if rental.instance_id:
+        return rental.instance_id
+    if rental.ssh_keys:
+        return rental.ssh_keys[0].get("instance_id")
+    return None
+
+
+def request(rental, now=None):
+    """
+    Record that rental's instance should be terminated (in the current
+    session; nothing is sent to AWS). Returns the instance id, or None.
+    """
+    instance_id = instance_id_of(rental)
+    if not instance_id:
+        return None
+    now = now or datetime.utcnow()
+    row = db.session.get(RentalInstance, instance_id)
+    if row is None:
+        row = RentalInstance(
+            instance_id=instance_id,
+            rental_gpu_id=rental.id,
+            region=rental.region or Config.AWS_REGION,
+            state="running",
+            last_seen_at=now,
+        )
+        db.session.add(row)
+    row.terminate_requested_at = row.terminate_requested_at or now
+    return instance_id
+
+
+def _managers(rows, aws=None):
+    """Rows grouped under the AWSManager for their region."""
+    from utils.aws_utils import AWSManager
+    by_region = {}
+    for row in rows:
+        by_region.setdefault(row.region or Config.AWS_REGION, []).append(row)
+    return [(aws or AWSManager(region), rows) for region, rows in by_region.items()]
+
+
+def send(instance_ids, aws=None):
+    """
+    Send TerminateInstances for committed requests. Failures are logged and
+    left for confirm_terminations to retry.
+    """
+    rows = [row for row in (db.session.get(RentalInstance, i) for i in instance_ids if i) if row]
+    for manager, rows_in_region in _managers(rows, aws):
+        try:
+            manager.terminate_instances([row.instance_id for row in rows_in_region])
+        except Exception as e:
+            logger.warning(f"TerminateInstances failed, will retry: {str(e)}")
+
+
+def confirm_terminations(aws=None, now=None):
+    """
+    Check requested terminations against EC2. Returns a summary, or None if
+    another worker is already confirming.
+    """
+    if not try_advisory_lock(ADVISORY_LOCK_KEY):
+        db.session.rollback()
+        return None
+
+    now = now or datetime.utcnow()
+    rows = RentalInstance.query.filter(
+        RentalInstance.terminate_requested_at.isnot(None),
+        RentalInstance.state != "terminated",
+    ).all()
+
+    confirmed = resent = 0
+    for manager, rows_in_region in _managers(rows, aws):
+        states = manager.instance_states([row.instance_id for row in rows_in_region])
+        retry = []
+        for row in rows_in_region:
+            # Instances drop out of DescribeInstances a while after terminating
+            row.state = states.get(row.instance_id, "terminated")
+            row.last_seen_at = now
+            if row.state == "terminated":
+                confirmed += 1
+            elif row.state != "shutting-down":
+                retry.append(row.instance_id)
+        if retry:
+            try:
+                manager.terminate_instances(retry)
+                resent += len(retry)
+            except Exception as e:
+                logger.warning(f"Re-sending TerminateInstances for {retry} failed: {str(e)}")
+
+    # Rentals terminated by any path other than the terminate route
+    finalized = 0
+    rental_ids = [row.rental_gpu_id for row in rows if row.rental_gpu_id]
+    if rental_ids:
+        for rental in RentalGPU.query.filter(
+            RentalGPU.id.in_(rental_ids), RentalGPU.status == "active"
+        ).with_for_update().populate_existing():
+            # Billed like the terminate route, up to the end time it was given if earlier
+            ended_at = min(rental.end_time, now) if rental.end_time else now
+            settlement.settle(rental, ended_at)
+            finalized += 1
+
+    db.session.commit()
+    return {"confirmed": confirmed, "resent": resent, "rentals_finalized": finalized}
@@ -0,0 +1,219 @@
+"""
+Local verification of Firebase ID tokens.
+
+firebase_admin's verify_id_token(check_revoked=True) makes a call to Firebase
+for every request. Here signatures are checked locally against Google's
+public certificates (cached for as long as their Cache-Control allows),
+verified claims are cached until the token expires, and the per-user
+revocation lookup is repeated at most every AUTH_REVOCATION_CHECK_INTERVAL
+seconds. Errors are raised as the firebase_admin.auth exception types the
+middleware already handles.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
+from firebase_admin import auth
+
+from config import Config
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+ISSUER_PREFIX = "https://securetoken.google.com/"
+
+
+def fetch_google_certs(url=GOOGLE_CERTS_URL, timeout=5):
+    """Returns ({kid: PEM certificate}, max-age seconds from Cache-Control)."""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return response.json(), int(match.group(1)) if match else 0
+
+
+class PublicKeyCache:
+    """Google's token-signing keys, refetched when their Cache-Control max-age runs out."""
+
+    # Don't refetch for an unknown kid more often than this (e.g. forged headers)
+    MIN_REFETCH_INTERVAL = 60
+
+    def __init__(self, fetch=fetch_google_certs):
+        self.fetch = fetch
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, kid):
+        now = time.time()
+        if now >= self._expires_at:
+            self._refresh(now)
+        elif kid not in self._keys and now - self._fetched_at > self.MIN_REFETCH_INTERVAL:
+            # Keys may have rotated before the cached set expired
+            self._refresh(now)
+        return self._keys.get(kid)
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._fetched_at > now:
+                return  # Another thread refreshed while we waited
+            try:
+                certs, max_age = self.fetch()
+            except Exception as e:
+                if self._keys:
+                    logger.warning(f"Could not refresh Google public keys, keeping cached set: {e}")
+                    return
+                raise auth.CertificateFetchError(f"Could not fetch Google public keys: {e}", e)
+            self._keys = {
+                kid: load_pem_x509_certificate(pem.encode()).public_key()
+                for kid, pem in certs.items()
+            }
+            self._fetched_at = time.time()
+            self._expires_at = self._fetched_at + max_age
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens for one project without a network call per request."""
+
+    def __init__(self, project_id, key_cache=None, revocation_check_interval=300,
+                 claims_cache_size=10000, clock_skew=0, lookup_user=None):
+        self.project_id = project_id
+        self.key_cache = key_cache or PublicKeyCache()
+        self.revocation_check_interval = revocation_check_interval
+        self.clock_skew = clock_skew
+        self.lookup_user = lookup_user or auth.get_user
+        self._claims = LRUCache(max_entries=claims_cache_size)
+        # uid -> (tokens_valid_after in seconds, disabled, checked_at); bounded,
+        # and kept one interval past its recheck for use while Firebase is down
+        self._user_state = LRUCache(max_entries=claims_cache_size)
+
+    def verify(self, token, check_revoked=False):
+        if not isinstance(token, str) or not token:
+            raise auth.InvalidIdTokenError("ID token must be a non-empty string.")
+
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        found, claims = self._claims.get(token_hash)
+        if not found:
+            claims = self._decode(token)
+            ttl = claims["exp"] - time.time()
+            if ttl > 0:
+                self._claims.set(token_hash, claims, ttl)
+
+        if check_revoked:
+            self._check_revoked(claims)
+        return dict(claims)
+
+    def _decode(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise auth.InvalidIdTokenError(f"Malformed ID token: {e}", e)
+        if header.get("alg") != "RS256":
+            raise auth.InvalidIdTokenError("ID token has incorrect algorithm; expected RS256.")
+        kid = header.get("kid")
+        key = self.key_cache.get(kid) if kid else None
+        if key is None:
+            raise auth.InvalidIdTokenError("ID token has no kid or was signed by an unknown key.")
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=ISSUER_PREFIX + self.project_id,
+                leeway=self.clock_skew,
+                options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError("Token expired", e)
+        except jwt.PyJWTError as e:
+            raise auth.InvalidIdTokenError(f"Invalid ID token: {e}", e)
+
+        subject = claims["sub"]
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError("ID token has an invalid subject.")
+        claims["uid"] = subject
+        return claims
+
+    def _check_revoked(self, claims):
+        uid = claims["uid"]
+        valid_after, disabled = self._user_state_for(uid)
+        if disabled:
+            raise auth.UserDisabledError("The user record is disabled.")
+        if claims["iat"] < valid_after:
+            raise auth.RevokedIdTokenError("The Firebase ID token has been revoked.")
+
+    def _user_state_for(self, uid):
+        now = time.time()
+        _, state = self._user_state.get(uid)
+        if state and now - state[2] < self.revocation_check_interval:
+            return state[0], state[1]
+        try:
+            user = self.lookup_user(uid)
+        except auth.UserNotFoundError:
+            raise auth.RevokedIdTokenError("The user for this ID token no longer exists.")
+        except Exception as e:
+            if state:
+                # Firebase unreachable; a slightly stale answer beats failing every request
+                logger.warning(f"Revocation check for {uid} failed, using cached state: {e}")
+                return state[0], state[1]
+            raise
+        valid_after = (user.tokens_valid_after_timestamp or 0) / 1000
+        self._user_state.set(
+            uid, (valid_after, bool(user.disabled), now), 2 * self.revocation_check_interval
+        )
+        return valid_after, bool(user.disabled)
+
+    def forget_user(self, uid):
+        """Drop cached revocation state so the next request rechecks it (e.g. after revoking)."""
+        self._user_state.delete(uid)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def _project_id():
+    if Config.FIREBASE_PROJECT_ID:
+        return Config.FIREBASE_PROJECT_ID
+    import firebase_admin
+    return firebase_admin.get_app().project_id
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TokenVerifier(
+                    _project_id(),
+                    revocation_check_interval=Config.AUTH_REVOCATION_CHECK_INTERVAL,
+                    claims_cache_size=Config.AUTH_TOKEN_CACHE_SIZE,
+                )
+    return _verifier
+
+
+def set_verifier(verifier):
+    """Replace the verifier (e.g. in tests). Returns the previous one."""
+    global _verifier
+    with _verifier_lock:
+        previous, _verifier = _verifier, verifier
+    return previous
+
+
+def verify_id_token(token, check_revoked=False):
+    """Drop-in for firebase_admin.auth.verify_id_token backed by the local verifier."""
+    if os.getenv("FIREBASE_AUTH_EMULATOR_HOST"):
+        # Emulator tokens are unsigned; let firebase_admin handle them
+        return auth.verify_id_token(token, check_revoked=check_revoked)
+    return get_verifier().verify(token, check_revoked=check_revoked)